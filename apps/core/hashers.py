@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         BCryptSHA256PasswordHasher)
+
+
+class TunableBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    """
+    bcrypt_sha256 hasher whose work factor comes from ``BCRYPT_ROUNDS``.
+
+    The algorithm name is unchanged, so existing hashes keep verifying;
+    ``must_update`` reports hashes with a different work factor and Django
+    re-hashes them on the next successful ``check_password``.
+    """
+
+    @property
+    def rounds(self):
+        return getattr(settings, 'BCRYPT_ROUNDS', BCryptSHA256PasswordHasher.rounds)
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2 hasher whose cost parameters come from ``ARGON2_TIME_COST``,
+    ``ARGON2_MEMORY_COST`` and ``ARGON2_PARALLELISM``.
+    """
+
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
+
@@ -1,14 +1,57 @@
-from .date_utils import time_date_or_live
-from .format_response import format_response, generate_csv_response
-from .mailsender import send_custom_email
-from .math import calculate_percentage
-from .pagination import CustomPagination, custom_array_pagination
-from .permissions import check_branch_permission, check_permission, check_camera_permission
-from .security import match_secret_key
-from .sorting import name_list_dict_sorting
-from .token_gen import generate_random_token
-from .user_details import user_branches_company
-from .generate_token import generate_unique_token
-
-__all__ = ["calculate_percentage", "format_response",
-           "user_branches_company", "send_custom_email", "generate_random_token", "CustomPagination", "match_secret_key", "name_list_dict_sorting", "check_permission", "generate_csv_response", "custom_array_pagination", "check_branch_permission", "time_date_or_live", "check_camera_permission", "generate_unique_token"]
+import importlib
+
+# Utilities are imported on first access (PEP 562) so importing one helper
+# does not pull in every other helper's dependencies at startup.
+_EXPORTS = {
+    "time_date_or_live": ".date_utils",
+    "format_response": ".format_response",
+    "generate_csv_response": ".format_response",
+    "send_custom_email": ".mailsender",
+    "calculate_percentage": ".math",
+    "CustomPagination": ".pagination",
+    "custom_array_pagination": ".pagination",
+    "KeysetPagination": ".pagination",
+    "EstimatedCountPaginator": ".pagination",
+    "check_branch_permission": ".permissions",
+    "check_permission": ".permissions",
+    "check_camera_permission": ".permissions",
+    "has_feature_permission": ".permissions",
+    "match_secret_key": ".security",
+    "name_list_dict_sorting": ".sorting",
+    "generate_random_token": ".token_gen",
+    "user_branches_company": ".user_details",
+    "resolved_user_id": ".user_details",
+    "generate_unique_token": ".generate_token",
+    "AUTH_THROTTLE_CLASSES": ".throttling",
+    "IPTokenBucketThrottle": ".throttling",
+    "EmailTokenBucketThrottle": ".throttling",
+    "UserTokenBucketThrottle": ".throttling",
+    "import_users": ".user_import",
+    "parse_user_rows": ".user_import",
+    "apply_user_branch_features": ".permission_diff",
+    "bulk_update_permissions": ".permission_diff",
+    "get_cached_permissions": ".permission_cache",
+    "set_cached_permissions": ".permission_cache",
+    "aget_cached_permissions": ".permission_cache",
+    "aset_cached_permissions": ".permission_cache",
+    "invalidate_permission_cache": ".permission_cache",
+    "rebuild_effective_permissions": ".effective_permissions",
+    "sync_effective_permissions": ".effective_permissions",
+    "copy_rows": ".bulk_copy",
+    "SyntheticTenantGenerator": ".synthetic_data",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
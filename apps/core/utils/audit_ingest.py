@@ -0,0 +1,120 @@
+"""
+Buffered ingestion of ``RequestAuditLog`` rows.
+
+``RequestAuditMiddleware`` hands each audited request to the process-wide
+``AuditBuffer`` as a plain tuple. The request that fills the buffer to
+``AUDIT_BUFFER_SIZE`` writes the whole batch: ``COPY FROM STDIN`` on
+PostgreSQL, ``bulk_create`` elsewhere. So does any request, audited or
+not, that finds the oldest buffered row older than ``AUDIT_FLUSH_INTERVAL``
+seconds. Whatever is left is written when the process exits; rows of a
+killed process are lost. The ``audit_queue_depth`` gauge shows how many
+rows are waiting.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from apps.core.utils.audit_rollups import add_rollups, rollup_counts
+from apps.core.utils.bulk_copy import copy_rows
+
+logger = logging.getLogger(__name__)
+
+# Tuple order of buffered rows
+AUDIT_COLUMNS = ['user_id', 'ip_address', 'user_agent', 'path', 'method',
+                 'status_code', 'timestamp', 'sample_rate']
+
+
+def insert_audit_rows(rows, batch_size=5000):
+    """
+    Write audit rows given in ``AUDIT_COLUMNS`` order and add them to the
+    hourly rollups, in one transaction.
+
+    On PostgreSQL the rows are streamed with ``COPY``. Other databases get
+    ``bulk_create``, which sets ``timestamp`` to the time of the write
+    (``auto_now_add``) instead of the buffered value.
+
+    Returns:
+        int: Number of rows written.
+    """
+    from apps.users.models import RequestAuditLog
+
+    # Savepoint: a failed write the buffer swallows must not doom a
+    # transaction the caller is in
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            written = copy_rows(RequestAuditLog, AUDIT_COLUMNS, rows, batch_size)
+        else:
+            objs = [RequestAuditLog(**dict(zip(AUDIT_COLUMNS, row))) for row in rows]
+            written = len(RequestAuditLog.objects.bulk_create(objs, batch_size=batch_size))
+        add_rollups(rollup_counts((row[3], row[5], row[6], row[7]) for row in rows))
+    return written
+
+
+class AuditBuffer:
+    def __init__(self):
+        # Imported here so importing this module does not load the metrics
+        from apps.core.utils.metrics import AUDIT_QUEUE_DEPTH
+
+        self.rows = []
+        # When the oldest buffered row arrived
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.depth = AUDIT_QUEUE_DEPTH
+
+    def add(self, row=None):
+        rows = self.push(row)
+        if rows:
+            self.write(rows)
+
+    def push(self, row=None):
+        """
+        Buffer ``row``, if given; requests that are not audited pass none to
+        flush rows that waited too long. Returns the batch the caller must
+        ``write()`` when the buffer is full or old enough, else None; async
+        callers write it off the event loop.
+        """
+        with self.lock:
+            if row is not None:
+                if not self.rows:
+                    self.started = time.monotonic()
+                self.rows.append(row)
+            if not self.rows or (len(self.rows) < settings.AUDIT_BUFFER_SIZE and
+                                 time.monotonic() - self.started < settings.AUDIT_FLUSH_INTERVAL):
+                if row is not None:
+                    self.depth.set(len(self.rows))
+                return None
+            rows, self.rows = self.rows, []
+            self.depth.set(0)
+        return rows
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+            self.depth.set(0)
+        if rows:
+            self.write(rows)
+
+    def write(self, rows):
+        try:
+            insert_audit_rows(rows)
+        except DatabaseError as e:
+            logger.error("Failed to save %d audit logs: %s", len(rows), e)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_audit_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AuditBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
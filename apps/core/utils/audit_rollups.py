@@ -0,0 +1,128 @@
+"""
+Hourly rollups of the request audit log.
+
+Every batch written by ``insert_audit_rows`` is also counted into
+``RequestAuditRollup``: one row per hour and normalized path, holding the
+request, 4xx and 5xx counts. The counts are added with one
+``INSERT ... ON CONFLICT DO UPDATE`` per batch, so concurrent writers never
+lose increments.
+
+Each audited request counts ``1 / sample_rate`` times, so requests sampled
+by ``AUDIT_RULES`` are estimated rather than under-counted, and error rates
+weigh sampled reads and fully audited writes alike. Fractional weights are
+rounded up or down at random in proportion, which keeps the counts unbiased.
+"""
+
+import math
+import random
+import re
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+
+# Numeric ids and long opaque tokens (uidb64, reset tokens, hashes)
+ID_SEGMENT = re.compile(r'/(?:\d+|[A-Za-z0-9_-]*\d[A-Za-z0-9_-]*(?<=[A-Za-z0-9_-]{16}))(?=/|$)')
+
+
+def normalize_path(path):
+    """
+    ``/api/v1/branch/42/`` -> ``/api/v1/branch/<id>/``, so the rollups
+    have one row per endpoint instead of one per object.
+    """
+    return ID_SEGMENT.sub('/<id>', path)
+
+
+def _round_unbiased(value):
+    whole = math.floor(value)
+    return whole + (random.random() < value - whole)
+
+
+def rollup_counts(rows):
+    """
+    Args:
+        rows (Iterable[tuple]): ``(path, status_code, timestamp,
+            sample_rate)`` tuples.
+
+    Returns:
+        Counter: ``(hour, path, kind) -> count``, kind being ``requests``,
+        ``client_errors`` or ``server_errors``; each row weighs
+        ``1 / sample_rate``.
+    """
+    weights = defaultdict(float)
+    for path, status_code, timestamp, sample_rate in rows:
+        key = (timestamp.replace(minute=0, second=0, microsecond=0), normalize_path(path))
+        weight = 1 / sample_rate if sample_rate else 1
+        weights[key + ('requests',)] += weight
+        if status_code and status_code >= 500:
+            weights[key + ('server_errors',)] += weight
+        elif status_code and status_code >= 400:
+            weights[key + ('client_errors',)] += weight
+    # Rounded once per key and batch; round(..., 6) first drops float noise
+    # (1 / 0.1 is not exactly 10) so whole weights stay exact
+    return Counter({key: _round_unbiased(round(weight, 6)) for key, weight in weights.items()})
+
+
+def add_rollups(counts):
+    """
+    Add ``rollup_counts()`` output to the stored rollups.
+    """
+    from apps.users.models import RequestAuditRollup
+
+    rollups = {}
+    for (hour, path, kind), count in counts.items():
+        rollups.setdefault((hour, path), Counter())[kind] += count
+    if not rollups:
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(RequestAuditRollup._meta.db_table)
+    hour_field = RequestAuditRollup._meta.get_field('hour')
+    kinds = ['requests', 'client_errors', 'server_errors']
+    columns = ['hour', 'path'] + kinds
+    updates = ', '.join(f"{quote(kind)} = {table}.{quote(kind)} + EXCLUDED.{quote(kind)}"
+                        for kind in kinds)
+    items = list(rollups.items())
+    # Five parameters per row; stay under SQLite's bound parameter limit
+    batch_size = (connection.features.max_query_params or 5000) // 5
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(map(quote, columns))}) VALUES "
+                + ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+                + f" ON CONFLICT ({quote('hour')}, {quote('path')}) DO UPDATE SET {updates}",
+                [value for (hour, path), kind_counts in batch
+                 for value in (hour_field.get_db_prep_save(hour, connection), path,
+                               *(kind_counts[kind] for kind in kinds))])
+
+
+@transaction.atomic
+def rebuild_rollups(since=None, until=None, chunk_size=10000):
+    """
+    Recount the rollups of whole hours in ``[since, until)`` from the raw
+    audit log, e.g. for rows written before rollups existed.
+
+    Returns:
+        int: Number of audit rows counted.
+    """
+    from apps.users.models import RequestAuditLog, RequestAuditRollup
+
+    logs = RequestAuditLog.objects.all()
+    rollups = RequestAuditRollup.objects.all()
+    if since:
+        since = since.replace(minute=0, second=0, microsecond=0)
+        logs, rollups = logs.filter(timestamp__gte=since), rollups.filter(hour__gte=since)
+    if until:
+        until = until.replace(minute=0, second=0, microsecond=0)
+        logs, rollups = logs.filter(timestamp__lt=until), rollups.filter(hour__lt=until)
+    rollups.delete()
+
+    counted = 0
+    rows = logs.values_list('path', 'status_code', 'timestamp',
+                            'sample_rate').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = [row for _, row in zip(range(chunk_size), rows)]
+        if not chunk:
+            return counted
+        add_rollups(rollup_counts(chunk))
+        counted += len(chunk)
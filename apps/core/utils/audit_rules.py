@@ -0,0 +1,107 @@
+"""
+Which requests ``RequestAuditMiddleware`` writes to the audit log.
+
+``AUDIT_RULES`` is an ordered list; the first rule matching a request
+decides the share of such requests that is audited. A rule matches on any
+combination of:
+
+    path     regular expression searched in ``request.path``
+    methods  HTTP methods
+    routes   URL names (or route patterns of unnamed routes)
+
+and sets ``sample``, from 0 (never audit) to 1 (always audit). Requests no
+rule matches use ``AUDIT_DEFAULT_SAMPLE``. For example::
+
+    AUDIT_RULES = [
+        {"methods": ["POST", "PUT", "PATCH", "DELETE"], "sample": 1},
+        {"path": r"^/(static|media)/", "sample": 0},
+        {"routes": ["token_validate_with_user_details"], "sample": 0.01},
+        {"methods": ["GET"], "sample": 0.1},
+    ]
+"""
+
+import random
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+RULE_KEYS = {'path', 'methods', 'routes', 'sample'}
+HTTP_METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE', 'TRACE')
+
+
+class AuditRule:
+    __slots__ = ('path', 'routes', 'sample')
+
+    def __init__(self, path, routes, sample):
+        self.path = path
+        self.routes = routes
+        self.sample = sample
+
+    def matches(self, path, route):
+        return (self.routes is None or route in self.routes) and \
+            (self.path is None or self.path.search(path) is not None)
+
+
+class AuditPolicy:
+    """
+    ``AUDIT_RULES`` compiled once: patterns are compiled and the rules are
+    split per HTTP method, so a request only walks the rules that can match
+    its method.
+    """
+
+    def __init__(self, rules, default_sample=1.0):
+        self.default_sample = self.check_sample(default_sample)
+        self.by_method = {method: [] for method in HTTP_METHODS}
+        self.other_methods = []
+        for index, rule in enumerate(rules):
+            unknown = set(rule) - RULE_KEYS
+            if unknown or 'sample' not in rule:
+                raise ImproperlyConfigured(
+                    f"AUDIT_RULES[{index}] needs 'sample' and only "
+                    f"{sorted(RULE_KEYS)}, got {sorted(rule)}")
+            try:
+                path = re.compile(rule['path']) if rule.get('path') else None
+            except re.error as e:
+                raise ImproperlyConfigured(f"AUDIT_RULES[{index}] path: {e}")
+            routes = frozenset(rule['routes']) if rule.get('routes') else None
+            compiled = AuditRule(path, routes, self.check_sample(rule['sample']))
+
+            methods = rule.get('methods')
+            if methods:
+                for method in methods:
+                    # Methods first named here still see earlier method-less rules
+                    self.by_method.setdefault(
+                        method.upper(), list(self.other_methods)).append(compiled)
+            else:
+                for method_rules in self.by_method.values():
+                    method_rules.append(compiled)
+                self.other_methods.append(compiled)
+
+    @staticmethod
+    def check_sample(sample):
+        sample = float(sample)
+        if not 0 <= sample <= 1:
+            raise ImproperlyConfigured(f"Audit sample rates must be within 0..1, got {sample}")
+        return sample
+
+    @classmethod
+    def from_settings(cls):
+        return cls(getattr(settings, 'AUDIT_RULES', []),
+                   getattr(settings, 'AUDIT_DEFAULT_SAMPLE', 1.0))
+
+    def sample_rate(self, method, path, route):
+        for rule in self.by_method.get(method, self.other_methods):
+            if rule.matches(path, route):
+                return rule.sample
+        return self.default_sample
+
+    def audited_sample(self, method, path, route):
+        """
+        Sample rate of the request when it is audited, else None. Each
+        audited request stands for ``1 / sample`` requests in the rollups.
+        """
+        sample = self.sample_rate(method, path, route)
+        if sample >= 1 or (sample > 0 and random.random() < sample):
+            return sample
+        return None
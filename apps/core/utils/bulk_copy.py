@@ -0,0 +1,58 @@
+from itertools import islice
+
+from django.db import connection
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def copy_rows(model, columns, rows, batch_size=5000):
+    """
+    Write ``rows`` into ``model``'s table as fast as the database allows:
+    ``COPY ... FROM STDIN`` on PostgreSQL (psycopg 3), batched multi row
+    ``INSERT`` elsewhere. No model ``save()``, signals or ``auto_now``
+    handling; values are written exactly as given.
+
+    Args:
+        model (Model): Target model.
+        columns (list[str]): Column attnames, e.g. ``['user_id', 'path']``.
+        rows (Iterable[tuple]): Values in ``columns`` order; may be a
+            generator so millions of rows never sit in memory.
+        batch_size (int): Rows per INSERT, or per COPY flush.
+
+    Returns:
+        int: Number of rows written.
+    """
+    fields = [model._meta.get_field(column) for column in columns]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column_sql = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+
+    def prepared(row):
+        return [field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, row)]
+
+    written = 0
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if connection.vendor == 'postgresql' and hasattr(raw, 'copy'):
+            with raw.copy(f"COPY {table} ({column_sql}) FROM STDIN") as copy:
+                for batch in _batches(rows, batch_size):
+                    for row in batch:
+                        copy.write_row(prepared(row))
+                    written += len(batch)
+            return written
+
+        placeholders = f"({', '.join(['%s'] * len(fields))})"
+        # Stay under the backend's bound parameter limit
+        max_params = connection.features.max_query_params or 999 * 32
+        batch_size = max(1, min(batch_size, max_params // len(fields)))
+        for batch in _batches(rows, batch_size):
+            cursor.execute(
+                f"INSERT INTO {table} ({column_sql}) VALUES "
+                + ', '.join([placeholders] * len(batch)),
+                [value for row in batch for value in prepared(row)])
+            written += len(batch)
+    return written
@@ -0,0 +1,82 @@
+"""
+Content addressed media storage.
+
+Every saved file is stored once, under the SHA-256 of its content:
+``blobs/3f/a2/3fa2...e1.png``. An upload is hashed while it is written to a
+temporary file, which is then renamed to its blob name, or dropped when
+that blob exists already. Saving the same logo or signature again costs no
+disk space and returns the same name; the ``upload_to`` directory of the
+field is not used.
+
+A blob is shared by every row naming it. ``apps.core.utils.media_gc``
+counts those references in the models and deletes a blob only once none
+is left, and not while the blob was saved again recently. A blob name
+never changes what it points to, so it can be cached forever (see
+``media_view``).
+"""
+
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+BLOBS_DIR = 'blobs'
+
+
+def blob_name(digest, name):
+    extension = posixpath.splitext(name)[1].lower()
+    # Keep the extension for the content type, unless it is no plain one
+    if not (1 < len(extension) <= 10 and extension[1:].isalnum()):
+        extension = ''
+    return f'{BLOBS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_immutable(name):
+    """
+    Whether the content behind ``name`` can never change.
+    """
+    from apps.core.utils.image_variants import VARIANTS_DIR
+
+    return name.startswith((f'{BLOBS_DIR}/', f'{VARIANTS_DIR}/'))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Replaced by the blob name on save; equal content may share it
+        return name
+
+    def makedirs(self, directory):
+        os.makedirs(directory, self.directory_permissions_mode or 0o777, exist_ok=True)
+
+    def _save(self, name, content):
+        directory = self.path(BLOBS_DIR)
+        self.makedirs(directory)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            name = blob_name(digest.hexdigest(), name)
+            path = self.path(name)
+            try:
+                # Marks the blob as in use again: media_gc leaves recently
+                # modified files alone, in case it queued this one already
+                os.utime(path)
+            except FileNotFoundError:
+                self.makedirs(os.path.dirname(path))
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                # Atomic: a concurrent upload of the same content writes the
+                # same bytes to the same name
+                os.replace(temp_path, path)
+            else:
+                os.remove(temp_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
@@ -1,6 +1,5 @@
-from datetime import datetime, time
+from datetime import datetime, time, timezone
 
-import pytz
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import is_aware, make_aware
 
@@ -17,7 +16,7 @@ def time_date_or_live(request):
             end_time = make_aware(end_time)
 
     else:
-        timezone_obj = pytz.timezone('UTC')
+        timezone_obj = timezone.utc
         current_time = datetime.now(timezone_obj)
         start_time = datetime.combine(
             current_time.date(), time.min, tzinfo=timezone_obj)
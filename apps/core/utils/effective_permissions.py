@@ -0,0 +1,181 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from apps.users.models import (AppFeature, Branch, Company, EffectivePermission,
+                               MyUser, UserBranchFeatures)
+
+logger = logging.getLogger(__name__)
+
+
+def _scope(queryset, user_field, branch_field, user_ids, branch_ids):
+    if user_ids is not None:
+        queryset = queryset.filter(**{f'{user_field}__in': user_ids})
+    if branch_ids is not None:
+        queryset = queryset.filter(**{f'{branch_field}__in': branch_ids})
+    return queryset
+
+
+def compute_effective_permissions(user_ids=None, branch_ids=None):
+    """
+    Work out the ``(user_id, branch_id, feature_id)`` triples users are
+    allowed, limited to ``user_ids`` and ``branch_ids`` when given.
+
+    A user gets a feature in a branch they are assigned to (or own, for
+    company owners) when it is granted in ``UserBranchFeatures`` and the
+    branch offers it: the feature is free, part of the branch's
+    subscription, or a ``camera_`` feature of a branch whose subscription
+    requires a camera. Owners also get every feature of their branches.
+    """
+    pairs = set(_scope(
+        MyUser.assigned_branches.through.objects.all(),
+        'myuser_id', 'branch_id', user_ids, branch_ids,
+    ).values_list('myuser_id', 'branch_id'))
+
+    owners = MyUser.objects.filter(is_owner=True, company__isnull=False)
+    if user_ids is not None:
+        owners = owners.filter(id__in=user_ids)
+    if branch_ids is not None:
+        owners = owners.filter(company__branches__id__in=branch_ids)
+    owner_company = dict(owners.values_list('id', 'company_id').distinct())
+
+    owner_pairs = set()
+    if owner_company:
+        company_branches = Branch.objects.filter(
+            company_id__in=set(owner_company.values()))
+        if branch_ids is not None:
+            company_branches = company_branches.filter(id__in=branch_ids)
+        branches_by_company = defaultdict(set)
+        for branch_id, company_id in company_branches.values_list('id', 'company_id'):
+            branches_by_company[company_id].add(branch_id)
+        owner_pairs = {(user_id, branch_id)
+                       for user_id, company_id in owner_company.items()
+                       for branch_id in branches_by_company[company_id]}
+        pairs |= owner_pairs
+
+    if not pairs:
+        return set()
+
+    branch_features = defaultdict(set)
+    for branch_id, feature_id in Branch.features.through.objects.filter(
+            branch_id__in={branch_id for _, branch_id in pairs}
+    ).values_list('branch_id', 'appfeature_id'):
+        branch_features[branch_id].add(feature_id)
+
+    granted = defaultdict(set)
+    for user_id, branch_id, feature_id in _scope(
+            UserBranchFeatures.features.through.objects.all(),
+            'userbranchfeatures__user_id', 'userbranchfeatures__branch_id',
+            user_ids, branch_ids,
+    ).values_list('userbranchfeatures__user_id',
+                  'userbranchfeatures__branch_id', 'appfeature_id'):
+        granted[(user_id, branch_id)].add(feature_id)
+
+    free = set()
+    camera = set()
+    needs_camera = set()
+    for feature_id, feature_type, tag, required in AppFeature.objects.values_list(
+            'id', 'feature_type', 'tag', 'required'):
+        if feature_type == 'free':
+            free.add(feature_id)
+        if tag.startswith('camera_'):
+            camera.add(feature_id)
+        if required == 'camera':
+            needs_camera.add(feature_id)
+
+    triples = set()
+    for user_id, branch_id in pairs:
+        offered = branch_features[branch_id]
+        allowed = free | offered | (camera if offered & needs_camera else set())
+        features = granted[(user_id, branch_id)] & allowed
+        if (user_id, branch_id) in owner_pairs:
+            features |= offered
+        triples.update((user_id, branch_id, feature_id) for feature_id in features)
+    return triples
+
+
+def sync_effective_permissions(user_ids=None, branch_ids=None, batch_size=1000):
+    """
+    Recompute the ``effective_permission`` rows in scope and write only the
+    difference. With no scope the whole table is recomputed.
+
+    Returns:
+        tuple[int, int]: Rows inserted and rows deleted.
+    """
+    desired = compute_effective_permissions(user_ids, branch_ids)
+
+    with transaction.atomic():
+        current = {}
+        for row_id, user_id, branch_id, feature_id in _scope(
+                EffectivePermission.objects.all(), 'user_id', 'branch_id',
+                user_ids, branch_ids,
+        ).values_list('id', 'user_id', 'branch_id', 'feature_id'):
+            current[(user_id, branch_id, feature_id)] = row_id
+
+        stale = [row_id for triple, row_id in current.items() if triple not in desired]
+        for start in range(0, len(stale), batch_size):
+            EffectivePermission.objects.filter(
+                id__in=stale[start:start + batch_size]).delete()
+
+        missing = desired - set(current)
+        EffectivePermission.objects.bulk_create([
+            EffectivePermission(user_id=user_id, branch_id=branch_id,
+                                feature_id=feature_id)
+            for user_id, branch_id, feature_id in missing
+        ], batch_size=batch_size, ignore_conflicts=True)
+
+    return len(missing), len(stale)
+
+
+def rebuild_effective_permissions(company_ids=None, batch_size=1000):
+    """
+    Rebuild the table one company at a time so memory stays bounded by the
+    largest company rather than the whole table.
+
+    Returns:
+        tuple[int, int]: Rows inserted and rows deleted.
+    """
+    companies = Company.objects.order_by('id')
+    if company_ids is not None:
+        companies = companies.filter(id__in=company_ids)
+
+    inserted = deleted = 0
+    for company_id in list(companies.values_list('id', flat=True)):
+        branch_ids = list(Branch.objects.filter(
+            company_id=company_id).values_list('id', flat=True))
+        if not branch_ids:
+            continue
+        added, removed = sync_effective_permissions(
+            branch_ids=branch_ids, batch_size=batch_size)
+        inserted += added
+        deleted += removed
+    return inserted, deleted
+
+
+def schedule_effective_permission_sync(user_ids=None, branch_ids=None):
+    """
+    Sync the scope once the current transaction commits, so cascading
+    deletes and multi step writes are seen in their final state.
+    """
+    user_ids = None if user_ids is None else list(user_ids)
+    branch_ids = None if branch_ids is None else list(branch_ids)
+    transaction.on_commit(lambda: sync_effective_permissions(
+        user_ids=user_ids, branch_ids=branch_ids))
+
+
+def schedule_effective_permission_rebuild(using=None):
+    """
+    Queue ``rebuild_effective_permissions`` for every company after commit;
+    it takes too long to run in the request that triggered it.
+    """
+    from apps.users.tasks import rebuild_all_effective_permissions
+
+    def dispatch():
+        try:
+            rebuild_all_effective_permissions.delay()
+        except Exception as e:
+            # Left for manage.py rebuild_effective_permissions
+            logger.error("Could not queue the effective permission rebuild: %s", e)
+
+    transaction.on_commit(dispatch, using=using)
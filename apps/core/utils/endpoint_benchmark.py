@@ -0,0 +1,479 @@
+import json
+import math
+import time
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps.core.utils.synthetic_data import SyntheticTenantGenerator
+from apps.users.models import (AppFeature, CompanyOTP, MyUser, Subscription,
+                               SubscriptionHistory, UserBranchLayout)
+
+BUDGET_FILE = Path(__file__).resolve().parents[2] / 'users' / 'benchmark_budgets.json'
+API_PREFIX = '/api/v1/'
+
+BENCHMARK_SEED = 2024
+BENCHMARK_PASSWORD = 'Benchmark#12345'
+NEW_PASSWORD = 'Benchmark#67890'
+BENCHMARK_OTP = '123456'
+
+# Metrics compared against the budget file. Queries and rows are
+# deterministic for the seeded dataset; latency and memory depend on the
+# machine, so their budgets carry headroom.
+EXACT_METRICS = ('queries', 'rows')
+MACHINE_METRICS = ('p50_ms', 'p99_ms', 'memory_kb')
+
+# Transaction control the harness itself causes by rolling back every
+# request (SQLite issues BEGIN as a statement, savepoints come from nesting).
+# Left out so counts match between the command and the test suite.
+TRANSACTION_PREFIXES = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class Scenario:
+    """
+    One request against one route of ``apps/users/api/v1/urls.py``.
+
+    ``path`` and ``data`` may reference the fixture context: ``path`` as
+    ``str.format`` fields, ``data`` as a callable taking the context.
+    """
+
+    def __init__(self, method, route, path=None, user=None, data=None,
+                 format='json', status=200, label=None, cookies=False):
+        self.method = method
+        self.route = route
+        self.path = path or route
+        self.user = user
+        self.data = data
+        self.format = format
+        self.status = status
+        self.label = label
+        self.cookies = cookies
+
+    @property
+    def name(self):
+        name = f"{self.method} {self.route}"
+        return f"{name} [{self.label}]" if self.label else name
+
+
+def _features_branch(ctx):
+    return [{'branch_id': ctx['branch'], 'features': ctx['features']}]
+
+
+SCENARIOS = [
+    # Authentication
+    Scenario('POST', 'token/', data=lambda c: {
+        'email': c['member_email'], 'password': BENCHMARK_PASSWORD}),
+    Scenario('POST', 'registration/', status=201, data=lambda c: {
+        'name': 'Registered', 'email': 'registered@benchmark.example.com',
+        'password': BENCHMARK_PASSWORD, 'confirm_password': BENCHMARK_PASSWORD}),
+    Scenario('POST', 'logout/', cookies=True),
+    Scenario('GET', 'token/validate/', user='member'),
+    Scenario('GET', 'token/validate/', user='owner', label='owner'),
+    Scenario('POST', 'payment/validate/', user='owner', data=lambda c: {
+        'token': c['otp_token'], 'subscription_id': c['history']}),
+    Scenario('POST', 'forget-password/', data=lambda c: {'email': c['member_email']}),
+    Scenario('POST', 'forget-password/<uidb64>/<token>/',
+             path='forget-password/{uidb64}/{reset_token}/', data=lambda c: {
+                 'password': NEW_PASSWORD, 'confirm_password': NEW_PASSWORD}),
+    Scenario('POST', 'reset-password/', user='member', data=lambda c: {
+        'old_password': BENCHMARK_PASSWORD, 'new_password': NEW_PASSWORD,
+        'confirm_password': NEW_PASSWORD}),
+    Scenario('POST', 'otp-verify/', data=lambda c: {
+        'email': c['member_email'], 'otp': BENCHMARK_OTP}),
+    Scenario('POST', 'otp-resend/', data=lambda c: {'email': c['member_email']}),
+    Scenario('GET', 'get-cookie/', user='member', status=202, cookies=True),
+
+    # Companies
+    Scenario('GET', 'company/', user='owner', status=201),
+    Scenario('PATCH', 'company/', user='owner', format='multipart',
+             data=lambda c: {'address': 'Benchmark street 1'}),
+    Scenario('POST', 'companies/', user='newcomer', format='multipart', status=201,
+             data=lambda c: {
+                 'name': 'Benchmark Company', 'name_ar': 'Benchmark Company AR',
+                 'subdomain': 'benchmark-company', 'branch_location': 'Benchmark street 2',
+                 'subscription_id': c['newcomer_history']}),
+
+    # Users
+    Scenario('GET', 'users/', user='owner'),
+    Scenario('GET', 'users/', user='member', label='member'),
+    Scenario('POST', 'users/', user='owner', format='multipart', status=201,
+             data=lambda c: {
+                 'email': 'created@benchmark.example.com', 'name': 'Created',
+                 'password': BENCHMARK_PASSWORD, 'confirm_password': BENCHMARK_PASSWORD,
+                 'features_branch_input': json.dumps(_features_branch(c))}),
+    Scenario('POST', 'users/import/', user='owner', status=201, data=lambda c: {
+        'users': [{'email': f'imported-{i}@benchmark.example.com', 'name': f'Imported {i}',
+                   'password': BENCHMARK_PASSWORD, 'features_branch': _features_branch(c)}
+                  for i in range(5)]}),
+    Scenario('GET', 'users/<int:pk>/', path='users/{other}/', user='owner'),
+    Scenario('PATCH', 'users/<int:pk>/', path='users/{other}/', user='owner',
+             format='multipart', data=lambda c: {
+                 'name': 'Renamed', 'features_branch_input': json.dumps(_features_branch(c))}),
+    Scenario('DELETE', 'users/<int:pk>/', path='users/{other}/', user='owner', status=204),
+
+    # Branches
+    Scenario('GET', 'branch/', user='owner'),
+    Scenario('POST', 'branch/', user='owner', status=201, data=lambda c: {
+        'name': 'Benchmark Branch', 'location': 'Benchmark street 3',
+        'subscription_id': c['history'],
+        'contact_info': [{'email': 'branch@benchmark.example.com',
+                          'phone_number': '+10000000001'}]}),
+    Scenario('GET', 'branch/<int:pk>/', path='branch/{branch}/', user='owner'),
+    Scenario('PATCH', 'branch/<int:pk>/', path='branch/{branch}/', user='owner',
+             data=lambda c: {'location': 'Benchmark street 4'}),
+    Scenario('DELETE', 'branch/<int:pk>/', path='branch/{branch}/', user='owner', status=204),
+
+    # Features and subscriptions
+    Scenario('GET', 'features/'),
+    Scenario('GET', 'subscription/', user='owner'),
+    Scenario('POST', 'subscription/', user='owner', status=201, data=lambda c: {
+        'package_name': 'Benchmark Package', 'package_price': 100,
+        'features': c['features']}),
+    Scenario('GET', 'subscription/<int:pk>/', path='subscription/{package}/', user='owner'),
+    Scenario('PATCH', 'subscription/<int:pk>/', path='subscription/{package}/', user='owner',
+             data=lambda c: {'package_price': 200}),
+    Scenario('DELETE', 'subscription/<int:pk>/', path='subscription/{package}/',
+             user='owner', status=204),
+    Scenario('GET', 'subscription-history/', user='owner'),
+    Scenario('POST', 'subscription-history/', user='owner', status=201, data=lambda c: {
+        'subscription': c['package'], 'package_duration': 12}),
+    Scenario('GET', 'subscription-history/<int:pk>/',
+             path='subscription-history/{history}/', user='owner'),
+    Scenario('PATCH', 'subscription-history/<int:pk>/',
+             path='subscription-history/{history}/', user='owner'),
+    Scenario('DELETE', 'subscription-history/<int:pk>/',
+             path='subscription-history/{history}/', user='owner'),
+
+    # Layouts and permissions
+    Scenario('GET', '<int:branch_id>/user-branch-layout/',
+             path='{branch}/user-branch-layout/', user='member'),
+    Scenario('POST', '<int:branch_id>/user-branch-layout/',
+             path='{branch}/user-branch-layout/', user='owner', status=201,
+             data=lambda c: {'position': {'widgets': []}}),
+    Scenario('PATCH', '<int:branch_id>/user-branch-layout/',
+             path='{branch}/user-branch-layout/', user='member',
+             data=lambda c: {'position': {'widgets': []}}),
+    Scenario('DELETE', '<int:branch_id>/user-branch-layout/',
+             path='{branch}/user-branch-layout/', user='member', status=204),
+    Scenario('GET', 'permission-list/', user='owner'),
+    Scenario('GET', 'permission-list/', user='member', label='member'),
+    Scenario('POST', 'permissions/bulk/', user='owner', data=lambda c: {
+        'users': [c['member'], c['other']], 'branches': [c['branch']],
+        'features': c['features'], 'action': 'grant'}),
+    Scenario('GET', 'user/permission-list/<int:user_id>/',
+             path='user/permission-list/{member}/?branches_id={branch}', user='owner'),
+
+    # Audit log
+    Scenario('GET', 'audit-logs/', user='staff'),
+    Scenario('GET', 'audit-logs/', path='audit-logs/?user={member}', user='staff',
+             label='by user'),
+    # Two full days inside the seeded week, so the number of hours is stable
+    Scenario('GET', 'audit-logs/hourly/',
+             path='audit-logs/hourly/?since={audit_since}&until={audit_until}', user='staff'),
+    Scenario('GET', 'audit-logs/error-rates/',
+             path='audit-logs/error-rates/?since={audit_since}&until={audit_until}', user='staff'),
+
+    # Async variants
+    Scenario('GET', 'async/token/validate/', user='member'),
+    Scenario('GET', 'async/features/'),
+    Scenario('GET', 'async/<int:branch_id>/user-branch-layout/',
+             path='async/{branch}/user-branch-layout/', user='member'),
+    Scenario('GET', 'async/permission-list/', user='member'),
+]
+
+
+def api_routes():
+    """
+    Route patterns of the v1 API, as written in ``urls.py``.
+    """
+    resolver = get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver) and str(pattern.pattern) == API_PREFIX.lstrip('/'):
+            return [str(route.pattern) for route in pattern.url_patterns]
+    return []
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    covered = {scenario.route for scenario in scenarios}
+    return [route for route in api_routes() if route not in covered]
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile; exact for the small samples used here.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class _CountingCursor:
+    """
+    Wraps a DB-API cursor and counts the rows handed back to Django.
+    """
+
+    def __init__(self, cursor, recorder):
+        self._cursor = cursor
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._recorder.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._recorder.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._recorder.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._recorder.rows += len(rows)
+        return rows
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` that counts queries and fetched rows,
+    leaving out the transaction control the harness causes.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        cursor = context['cursor']
+        if not isinstance(cursor.cursor, _CountingCursor):
+            cursor.cursor = _CountingCursor(cursor.cursor, self)
+        if not sql.lstrip().upper().startswith(TRANSACTION_PREFIXES):
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def build_fixture(seed=BENCHMARK_SEED):
+    """
+    Seed a few synthetic tenants plus the one-off rows some routes need
+    (a token to redeem, a user without a company, an OTP, a reset link)
+    and return the ids the scenarios refer to.
+    """
+    generator = SyntheticTenantGenerator(
+        companies=3, branches_per_company=5, users_per_company=25,
+        audit_logs=2000, audit_days=7,
+        password=BENCHMARK_PASSWORD, seed=seed, log=lambda message: None)
+    generator.run()
+    company_id = generator.company_ids[0]
+
+    owner = MyUser.objects.get(company_id=company_id, is_owner=True)
+    layout = UserBranchLayout.objects.filter(
+        user__company_id=company_id, user__is_owner=False).order_by('id').first()
+    member, branch_id = layout.user, layout.branch_id
+    other = MyUser.objects.filter(
+        company_id=company_id, is_owner=False, assigned_branches=branch_id,
+    ).exclude(id=member.id).order_by('id').first()
+    UserBranchLayout.objects.filter(user=owner, branch_id=branch_id).delete()
+
+    member.is_two_step = False
+    member.otp = BENCHMARK_OTP
+    member.otp_created_at = timezone.now()
+    member.save(update_fields=['is_two_step', 'otp', 'otp_created_at'])
+
+    package = Subscription.objects.create(package_name='Benchmark Spare', package_price=100)
+    features = list(AppFeature.objects.filter(
+        branches=branch_id).order_by('order').values_list('id', flat=True)[:3])
+    package.features.set(features)
+
+    newcomer = MyUser.objects.create(
+        email='newcomer@benchmark.example.com', name='Newcomer',
+        password=owner.password, is_verified=True, company_create=True)
+    newcomer_history = SubscriptionHistory.objects.create(
+        user=newcomer, subscription=package, package_duration=12, payment=100)
+    newcomer_history.features.set(features)
+    now = timezone.now()
+    staff = MyUser.objects.create(
+        email='staff@benchmark.example.com', name='Staff',
+        password=owner.password, is_verified=True, is_staff=True)
+
+    return {
+        'owner': owner.id,
+        'member': member.id,
+        'member_email': member.email,
+        'other': other.id,
+        'newcomer': newcomer.id,
+        'staff': staff.id,
+        'branch': branch_id,
+        'features': features,
+        'package': package.id,
+        'history': SubscriptionHistory.objects.filter(user=owner).values_list('id', flat=True)[0],
+        'newcomer_history': newcomer_history.id,
+        'otp_token': CompanyOTP.objects.create(token='benchmark-token').token,
+        'uidb64': urlsafe_base64_encode(force_bytes(member.pk)),
+        'reset_token': PasswordResetTokenGenerator().make_token(member),
+        'audit_since': (now - timedelta(days=3)).strftime('%Y-%m-%dT%H:00:00'),
+        'audit_until': (now - timedelta(days=1)).strftime('%Y-%m-%dT%H:00:00'),
+    }
+
+
+class EndpointBenchmark:
+    """
+    Run ``SCENARIOS`` through the DRF test client.
+
+    Every request runs in a transaction that is rolled back, so writes do
+    not leak into the next request, and the cache is cleared first, so
+    cached endpoints are measured on their miss path. Latency comes from
+    ``iterations`` timed runs; queries, rows and allocated memory from one
+    extra traced run, since tracemalloc slows everything down.
+    """
+
+    def __init__(self, scenarios=SCENARIOS, seed=BENCHMARK_SEED):
+        self.scenarios = scenarios
+        self.seed = seed
+        self.context = None
+
+    def setup(self):
+        self.context = build_fixture(self.seed)
+        users = MyUser.objects.in_bulk(
+            [self.context[role] for role in ('owner', 'member', 'newcomer', 'staff')])
+        self.tokens = {role: str(AccessToken.for_user(users[self.context[role]]))
+                       for role in ('owner', 'member', 'newcomer', 'staff')}
+        self.refresh_token = str(RefreshToken.for_user(users[self.context['member']]))
+
+    def client_for(self, scenario):
+        # A crashing view should show up as a 500 in the report, not abort the run
+        client = APIClient(raise_request_exception=False)
+        if scenario.user:
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens[scenario.user]}")
+        if scenario.cookies:
+            client.cookies['access_token'] = self.tokens['member']
+            client.cookies['refresh_token'] = self.refresh_token
+        return client
+
+    def request(self, client, scenario, path, data):
+        cache.clear()
+        with transaction.atomic():
+            start = time.perf_counter()
+            response = getattr(client, scenario.method.lower())(
+                path, data, **({'format': scenario.format} if data is not None else {}))
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return response, elapsed
+
+    def measure(self, scenario, iterations=20, warmup=2):
+        client = self.client_for(scenario)
+        path = API_PREFIX + scenario.path.format(**self.context)
+        data = scenario.data(self.context) if scenario.data else None
+
+        timings = []
+        for run in range(warmup + iterations):
+            _, elapsed = self.request(client, scenario, path, data)
+            if run >= warmup:
+                timings.append(elapsed * 1000)
+
+        recorder = QueryRecorder()
+        tracemalloc.start()
+        try:
+            with connection.execute_wrapper(recorder):
+                response, _ = self.request(client, scenario, path, data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': recorder.queries,
+            'rows': recorder.rows,
+            'memory_kb': round(peak / 1024),
+        }
+        if response.status_code != scenario.status:
+            result['error'] = (f"status {response.status_code}, expected "
+                               f"{scenario.status}: {response.content[:200]!r}")
+        return result
+
+    def run(self, iterations=20, warmup=2, only=None, log=None):
+        if self.context is None:
+            self.setup()
+        results = {}
+        with override_settings(
+                THROTTLE_RATES={},
+                # Every audited request writes its own row, and sampled
+                # rules audit always or never, so counts are stable
+                AUDIT_BUFFER_SIZE=1,
+                AUDIT_RULES=[{**rule, 'sample': round(rule['sample'])}
+                             for rule in settings.AUDIT_RULES],
+                AUDIT_DEFAULT_SAMPLE=round(settings.AUDIT_DEFAULT_SAMPLE),
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'endpoint-benchmark'}}):
+            for scenario in self.scenarios:
+                if only and not any(part in scenario.name for part in only):
+                    continue
+                results[scenario.name] = self.measure(scenario, iterations, warmup)
+                if log:
+                    log(scenario.name, results[scenario.name])
+        return results
+
+
+def load_budgets(path=BUDGET_FILE):
+    with open(path) as budget_file:
+        return json.load(budget_file)
+
+
+def make_budgets(results, latency_headroom=3.0, memory_headroom=1.5):
+    """
+    Budgets from a run: queries and rows as measured, latency and memory
+    with headroom for slower machines.
+    """
+    budgets = {}
+    for name, result in sorted(results.items()):
+        budgets[name] = {
+            'queries': result['queries'],
+            'rows': result['rows'],
+            'p50_ms': round(max(result['p50_ms'] * latency_headroom, 1), 1),
+            'p99_ms': round(max(result['p99_ms'] * latency_headroom, 1), 1),
+            'memory_kb': math.ceil(max(result['memory_kb'] * memory_headroom, 64)),
+        }
+    return budgets
+
+
+def compare_with_budgets(results, budgets, metrics=EXACT_METRICS + MACHINE_METRICS):
+    """
+    Returns:
+        list[str]: One line per endpoint and metric over budget, per
+        unexpected status and per endpoint without a budget.
+    """
+    violations = []
+    for name, result in results.items():
+        if 'error' in result:
+            violations.append(f"{name}: {result['error']}")
+        budget = budgets.get(name)
+        if budget is None:
+            violations.append(f"{name}: no budget")
+            continue
+        for metric in metrics:
+            if metric in budget and result[metric] > budget[metric]:
+                violations.append(
+                    f"{name}: {metric} {result[metric]} over budget {budget[metric]}")
+    return violations
@@ -0,0 +1,209 @@
+"""
+Resized WebP variants of uploaded images.
+
+``IMAGE_VARIANTS`` maps image fields to the longest side, in pixels, of the
+variant served in place of the upload. When a row is saved with a new or
+cleared image, the ``generate_image_variants`` task renders the variants
+after commit and records them in the row's ``image_variants`` field::
+
+    {"logo": {"source": "company_logo/2026/acme.png",
+              "name": "image_variants/company_logo/2026/acme.1f3c9a0b2d4e.webp",
+              "width": 256, "height": 120}}
+
+Serializers read that field through ``image_url``, so serving a variant
+costs no query. The original is served until the task has run, and when
+the variant would not be smaller (``name`` is then ``None``).
+
+Variant names carry a hash of their content, so a name never changes what
+it points to; on content addressed storage the variant is a blob like any
+upload, shared by rows with the same image. Replacing or deleting an image
+queues its variants for deletion through ``apps.core.utils.media_gc``,
+which keeps those other rows still reference.
+"""
+
+import hashlib
+import logging
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from apps.core.utils.media_gc import delete_files_on_commit
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'image_variants'
+
+
+def variant_sizes(model):
+    """
+    Returns:
+        dict: ``{field name: longest side}`` for the fields of ``model``.
+    """
+    prefix = f'{model._meta.label}.'
+    return {key[len(prefix):]: size for key, size in settings.IMAGE_VARIANTS.items()
+            if key.startswith(prefix)}
+
+
+def variant_models():
+    labels = {key.rsplit('.', 1)[0] for key in settings.IMAGE_VARIANTS}
+    return [apps.get_model(label) for label in sorted(labels)]
+
+
+def stale_fields(instance):
+    """
+    Fields whose recorded variant is not the one of the current file.
+    """
+    variants = instance.image_variants or {}
+    stale = []
+    for field in variant_sizes(type(instance)):
+        file = getattr(instance, field)
+        entry = variants.get(field)
+        if (entry['source'] if entry else None) != (file.name if file else None):
+            stale.append(field)
+    return stale
+
+
+def variant_names(instance):
+    return [entry['name'] for entry in (instance.image_variants or {}).values()
+            if entry.get('name')]
+
+
+def schedule_image_variants(instance, update_fields=None):
+    """
+    Queue ``generate_image_variants`` for ``instance`` after commit, if one
+    of its images changed.
+    """
+    if update_fields is not None and \
+            not set(variant_sizes(type(instance))) & set(update_fields):
+        return
+    if not stale_fields(instance):
+        return
+    from apps.users.tasks import generate_image_variants
+
+    label, pk = instance._meta.label, instance.pk
+
+    def dispatch():
+        try:
+            generate_image_variants.delay(label, pk)
+        except Exception as e:
+            # Left for build_image_variants; the original is served meanwhile
+            logger.error("Could not queue image variants of %s %s: %s", label, pk, e)
+
+    transaction.on_commit(dispatch)
+
+
+def render_variant(source, size, storage=default_storage):
+    """
+    Returns:
+        tuple[bytes, int, int] | None: WebP data, width and height, or None
+        when ``source`` is no readable image or the variant is not smaller.
+    """
+    try:
+        with storage.open(source) as file:
+            source_size = file.size
+            image = Image.open(file)
+            # JPEG is decoded at the smallest scale still covering ``size``
+            image.draft('RGB', (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+            buffer = BytesIO()
+            image.save(buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Could not render a variant of %s: %s", source, e)
+        return None
+    data = buffer.getvalue()
+    if len(data) >= source_size:
+        return None
+    return data, image.width, image.height
+
+
+def variant_name(source, data):
+    stem = posixpath.splitext(source)[0]
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f'{VARIANTS_DIR}/{stem}.{digest}.webp'
+
+
+def build_image_variants(model, pk, force=False, storage=default_storage):
+    """
+    Render the stale variants of one row, or all of them with ``force``,
+    and record them.
+
+    Returns:
+        list[str]: Fields whose recorded variant changed.
+    """
+    sizes = variant_sizes(model)
+    instance = model._default_manager.only(*sizes, 'image_variants').filter(pk=pk).first()
+    if instance is None:
+        return []
+    fields = sizes if force else stale_fields(instance)
+    rendered = {}
+    for field in fields:
+        file = getattr(instance, field)
+        if not file:
+            continue
+        entry = {'source': file.name, 'name': None}
+        result = render_variant(file.name, sizes[field], storage)
+        if result:
+            data, entry['width'], entry['height'] = result
+            entry['name'] = variant_name(file.name, data)
+            if not storage.exists(entry['name']):
+                entry['name'] = storage.save(entry['name'], ContentFile(data))
+        rendered[field] = entry
+    return record_variants(model, pk, rendered)
+
+
+@transaction.atomic
+def record_variants(model, pk, rendered):
+    sizes = variant_sizes(model)
+    # Locked and re-read: an image replaced while rendering keeps the
+    # variant of its new file, which another task is rendering
+    instance = model._default_manager.select_for_update() \
+        .only(*sizes, 'image_variants').filter(pk=pk).first()
+    created = {entry['name'] for entry in rendered.values() if entry['name']}
+    if instance is None:
+        delete_files_on_commit(created)
+        return []
+
+    variants = dict(instance.image_variants or {})
+    previous = set(variant_names(instance))
+    changed = []
+    for field in sizes:
+        file = getattr(instance, field)
+        entry = rendered.get(field)
+        if file and entry and entry['source'] == file.name:
+            variants[field] = entry
+        elif not file and field in variants:
+            del variants[field]
+        else:
+            continue
+        changed.append(field)
+
+    if changed:
+        model._default_manager.filter(pk=pk).update(image_variants=variants)
+    kept = {entry['name'] for entry in variants.values() if entry.get('name')}
+    delete_files_on_commit((previous | created) - kept)
+    return changed
+
+
+def image_url(instance, field, request=None):
+    """
+    URL of the variant of ``instance.<field>``, or of the original while
+    there is none. Absolute when ``request`` is given.
+    """
+    file = getattr(instance, field)
+    if not file:
+        return None
+    entry = (instance.image_variants or {}).get(field)
+    if entry and entry['source'] == file.name and entry['name']:
+        url = file.storage.url(entry['name'])
+    else:
+        url = file.url
+    return request.build_absolute_uri(url) if request else url
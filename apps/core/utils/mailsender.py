@@ -1,6 +1,4 @@
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 
 
 def send_custom_email(user, data, email_type="signup_otp"):
@@ -8,6 +6,14 @@ def send_custom_email(user, data, email_type="signup_otp"):
     Send custom email to a user depending on the email_type (signup_otp, login_otp, register_token).
     Renders both HTML and plain text from templates and sends a multipart email.
     """
+    # Deferred: the mail, template, tracing and metrics machinery is only
+    # needed when sending
+    from django.core.mail import EmailMultiAlternatives
+    from django.template.loader import render_to_string
+
+    from apps.core.utils.metrics import record_event
+    from apps.core.utils.tracing import tracer
+
     templates = {
         'subscription_info': {
             'subject': 'Subscription Confirmation & Payment Instructions',
@@ -62,19 +68,26 @@ def send_custom_email(user, data, email_type="signup_otp"):
     if not template:
         raise ValueError(f"Unsupported email_type: {email_type}")
 
-    # Render templates
-    html_content = render_to_string(
-        template['template_name'], template['context'])
-    text_content = render_to_string(
-        template['txt_template_name'], template['context'])
+    with tracer.start_as_current_span('mail.send', attributes={'mail.type': email_type}):
+        # Render templates
+        html_content = render_to_string(
+            template['template_name'], template['context'])
+        text_content = render_to_string(
+            template['txt_template_name'], template['context'])
 
-    # Send email
-    msg = EmailMultiAlternatives(
-        subject=template['subject'],
-        body=text_content,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=[user.email],
-        headers={"List-Unsubscribe": "<mailto:unsubscribe@example.com>"}
-    )
-    msg.attach_alternative(html_content, "text/html")
-    msg.send()
+        # Send email
+        msg = EmailMultiAlternatives(
+            subject=template['subject'],
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[user.email],
+            headers={"List-Unsubscribe": "<mailto:unsubscribe@example.com>"}
+        )
+        msg.attach_alternative(html_content, "text/html")
+        try:
+            with tracer.start_as_current_span('mail.smtp'):
+                msg.send()
+        except Exception:
+            record_event('mail_messages', email_type, 'failed')
+            raise
+        record_event('mail_messages', email_type, 'sent')
@@ -0,0 +1,200 @@
+"""
+Deferred deletion of media files.
+
+``post_delete`` receivers hand the file names of deleted rows to
+``delete_files_on_commit``. All names of one transaction are collected into
+a single ``on_commit`` callback, so a cascade deleting a company and its
+users queues one batch instead of touching the disk once per row, and a
+rolled back delete keeps its files. After commit the names go to the
+``delete_media_files`` Celery task in chunks of ``MEDIA_GC_BATCH_SIZE``,
+which deletes them through the storage API once no row references them.
+
+Files that are never queued (a lost task, a replaced upload) are found by
+``manage.py reconcile_media``.
+"""
+
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+
+from apps.core.utils.content_storage import BLOBS_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def file_fields():
+    """
+    Yields:
+        tuple[Model, FileField]: Every file field of every installed model.
+    """
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                yield model, field
+
+
+def instance_file_names(instance):
+    """
+    Names of the files of ``instance``, including its image variants.
+    """
+    from apps.core.utils.image_variants import variant_names
+
+    names = [file.name for field in instance._meta.concrete_fields
+             if isinstance(field, models.FileField)
+             and (file := getattr(instance, field.attname)) and file.name]
+    if hasattr(instance, 'image_variants'):
+        names.extend(variant_names(instance))
+    return names
+
+
+class PendingDeletion:
+    """
+    ``on_commit`` callback holding the file names of one transaction.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.dispatched = False
+
+    def __call__(self):
+        self.dispatched = True
+        dispatch_deletions(sorted(self.names))
+
+
+def delete_files_on_commit(names, using=None):
+    names = [name for name in names if name]
+    if not names:
+        return
+    connection = transaction.get_connection(using)
+    # Join the batch already waiting for this transaction and savepoint, if
+    # any. A rollback discards it together with the rows it belonged to.
+    savepoint_ids = set(connection.savepoint_ids)
+    for callback_savepoint_ids, callback, _ in connection.run_on_commit:
+        if isinstance(callback, PendingDeletion) and not callback.dispatched \
+                and callback_savepoint_ids == savepoint_ids:
+            callback.names.update(names)
+            return
+    pending = PendingDeletion()
+    pending.names.update(names)
+    transaction.on_commit(pending, using=using)
+
+
+def dispatch_deletions(names):
+    from apps.users.tasks import delete_media_files
+
+    size = settings.MEDIA_GC_BATCH_SIZE
+    for start in range(0, len(names), size):
+        chunk = names[start:start + size]
+        try:
+            delete_media_files.delay(chunk)
+        except Exception as e:
+            # Left for reconcile_media
+            logger.error("Could not queue deletion of %d media files: %s", len(chunk), e)
+
+
+def referenced_names(names=None):
+    """
+    File names stored in any file field or recorded as an image variant,
+    optionally limited to ``names``.
+
+    This is the reference count of content addressed blobs: rows with the
+    same upload share one file, which is only deleted once no row names it.
+    """
+    from apps.core.utils.image_variants import (variant_models,
+                                                variant_names, variant_sizes)
+
+    referenced = set()
+    for model, field in file_fields():
+        queryset = model._default_manager.exclude(**{field.attname: ''}) \
+            .exclude(**{f'{field.attname}__isnull': True})
+        if names is not None:
+            queryset = queryset.filter(**{f'{field.attname}__in': names})
+        referenced.update(queryset.values_list(field.attname, flat=True).iterator())
+    for model in variant_models():
+        queryset = model._default_manager.only('image_variants').exclude(image_variants={})
+        if names is not None:
+            lookup = models.Q()
+            for field in variant_sizes(model):
+                lookup |= models.Q(**{f'image_variants__{field}__name__in': names})
+            queryset = queryset.filter(lookup)
+        for instance in queryset.iterator():
+            referenced.update(variant_names(instance))
+    if names is not None:
+        referenced.intersection_update(names)
+    return referenced
+
+
+def delete_files(names, storage=default_storage):
+    """
+    Delete ``names`` from storage, except those a row still or again
+    references (a blob shared with other rows, a new upload of the same
+    content). Files modified within ``MEDIA_GC_GRACE_PERIOD`` seconds are
+    kept too: saving existing content touches its blob, and the row naming
+    it may not be committed yet. ``reconcile_media`` removes them later if
+    they stay unreferenced.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    keep = referenced_names(names)
+    cutoff = time.time() - settings.MEDIA_GC_GRACE_PERIOD
+    deleted = 0
+    for name in names:
+        if name in keep:
+            continue
+        try:
+            if storage.get_modified_time(name).timestamp() >= cutoff:
+                continue
+            storage.delete(name)
+            deleted += 1
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning("Could not delete media file %s: %s", name, e)
+    return deleted
+
+
+def upload_prefixes():
+    """
+    Fixed leading directory of every ``upload_to``, e.g. ``company_logo``
+    for ``company_logo/%Y/``, and the blob and image variant directories.
+    """
+    from apps.core.utils.image_variants import VARIANTS_DIR
+
+    prefixes = {BLOBS_DIR, VARIANTS_DIR}
+    for _, field in file_fields():
+        if isinstance(field.upload_to, str):
+            prefixes.add(field.upload_to.split('%', 1)[0].rsplit('/', 1)[0])
+    return sorted(prefixes)
+
+
+def stored_names(prefix, storage=default_storage):
+    try:
+        directories, files = storage.listdir(prefix)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{prefix}/{name}' if prefix else name
+    for directory in directories:
+        yield from stored_names(f'{prefix}/{directory}' if prefix else directory, storage)
+
+
+def find_orphans(prefixes=None, min_age=0, storage=default_storage):
+    """
+    Files under ``prefixes`` that no row references, by set difference of
+    stored and referenced names. Files younger than ``min_age`` seconds are
+    skipped: their row may not be committed yet.
+    """
+    stored = set()
+    for prefix in prefixes if prefixes is not None else upload_prefixes():
+        stored.update(stored_names(prefix.strip('/'), storage))
+    orphans = stored - referenced_names()
+    if min_age:
+        cutoff = time.time() - min_age
+        orphans = {name for name in orphans
+                   if storage.get_modified_time(name).timestamp() < cutoff}
+    return sorted(orphans)
@@ -0,0 +1,189 @@
+"""
+Prometheus metrics.
+
+Per-request metrics (requests, latency, queries, cache lookups) are plain
+prometheus_client metrics. Under gunicorn every worker writes them to
+memory-mapped files in ``PROMETHEUS_MULTIPROC_DIR`` (see
+``config/server.py``) and a scrape sums all workers. Events that also
+happen in Celery workers on other hosts (mail, task outcomes) are counted
+in Redis instead, so one scrape of the web service sees all of them.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by URL name, method and status.',
+    ['url_name', 'method', 'status'])
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name and method.',
+    ['url_name', 'method'], buckets=LATENCY_BUCKETS)
+HTTP_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request by URL name.',
+    ['url_name'], buckets=QUERY_BUCKETS)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss).',
+    ['cache', 'result'])
+# Summed over the live workers; each buffers its own rows
+AUDIT_QUEUE_DEPTH = Gauge(
+    'audit_queue_depth', 'Audit rows buffered in memory, waiting to be written.',
+    multiprocess_mode='livesum')
+
+# Counted in the shared event store: name -> (help, label names)
+EVENT_COUNTERS = {
+    'mail_messages': ('Emails by type and outcome (sent or failed).',
+                      ['email_type', 'outcome']),
+    'celery_tasks': ('Celery task outcomes by task name.',
+                     ['task', 'outcome']),
+}
+
+
+def record_cache_lookup(cache_name, hit):
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+class RedisEventStore:
+    """
+    Event counters kept as Redis hashes: one hash per counter, one field
+    per label set.
+    """
+    prefix = 'metrics:'
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+
+    def inc(self, name, labels):
+        self.client.hincrby(self.prefix + name, json.dumps(labels), 1)
+
+    def read(self, name):
+        return {tuple(json.loads(field)): int(value)
+                for field, value in self.client.hgetall(self.prefix + name).items()}
+
+
+class LocalEventStore:
+    """
+    In-process event counters. Used for tests and single-process
+    development servers.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, labels):
+        with self.lock:
+            values = self.counts.setdefault(name, {})
+            values[tuple(labels)] = values.get(tuple(labels), 0) + 1
+
+    def read(self, name):
+        with self.lock:
+            return dict(self.counts.get(name, {}))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_event_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                name = getattr(settings, 'METRICS_BACKEND', 'redis')
+                if name == 'redis':
+                    _store = RedisEventStore(settings.REDIS_URL)
+                elif name == 'local':
+                    _store = LocalEventStore()
+                else:
+                    raise ImproperlyConfigured(
+                        f"Unsupported METRICS_BACKEND: {name!r}")
+    return _store
+
+
+def record_event(name, *labels):
+    """
+    Count one event of ``EVENT_COUNTERS[name]``. Never raises: losing a
+    data point is better than failing the mail or task it describes.
+    """
+    try:
+        get_event_store().inc(name, [str(label) for label in labels])
+    except Exception as e:
+        logger.warning("Could not record %s metric: %s", name, e)
+
+
+class SharedMetricsCollector:
+    """
+    Scrape-time collector for the event counters and broker queue depth.
+    """
+
+    def collect(self):
+        store = get_event_store()
+        for name, (help_text, labels) in EVENT_COUNTERS.items():
+            family = CounterMetricFamily(name, help_text, labels=labels)
+            try:
+                for values, count in store.read(name).items():
+                    family.add_metric(list(values), count)
+            except Exception as e:
+                logger.warning("Could not read %s metric: %s", name, e)
+            yield family
+
+        depth = GaugeMetricFamily(
+            'queue_depth', 'Messages waiting in broker queues.', labels=['queue'])
+        try:
+            import redis
+
+            client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=0.5)
+            for queue in settings.METRICS_QUEUES:
+                depth.add_metric([queue], client.llen(queue))
+        except Exception as e:
+            logger.warning("Could not read queue depth: %s", e)
+        yield depth
+
+
+def render_metrics():
+    """
+    Returns:
+        tuple[bytes, str]: Exposition text of every worker and its content
+        type.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    shared = CollectorRegistry()
+    shared.register(SharedMetricsCollector())
+    return generate_latest(registry) + generate_latest(shared), CONTENT_TYPE_LATEST
+
+
+def connect_celery_signals():
+    """
+    Count task outcomes; call once from the Celery app module.
+    """
+    from celery.signals import task_failure, task_retry, task_success
+
+    def outcome(name):
+        def receiver(sender=None, request=None, **kwargs):
+            task = getattr(sender, 'name', None) or getattr(request, 'task', 'unknown')
+            record_event('celery_tasks', task, name)
+        return receiver
+
+    for signal, name in ((task_success, 'success'), (task_failure, 'failure'),
+                         (task_retry, 'retry')):
+        signal.connect(outcome(name), weak=False)
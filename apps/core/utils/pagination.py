@@ -1,4 +1,9 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class CustomPagination(PageNumberPagination):
@@ -19,3 +24,44 @@ def custom_array_pagination(data, page, page_size):
     start = (page - 1) * page_size
     end = start + page_size
     return data[start:end], len(data)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Newest first, paged by an opaque cursor holding the last timestamp
+    seen, so every page is an index range scan instead of an OFFSET.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'items': data,
+        }
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator that takes the planner's row estimate instead of
+    running ``COUNT(*)`` over large tables. Counts are exact below
+    ``exact_threshold`` rows and on databases other than PostgreSQL.
+    """
+    exact_threshold = 10000
+
+    @cached_property
+    def count(self):
+        if connection.vendor != 'postgresql':
+            return super().count
+        query = self.object_list.order_by()
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        return estimate if estimate > self.exact_threshold else super().count
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# Every cached permission entry embeds this version in its key, so bumping it
+# invalidates all of them at once without scanning or deleting keys.
+VERSION_KEY = 'permissions:version'
+
+
+def _timeout():
+    return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300)
+
+
+def permission_cache_key(version, user_id, *parts):
+    suffix = ':'.join(str(part) for part in parts)
+    return f"permissions:{version}:{user_id}:{suffix}"
+
+
+def get_permission_cache_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _record_lookup(hit):
+    # Imported on use, so importing this module does not load the metrics
+    from apps.core.utils.metrics import record_cache_lookup
+
+    record_cache_lookup('permissions', hit)
+
+
+def get_cached_permissions(user_id, *parts):
+    """
+    Return ``(key, value)``; ``value`` is None on a miss. Pass the key to
+    ``set_cached_permissions`` so a concurrent invalidation is not undone.
+    """
+    key = permission_cache_key(get_permission_cache_version(), user_id, *parts)
+    value = cache.get(key)
+    _record_lookup(value is not None)
+    return key, value
+
+
+def set_cached_permissions(key, value):
+    cache.set(key, value, timeout=_timeout())
+
+
+async def aget_cached_permissions(user_id, *parts):
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(VERSION_KEY, 1)
+    key = permission_cache_key(version, user_id, *parts)
+    value = await cache.aget(key)
+    _record_lookup(value is not None)
+    return key, value
+
+
+async def aset_cached_permissions(key, value):
+    await cache.aset(key, value, timeout=_timeout())
+
+
+def invalidate_permission_cache():
+    """
+    Drop every cached permission entry in one step by bumping the version.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No version yet, so nothing can be cached under an older one
+        cache.add(VERSION_KEY, 1, timeout=None)
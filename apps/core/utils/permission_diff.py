@@ -0,0 +1,185 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from apps.core.utils.effective_permissions import \
+    schedule_effective_permission_sync
+from apps.core.utils.permission_cache import invalidate_permission_cache
+from apps.users.models import AppFeature, MyUser, UserBranchFeatures
+
+
+def desired_permission_pairs(features_branch_data, allowed_branch_ids=None):
+    """
+    Turn ``features_branch_input`` items into the branches and
+    ``(branch_id, feature_id)`` pairs they ask for. Malformed items and
+    branches outside ``allowed_branch_ids`` are skipped, as before.
+    """
+    branch_ids = set()
+    pairs = set()
+    for item in features_branch_data:
+        branch_id = item.get('branch_id')
+        feature_ids = item.get('features', [])
+
+        if not branch_id or not isinstance(feature_ids, list):
+            continue
+        if allowed_branch_ids is not None and branch_id not in allowed_branch_ids:
+            continue
+
+        branch_ids.add(branch_id)
+        pairs.update((branch_id, feature_id) for feature_id in feature_ids)
+    return branch_ids, pairs
+
+
+def apply_user_branch_features(user, features_branch_data, allowed_branch_ids=None):
+    """
+    Bring the user's ``UserBranchFeatures`` rows in line with
+    ``features_branch_data`` by writing only the difference: rows for
+    branches no longer listed are deleted, new branches get a row, and
+    feature links are inserted or deleted in bulk. Unchanged rows are
+    left alone.
+
+    Args:
+        user (MyUser): User whose permissions are updated.
+        features_branch_data (list[dict]): Items with ``branch_id`` and
+            ``features``.
+        allowed_branch_ids (set[int] | None): Branch IDs known to exist.
+
+    Returns:
+        dict: Branches and ``(branch, feature)`` pairs added and removed.
+    """
+    branch_ids, desired = desired_permission_pairs(
+        features_branch_data, allowed_branch_ids)
+
+    # Unknown feature IDs were silently ignored by features.set(); keep that
+    requested_features = {feature_id for _, feature_id in desired}
+    if requested_features:
+        known = set(AppFeature.objects.filter(
+            id__in=requested_features).values_list('id', flat=True))
+        desired = {pair for pair in desired if pair[1] in known}
+
+    ubf_by_branch = dict(UserBranchFeatures.objects.filter(
+        user=user).values_list('branch_id', 'id'))
+
+    through = UserBranchFeatures.features.through
+    link_ids = {}
+    for link_id, branch_id, feature_id in through.objects.filter(
+            userbranchfeatures__user=user).values_list(
+            'id', 'userbranchfeatures__branch_id', 'appfeature_id'):
+        link_ids[(branch_id, feature_id)] = link_id
+
+    current = set(link_ids)
+    branches_added = branch_ids - set(ubf_by_branch)
+    branches_removed = set(ubf_by_branch) - branch_ids
+    pairs_added = desired - current
+    # Links of removed branches go with their row through the cascade
+    pairs_removed = {pair for pair in current - desired
+                     if pair[0] not in branches_removed}
+
+    if branches_removed:
+        UserBranchFeatures.objects.filter(
+            id__in=[ubf_by_branch[branch_id] for branch_id in branches_removed]).delete()
+
+    if branches_added:
+        created = UserBranchFeatures.objects.bulk_create([
+            UserBranchFeatures(user=user, branch_id=branch_id)
+            for branch_id in branches_added
+        ])
+        ubf_by_branch.update((ubf.branch_id, ubf.id) for ubf in created)
+
+    if pairs_removed:
+        through.objects.filter(
+            id__in=[link_ids[pair] for pair in pairs_removed]).delete()
+
+    if pairs_added:
+        through.objects.bulk_create([
+            through(userbranchfeatures_id=ubf_by_branch[branch_id],
+                    appfeature_id=feature_id)
+            for branch_id, feature_id in pairs_added
+        ])
+
+    added = defaultdict(list)
+    for branch_id, feature_id in sorted(pairs_added):
+        added[branch_id].append(feature_id)
+    removed = defaultdict(list)
+    for branch_id, feature_id in sorted(pairs_removed | {
+            pair for pair in current if pair[0] in branches_removed}):
+        removed[branch_id].append(feature_id)
+
+    if branches_added or branches_removed or pairs_added or pairs_removed:
+        # Bulk writes on the through table send no m2m_changed signal
+        schedule_effective_permission_sync(user_ids=[user.id])
+        transaction.on_commit(invalidate_permission_cache)
+
+    return {
+        "branches_added": sorted(branches_added),
+        "branches_removed": sorted(branches_removed),
+        "features_added": [{"branch_id": branch_id, "features": features}
+                           for branch_id, features in added.items()],
+        "features_removed": [{"branch_id": branch_id, "features": features}
+                             for branch_id, features in removed.items()],
+    }
+
+
+def bulk_update_permissions(user_ids, branch_ids, feature_ids, action):
+    """
+    Grant or revoke ``feature_ids`` for every user in ``user_ids`` on every
+    branch in ``branch_ids`` they are assigned to, with set based writes on
+    the ``UserBranchFeatures.features`` through table.
+
+    Args:
+        user_ids (Iterable[int]): Users to update.
+        branch_ids (Iterable[int]): Branches to update.
+        feature_ids (Iterable[int]): Features to grant or revoke.
+        action (str): ``grant`` or ``revoke``.
+
+    Returns:
+        dict: Number of ``(user, branch, feature)`` links changed.
+    """
+    through = UserBranchFeatures.features.through
+    feature_ids = set(feature_ids)
+
+    with transaction.atomic():
+        if action == 'revoke':
+            # One DELETE ... WHERE id IN (SELECT ...) on the through table
+            changed, _ = through.objects.filter(
+                userbranchfeatures__user_id__in=user_ids,
+                userbranchfeatures__branch_id__in=branch_ids,
+                appfeature_id__in=feature_ids,
+            ).delete()
+        else:
+            # Only branches the user is actually assigned to
+            pairs = set(MyUser.assigned_branches.through.objects.filter(
+                myuser_id__in=user_ids, branch_id__in=branch_ids
+            ).values_list('myuser_id', 'branch_id'))
+            UserBranchFeatures.objects.bulk_create([
+                UserBranchFeatures(user_id=user_id, branch_id=branch_id)
+                for user_id, branch_id in pairs
+            ], ignore_conflicts=True)
+
+            ubf_ids = {
+                (user_id, branch_id): ubf_id
+                for ubf_id, user_id, branch_id in UserBranchFeatures.objects.filter(
+                    user_id__in=user_ids, branch_id__in=branch_ids
+                ).values_list('id', 'user_id', 'branch_id')
+                if (user_id, branch_id) in pairs
+            }
+            existing = set(through.objects.filter(
+                userbranchfeatures_id__in=ubf_ids.values(),
+                appfeature_id__in=feature_ids,
+            ).values_list('userbranchfeatures_id', 'appfeature_id'))
+
+            links = [
+                through(userbranchfeatures_id=ubf_id, appfeature_id=feature_id)
+                for ubf_id in ubf_ids.values()
+                for feature_id in feature_ids
+                if (ubf_id, feature_id) not in existing
+            ]
+            through.objects.bulk_create(links, ignore_conflicts=True)
+            changed = len(links)
+
+        if changed:
+            # Bulk writes on the through table send no m2m_changed signal
+            schedule_effective_permission_sync(user_ids, branch_ids)
+            transaction.on_commit(invalidate_permission_cache)
+
+    return {"action": action, "changed": changed}
@@ -10,50 +10,123 @@ def check_permission(request):
 
         return list(feature_ids)
     user_allowed_feature_ids = set(
-        request.user.features.values_list('id', flat=True))
+        request.user.effective_permissions.values_list('feature_id', flat=True))
 
     return user_allowed_feature_ids
 
 
+def has_feature_permission(user, branch_id, feature_id):
+    """
+    Can ``user`` use ``feature_id`` in ``branch_id``? One probe of the
+    effective_permission unique index.
+    """
+    from apps.users.models import EffectivePermission
+
+    if user.is_superuser:
+        return True
+    return EffectivePermission.objects.filter(
+        user_id=user.id, branch_id=branch_id, feature_id=feature_id).exists()
+
+
+def branch_access_expression(user, branch_field=None):
+    """
+    Boolean expression that is true for rows whose branch ``user`` may
+    access: every branch for superusers, the company's branches for owners,
+    otherwise an ``EXISTS`` probe of the assigned branches.
+
+    Args:
+        user (MyUser): Authenticated user.
+        branch_field (str | None): FK to the branch on the queried model, or
+            None when querying Branch itself.
+    """
+    from django.db.models import (BooleanField, Exists, ExpressionWrapper,
+                                  OuterRef, Q, Value)
+
+    from apps.users.models import MyUser
+
+    branch_id = f'{branch_field}_id' if branch_field else 'pk'
+    company_id = f'{branch_field}__company_id' if branch_field else 'company_id'
+
+    if user.is_superuser:
+        return Value(True)
+    if user.is_owner:
+        return ExpressionWrapper(Q(**{company_id: user.company_id}),
+                                 output_field=BooleanField())
+    return Exists(MyUser.assigned_branches.through.objects.filter(
+        myuser_id=user.pk, branch_id=OuterRef(branch_id)))
+
+
+def can_access_branch(user, branch_id):
+    """
+    Can ``user`` access ``branch_id``? One ``EXISTS`` query.
+    """
+    from apps.users.models import Branch
+
+    return Branch.objects.filter(
+        branch_access_expression(user), id=branch_id).exists()
+
+
+def filter_accessible_branch_ids(user, branch_ids):
+    """
+    Batch check: the subset of ``branch_ids`` ``user`` may access, in one
+    query.
+    """
+    from apps.users.models import Branch
+
+    cached = getattr(user, '_accessible_branch_ids', None)
+    if cached is not None:
+        return set(branch_ids) & cached
+    return set(Branch.objects.filter(
+        branch_access_expression(user), id__in=branch_ids
+    ).values_list('id', flat=True))
+
+
+def accessible_branch_ids(user):
+    """
+    Every branch id ``user`` may access, cached on the user object for the
+    rest of the request. Use it when one request checks many branches;
+    single checks are cheaper with ``can_access_branch``.
+    """
+    from apps.users.models import Branch
+
+    cached = getattr(user, '_accessible_branch_ids', None)
+    if cached is None:
+        cached = set(Branch.objects.filter(
+            branch_access_expression(user)).values_list('id', flat=True))
+        user._accessible_branch_ids = cached
+    return cached
+
+
 def check_branch_permission(request, branch_id=None):
     from rest_framework.exceptions import NotFound, ValidationError
 
-    from apps.users.models import Branch, Company
+    from apps.users.models import Branch
 
     user = request.user
-    branch = Branch.objects.none()
 
     if not user or not user.is_authenticated:
         raise AuthenticationFailed("User is not authenticated.")
 
-    company = user.company
-    branches = user.assigned_branches.all()
-
-    if user.is_superuser:
-        company = Company.objects.filter(name="starter").first()
-        branches = Branch.objects.all()
-    elif user.is_owner:
-        branches = Branch.objects.filter(company=company)
-
-    if branch_id:
-        try:
-            branch = Branch.objects.get(id=int(branch_id))
-        except Branch.DoesNotExist:
-            raise NotFound("Branch not found.")
-    else:
+    if not branch_id:
         raise ValidationError({"branch": "A branch must required"})
 
-    if branch not in branches:
+    # Existence and access in one query
+    try:
+        branch = Branch.objects.annotate(
+            accessible=branch_access_expression(user)).get(id=int(branch_id))
+    except Branch.DoesNotExist:
+        raise NotFound("Branch not found.")
+
+    if not branch.accessible:
         raise ValidationError(
             {"branch": "This is not valid branch for you to request"})
     return branch
 
 
 def check_camera_permission(request):
-    from rest_framework.exceptions import NotFound, ValidationError
+    from rest_framework.exceptions import ValidationError
 
     from apps.cameras.models import Camera
-    from apps.users.models import Branch, Company
 
     def parse_id_list(param: str) -> list[int]:
         return [int(i) for i in param.split(',') if i.strip().isdigit()]
@@ -63,36 +136,20 @@ def check_camera_permission(request):
     if not user or not user.is_authenticated:
         raise AuthenticationFailed("User is not authenticated.")
 
-    company = user.company
-    branches = user.assigned_branches.all()
-
-    if user.is_superuser:
-        company = Company.objects.filter(name="starter").first()
-        branches = Branch.objects.all()
-    elif user.is_owner:
-        branches = Branch.objects.filter(company=company)
-
     camera_ids_qr = request.GET.get('camera_ids', None)
-    camera_ids = None
-    cameras = Camera.objects.none()
-    allowed_branch_ids = branches.values_list('id', flat=True)
-
-    if camera_ids_qr:
-        camera_ids = parse_id_list(camera_ids_qr)
-
-    if camera_ids:
-        try:
-            cameras = Camera.objects.filter(
-                id__in=camera_ids
-            )
-        except Camera.DoesNotExist:
-            raise NotFound("Camera not found.")
-    else:
+    camera_ids = parse_id_list(camera_ids_qr) if camera_ids_qr else None
+    if not camera_ids:
         return []
 
-    if cameras:
-        if cameras.exclude(branch_id__in=allowed_branch_ids).exists():
+    # One query: every requested camera with whether its branch is allowed
+    cameras = Camera.objects.filter(id__in=camera_ids).annotate(
+        accessible=branch_access_expression(user, 'branch')
+    ).values_list('id', 'accessible')
+
+    allowed = []
+    for camera_id, accessible in cameras:
+        if not accessible:
             raise ValidationError(
                 {"camera": "You don't have permission to this camera"})
-        return cameras.values_list('id', flat=True)
-    return []
+        allowed.append(camera_id)
+    return allowed
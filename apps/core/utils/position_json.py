@@ -1,6 +1,6 @@
 from apps.users.models import AppFeature, UserBranchLayout
 
-def position_make_json(features, positions=None):
+def position_make_json(features, positions=None, features_by_tag=None):
     """
     Create a list of dicts for layout, each with h, w, x, y, tag, and id.
 
@@ -9,6 +9,8 @@ def position_make_json(features, positions=None):
     Args:
         features (list): List of AppFeature instances.
         positions (list|None): Optional list of dicts with position info.
+        features_by_tag (dict|None): Optional preloaded {tag: AppFeature}; when
+            given, 'camera_live' is looked up here instead of queried.
 
     Returns:
         list: List of layout dictionaries.
@@ -43,7 +45,12 @@ def position_make_json(features, positions=None):
         # If required is 'camera', add 'camera_live' feature
         if feature.required == "camera" and "camera_live" not in added_tags:
             try:
-                camera_live = AppFeature.objects.get(tag="camera_live")
+                if features_by_tag is not None:
+                    camera_live = features_by_tag.get("camera_live")
+                    if camera_live is None:
+                        raise AppFeature.DoesNotExist
+                else:
+                    camera_live = AppFeature.objects.get(tag="camera_live")
                 result.append({
                     "id": camera_live.id,
                     "tag": camera_live.tag,
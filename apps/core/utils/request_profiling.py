@@ -0,0 +1,134 @@
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from rest_framework import serializers
+
+_current = contextvars.ContextVar('request_timings', default=None)
+_query_observers = contextvars.ContextVar('query_observers', default=())
+
+
+def observe_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection (see
+    ``apps/users/signals.py``). Reports each query's duration to the
+    observers of the current context. Context variables follow a request
+    into ``sync_to_async`` threads, so this also counts the queries of
+    async views, which a per-connection ``execute_wrapper`` opened on the
+    event loop would miss.
+    """
+    observers = _query_observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for observer in observers:
+            observer.add_query(elapsed_ms)
+
+
+@contextmanager
+def observing_queries(observer):
+    """
+    Call ``observer.add_query(ms)`` for every query run in this context.
+    """
+    token = _query_observers.set(_query_observers.get() + (observer,))
+    try:
+        yield observer
+    finally:
+        _query_observers.reset(token)
+
+
+class RequestTimings:
+    """
+    Durations (ms) and SQL counters of one sampled request.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.serializer_depth = 0
+
+    def add_query(self, elapsed_ms):
+        self.db_queries += 1
+        self.db_ms += elapsed_ms
+
+    def add_render(self, start):
+        self.render_ms += (time.perf_counter() - start) * 1000
+
+    def as_dict(self, total_ms):
+        return {
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_ms, 2),
+            'serializer_ms': round(self.serializer_ms, 2),
+            'render_ms': round(self.render_ms, 2),
+            'total_ms': round(total_ms, 2),
+        }
+
+    def server_timing(self, total_ms):
+        """
+        ``Server-Timing`` header value. Phases overlap: queries run inside
+        serializers, everything runs inside ``total``.
+        """
+        return ', '.join([
+            f'db;dur={self.db_ms:.2f};desc="{self.db_queries} queries"',
+            f'serializer;dur={self.serializer_ms:.2f}',
+            f'render;dur={self.render_ms:.2f}',
+            f'total;dur={total_ms:.2f}',
+        ])
+
+
+def current_timings():
+    """
+    Timings of the request being sampled in this context, or None.
+    """
+    return _current.get()
+
+
+@contextmanager
+def collect_timings():
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        with observing_queries(timings):
+            yield timings
+    finally:
+        _current.reset(token)
+
+
+def _timed(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timings = _current.get()
+        # Nested serializers are part of the outermost one's time
+        if timings is None or timings.serializer_depth:
+            return method(self, *args, **kwargs)
+        timings.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            timings.serializer_depth -= 1
+            timings.serializer_ms += (time.perf_counter() - start) * 1000
+
+    wrapper.request_timed = True
+    return wrapper
+
+
+def install_serializer_timing():
+    """
+    Time ``is_valid()`` and ``.data`` of every DRF serializer while a
+    request is sampled. Outside a sampled request the cost is one context
+    variable lookup. Safe to call more than once.
+    """
+    for cls in (serializers.BaseSerializer, serializers.ListSerializer):
+        if not getattr(cls.__dict__['is_valid'], 'request_timed', False):
+            cls.is_valid = _timed(cls.__dict__['is_valid'])
+    data = serializers.BaseSerializer.data
+    if not getattr(data.fget, 'request_timed', False):
+        serializers.BaseSerializer.data = property(_timed(data.fget))
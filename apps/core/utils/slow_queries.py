@@ -0,0 +1,219 @@
+"""
+Slow-query log.
+
+Every connection gets ``record_slow_query`` as an execute wrapper (see
+``apps/users/signals.py``). A query slower than ``SLOW_QUERY_THRESHOLD_MS``
+is logged as a warning together with the application frames that issued
+it, and kept in a bounded ring buffer that staff browse at
+``/admin/slow-queries/``. For ``SLOW_QUERY_EXPLAIN_RATE`` of slow SELECTs
+on PostgreSQL a Celery task captures ``EXPLAIN (ANALYZE, BUFFERS)`` and
+attaches the plan to the entry.
+
+Entries keep the SQL with its placeholders only; parameter values can be
+credentials or OTPs and only travel in the EXPLAIN task message.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+APPS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Application frames kept per entry, innermost first
+MAX_FRAMES = 5
+MAX_SQL_LENGTH = 4000
+# "IN (%s, %s, %s)" lists of any length share one fingerprint
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    normalized = IN_LIST.sub('IN (...)', sql)
+    return hashlib.md5(normalized.encode()).hexdigest()[:12]
+
+
+def app_frames():
+    """
+    ``path:line in function`` of the innermost application frames of the
+    current stack, skipping this module.
+    """
+    frames = []
+    frame = sys._getframe(1)
+    while frame is not None and len(frames) < MAX_FRAMES:
+        path = frame.f_code.co_filename
+        if path.startswith(APPS_DIR) and path != __file__:
+            frames.append(f"{os.path.relpath(path, os.path.dirname(APPS_DIR))}"
+                          f":{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+    return frames
+
+
+class RedisQueryBuffer:
+    """
+    Newest entries first in a capped Redis list; plans are stored next to
+    it and expire with the entries they describe.
+    """
+    key = 'slow_queries'
+
+    def __init__(self, url, size):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.size = size
+
+    def add(self, entry):
+        pipe = self.client.pipeline()
+        pipe.lpush(self.key, json.dumps(entry))
+        pipe.ltrim(self.key, 0, self.size - 1)
+        pipe.execute()
+
+    def set_plan(self, entry_id, plan):
+        self.client.set(f'{self.key}:plan:{entry_id}', plan, ex=7 * 24 * 3600)
+
+    def entries(self):
+        entries = [json.loads(raw) for raw in self.client.lrange(self.key, 0, -1)]
+        if entries:
+            plans = self.client.mget([f"{self.key}:plan:{e['id']}" for e in entries])
+            for entry, plan in zip(entries, plans):
+                entry['plan'] = plan.decode() if plan else None
+        return entries
+
+
+class LocalQueryBuffer:
+    """
+    In-process ring buffer. Used for tests and single-process development
+    servers.
+    """
+
+    def __init__(self, size):
+        self.items = deque(maxlen=size)
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def add(self, entry):
+        with self.lock:
+            self.items.appendleft(entry)
+
+    def set_plan(self, entry_id, plan):
+        with self.lock:
+            self.plans[entry_id] = plan
+
+    def entries(self):
+        with self.lock:
+            return [dict(entry, plan=self.plans.get(entry['id'])) for entry in self.items]
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_slow_query_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                name = getattr(settings, 'SLOW_QUERY_BACKEND', 'redis')
+                size = settings.SLOW_QUERY_BUFFER_SIZE
+                if name == 'redis':
+                    _buffer = RedisQueryBuffer(settings.REDIS_URL, size)
+                elif name == 'local':
+                    _buffer = LocalQueryBuffer(size)
+                else:
+                    raise ImproperlyConfigured(
+                        f"Unsupported SLOW_QUERY_BACKEND: {name!r}")
+    return _buffer
+
+
+def record_slow_query(execute, sql, params, many, context):
+    """
+    ``connection.execute_wrapper`` timing every query. Only queries over the
+    threshold pay for the stack walk and the buffer write.
+    """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS and not sql.startswith('EXPLAIN'):
+            _record(sql, params, many, context['connection'], duration_ms)
+
+
+def _record(sql, params, many, connection, duration_ms):
+    entry = {
+        'id': uuid.uuid4().hex,
+        'fingerprint': fingerprint(sql),
+        'sql': sql[:MAX_SQL_LENGTH],
+        'duration_ms': round(duration_ms, 2),
+        'many': many,
+        'database': connection.alias,
+        'frames': app_frames(),
+        'at': time.time(),
+    }
+    logger.warning("Slow query (%.1f ms) from %s: %s", duration_ms,
+                   entry['frames'][0] if entry['frames'] else 'unknown', entry['sql'])
+    try:
+        get_slow_query_buffer().add(entry)
+    except Exception as e:
+        logger.warning("Could not store slow query: %s", e)
+        return
+
+    if (connection.vendor == 'postgresql' and not many
+            and sql.lstrip()[:6].upper() == 'SELECT'
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+        from apps.users.tasks import explain_slow_query
+
+        try:
+            explain_slow_query.delay(entry['id'], connection.alias, sql,
+                                     list(params) if params else None)
+        except Exception as e:
+            logger.warning("Could not queue EXPLAIN of slow query: %s", e)
+
+
+def explain(entry_id, alias, sql, params):
+    """
+    Run ``EXPLAIN (ANALYZE, BUFFERS)`` of a recorded query and attach the
+    plan to its entry. ANALYZE executes the query, so it runs in a
+    transaction that is rolled back and under a statement timeout.
+    """
+    from django.db import connections, transaction
+
+    connection = connections[alias]
+    with transaction.atomic(using=alias):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s",
+                           [settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS])
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        transaction.set_rollback(True, using=alias)
+    get_slow_query_buffer().set_plan(entry_id, plan)
+    return plan
+
+
+def top_offenders(entries):
+    """
+    Group buffered entries by fingerprint, worst total time first.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'], 'sql': entry['sql'],
+            'frames': entry['frames'], 'count': 0, 'total_ms': 0.0,
+            'max_ms': 0.0, 'last_at': entry['at'], 'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['last_at'] = max(group['last_at'], entry['at'])
+        group['plan'] = group['plan'] or entry.get('plan')
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
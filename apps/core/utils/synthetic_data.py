@@ -0,0 +1,302 @@
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from apps.core.utils.audit_rollups import add_rollups, rollup_counts
+from apps.core.utils.bulk_copy import copy_rows
+from apps.core.utils.effective_permissions import rebuild_effective_permissions
+from apps.core.utils.position_json import position_make_json
+from apps.users.models import (AppFeature, Branch, Company, Contact, MyUser,
+                               MyUserDetails, RequestAuditLog, Subscription,
+                               SubscriptionHistory, UserBranchFeatures,
+                               UserBranchLayout)
+
+# Feature catalogue created when the database has none: "<group>_<operation>"
+# tags like the real ones, plus the camera and free rules.
+FEATURE_GROUPS = ['people', 'vehicle', 'heatmap', 'alerts', 'reports',
+                  'zones', 'companysettings']
+FEATURE_OPERATIONS = ['view', 'create', 'update', 'delete']
+CAMERA_REQUIRED_GROUPS = {'people', 'vehicle', 'heatmap'}
+FREE_TAGS = {'dashboard', 'reports_view', 'companysettings_view'}
+
+PACKAGES = {
+    'Synthetic Basic': 0.3,
+    'Synthetic Pro': 0.6,
+    'Synthetic Enterprise': 1.0,
+}
+
+AUDIT_PATHS = [
+    ('/api/v1/token/validate/', 'GET'),
+    ('/api/v1/features/', 'GET'),
+    ('/api/v1/permission-list/', 'GET'),
+    ('/api/v1/users/', 'GET'),
+    ('/api/v1/branch/', 'GET'),
+    ('/api/v1/{branch}/user-branch-layout/', 'GET'),
+    ('/api/v1/{branch}/user-branch-layout/', 'PUT'),
+    ('/api/v1/users/{user}/', 'PATCH'),
+    ('/api/v1/token/', 'POST'),
+    ('/api/v1/subscription-history/', 'GET'),
+]
+AUDIT_PATH_WEIGHTS = [30, 15, 15, 8, 8, 10, 3, 2, 6, 3]
+AUDIT_STATUS = [200, 201, 204, 400, 401, 403, 404, 500]
+AUDIT_STATUS_WEIGHTS = [80, 3, 1, 5, 5, 2, 3, 1]
+
+
+class SyntheticTenantGenerator:
+    """
+    Build a synthetic tenant graph with the shape of production data:
+    companies with an owner and a subscription, branches, users assigned to
+    a few branches each with ``UserBranchFeatures`` and layouts, and request
+    audit logs. Wide tables go through ``bulk_create``, narrow high volume
+    ones (M2M through rows, audit logs) through ``copy_rows``.
+    """
+
+    def __init__(self, companies, branches_per_company, users_per_company,
+                 features_per_user=8, audit_logs=0, audit_days=30,
+                 password='Synthetic#12345', seed=None, company_batch=5,
+                 batch_size=5000, effective_permissions=True, log=print):
+        self.companies = companies
+        self.branches_per_company = branches_per_company
+        self.users_per_company = users_per_company
+        self.features_per_user = features_per_user
+        self.audit_logs = audit_logs
+        self.audit_days = audit_days
+        self.company_batch = company_batch
+        self.batch_size = batch_size
+        self.effective_permissions = effective_permissions
+        self.log = log
+
+        self.random = random.Random(seed)
+        self.fake = Faker()
+        if seed is not None:
+            self.fake.seed_instance(seed)
+        # Prefix keeps unique names apart across runs
+        self.run_id = uuid.UUID(int=self.random.getrandbits(128)).hex[:8]
+        # Hashing is deliberately slow; every user shares one hash
+        self.password = make_password(password)
+
+        self.counts = {}
+        self.user_ids = []
+        self.branch_ids = []
+        self.company_ids = []
+
+    def count(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def run(self):
+        start = time.perf_counter()
+        self.features = self.ensure_features()
+        self.features_by_tag = {feature.tag: feature for feature in self.features.values()}
+        self.free_ids = [fid for fid, feature in self.features.items()
+                         if feature.feature_type == 'free']
+        self.packages = self.ensure_packages()
+
+        for offset in range(0, self.companies, self.company_batch):
+            size = min(self.company_batch, self.companies - offset)
+            with transaction.atomic():
+                self.create_tenants(offset, size)
+            self.log(f"tenants {offset + size}/{self.companies} "
+                     f"({time.perf_counter() - start:.1f}s)")
+
+        if self.audit_logs:
+            with transaction.atomic():
+                self.create_audit_logs()
+            self.log(f"audit logs {self.audit_logs} ({time.perf_counter() - start:.1f}s)")
+
+        if self.effective_permissions and self.company_ids:
+            inserted, _ = rebuild_effective_permissions(company_ids=self.company_ids)
+            self.count('effective_permission', inserted)
+            self.log(f"effective permissions ({time.perf_counter() - start:.1f}s)")
+
+        self.counts['seconds'] = round(time.perf_counter() - start, 1)
+        return self.counts
+
+    def ensure_features(self):
+        if not AppFeature.objects.exists():
+            tags = ['dashboard', 'camera_live', 'camera_playback']
+            tags += [f"{group}_{operation}" for group in FEATURE_GROUPS
+                     for operation in FEATURE_OPERATIONS]
+            created = AppFeature.objects.bulk_create([
+                AppFeature(
+                    name=tag.replace('_', ' ').title(), tag=tag, order=order,
+                    feature_type='free' if tag in FREE_TAGS else
+                    'depends' if tag.startswith('camera_') else 'paid',
+                    required='camera' if tag.split('_')[0] in CAMERA_REQUIRED_GROUPS else None,
+                    price=round(self.random.uniform(5, 50), 2),
+                )
+                for order, tag in enumerate(tags)
+            ])
+            self.count('app_feature', len(created))
+        return {feature.id: feature for feature in AppFeature.objects.all()}
+
+    def ensure_packages(self):
+        paid = sorted(fid for fid, feature in self.features.items()
+                      if feature.feature_type != 'free')
+        packages = []
+        for name, share in PACKAGES.items():
+            package, created = Subscription.objects.get_or_create(
+                package_name=name, defaults={'package_price': int(share * 1000)})
+            if created:
+                package.features.set(paid[:max(1, int(len(paid) * share))])
+            packages.append((package, list(package.features.values_list('id', flat=True))))
+        return packages
+
+    def create_tenants(self, offset, size):
+        fake = self.fake
+        rnd = self.random
+
+        companies = Company.objects.bulk_create([
+            Company(name=f"{fake.company()} {self.run_id}-{offset + i}",
+                    name_ar=f"{fake.company()} {self.run_id}-{offset + i}",
+                    subdomain=f"{self.run_id}-{offset + i}",
+                    address=fake.address())
+            for i in range(size)
+        ])
+        self.company_ids += [company.id for company in companies]
+        self.count('company', len(companies))
+
+        owners = MyUser.objects.bulk_create([
+            MyUser(company=company, email=f"owner@{company.subdomain}.example.com",
+                   name=fake.name(), password=self.password, is_owner=True,
+                   is_admin=True, is_verified=True, company_create=True,
+                   branch_create=True)
+            for company in companies
+        ], batch_size=self.batch_size)
+
+        package_of = {company.id: rnd.choice(self.packages) for company in companies}
+        histories = SubscriptionHistory.objects.bulk_create([
+            SubscriptionHistory(
+                user=owner, company=owner.company, subscription=package_of[owner.company_id][0],
+                package_duration=12, paid=True, is_active=True,
+                payment=package_of[owner.company_id][0].package_price,
+                registration_step='completed',
+                end_date=timezone.now() + timedelta(days=rnd.randint(30, 365)))
+            for owner in owners
+        ])
+        self.count('subscription_history', len(histories))
+        self.copy_through(SubscriptionHistory.features.through,
+                          ['subscriptionhistory_id', 'appfeature_id'],
+                          ((history.id, fid) for history in histories
+                           for fid in package_of[history.company_id][1]))
+
+        branches = Branch.objects.bulk_create([
+            Branch(company=company, created_by=owners[i], name=f"{fake.city()} {j + 1}",
+                   location=fake.street_address())
+            for i, company in enumerate(companies)
+            for j in range(self.branches_per_company)
+        ], batch_size=self.batch_size)
+        self.branch_ids += [branch.id for branch in branches]
+        self.count('branch', len(branches))
+        run_number = int(self.run_id, 16) % 10 ** 6
+        contacts = Contact.objects.bulk_create([
+            Contact(company_id=branch.company_id, branch=branch,
+                    email=f"branch-{branch.id}@{self.run_id}.example.com",
+                    phone_number=f"+9{run_number:06d}{branch.id:07d}")
+            for branch in branches
+        ], batch_size=self.batch_size)
+        self.count('contact', len(contacts))
+        self.copy_through(Branch.features.through, ['branch_id', 'appfeature_id'],
+                          ((branch.id, fid) for branch in branches
+                           for fid in package_of[branch.company_id][1]))
+
+        users = MyUser.objects.bulk_create([
+            MyUser(company=company,
+                   email=f"{fake.user_name()}.{j}@{company.subdomain}.example.com",
+                   name=fake.name(), password=self.password, is_verified=True,
+                   is_staff=rnd.random() < 0.1, is_admin=rnd.random() < 0.05)
+            for company in companies
+            for j in range(self.users_per_company)
+        ], batch_size=self.batch_size)
+        self.user_ids += [user.id for user in users]
+        self.count('user', len(users) + len(owners))
+
+        MyUserDetails.objects.bulk_create([
+            MyUserDetails(
+                user=user, address=fake.street_address(), phone_number=fake.msisdn()[:20],
+                date_of_birth=fake.date_of_birth(minimum_age=18, maximum_age=65),
+                blood_group=rnd.choice(MyUserDetails.BLOOD_GROUP_CHOICES)[0],
+                gender=rnd.choice(MyUserDetails.GENDER_CHOICES)[0])
+            for user in users
+        ], batch_size=self.batch_size)
+
+        branches_by_company = {}
+        for branch in branches:
+            branches_by_company.setdefault(branch.company_id, []).append(branch)
+
+        # Each user works in one to three branches; owners see every branch
+        assignments = []
+        for user in users:
+            company_branches = branches_by_company[user.company_id]
+            count = min(len(company_branches), rnd.choice([1, 1, 1, 2, 2, 3]))
+            assignments += [(user, branch) for branch in rnd.sample(company_branches, count)]
+        self.copy_through(MyUser.assigned_branches.through, ['myuser_id', 'branch_id'],
+                          ((user.id, branch.id) for user, branch in assignments))
+        assignments += [(owner, branch) for owner in owners
+                        for branch in branches_by_company[owner.company_id]]
+
+        ubfs = UserBranchFeatures.objects.bulk_create([
+            UserBranchFeatures(user=user, branch=branch) for user, branch in assignments
+        ], batch_size=self.batch_size)
+        self.count('user_branch_features', len(ubfs))
+
+        granted = []
+        layouts = []
+        for ubf, (user, branch) in zip(ubfs, assignments):
+            offered = package_of[branch.company_id][1] + self.free_ids
+            if user.is_owner:
+                feature_ids = offered
+            else:
+                wanted = round(rnd.gauss(self.features_per_user, self.features_per_user / 3))
+                feature_ids = rnd.sample(offered, max(1, min(len(offered), wanted)))
+            granted += [(ubf.id, fid) for fid in feature_ids]
+            layouts.append(UserBranchLayout(
+                user=user, branch=branch, position=position_make_json(
+                    [self.features[fid] for fid in feature_ids],
+                    features_by_tag=self.features_by_tag)))
+
+        self.copy_through(UserBranchFeatures.features.through,
+                          ['userbranchfeatures_id', 'appfeature_id'], granted)
+        UserBranchLayout.objects.bulk_create(layouts, batch_size=self.batch_size)
+        self.count('user_branch_layout', len(layouts))
+
+    def copy_through(self, model, columns, rows):
+        self.count(model._meta.db_table, copy_rows(model, columns, rows, self.batch_size))
+
+    def create_audit_logs(self):
+        rnd = self.random
+        # Faker is slow per call; sample from pools instead
+        ips = [self.fake.ipv4() for _ in range(2000)]
+        agents = [self.fake.user_agent() for _ in range(200)]
+        now = timezone.now()
+        span = self.audit_days * 86400
+
+        rollups = Counter()
+
+        def rows():
+            for _ in range(self.audit_logs):
+                path, method = rnd.choices(AUDIT_PATHS, AUDIT_PATH_WEIGHTS)[0]
+                user_id = rnd.choice(self.user_ids) if self.user_ids and rnd.random() < 0.85 else None
+                row = (
+                    user_id, rnd.choice(ips), rnd.choice(agents),
+                    path.format(branch=rnd.choice(self.branch_ids) if self.branch_ids else 1,
+                                user=user_id or 1),
+                    method, now - timedelta(seconds=rnd.randrange(span)),
+                    rnd.choices(AUDIT_STATUS, AUDIT_STATUS_WEIGHTS)[0], 1.0,
+                )
+                rollups.update(rollup_counts([(row[3], row[6], row[5], row[7])]))
+                yield row
+
+        written = copy_rows(
+            RequestAuditLog,
+            ['user_id', 'ip_address', 'user_agent', 'path', 'method', 'timestamp', 'status_code',
+             'sample_rate'],
+            rows(), self.batch_size)
+        self.count('request_audit_log', written)
+        add_rollups(rollups)
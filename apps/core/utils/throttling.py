@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# Token bucket evaluated atomically inside Redis so a single EVALSHA round
+# trip both refills the bucket and decides the request.
+#   KEYS[1] -> bucket key
+#   ARGV    -> capacity, refill rate (tokens/second), now (seconds), cost
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(wait)}
+"""
+
+PERIODS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 86400, 'day': 86400,
+}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate definition into ``(capacity, refill_per_second)``.
+
+    Accepts the DRF style ``"5/min"`` string, where the bucket holds five
+    tokens and refills them evenly over a minute, or a dict with an explicit
+    burst size: ``{"rate": "5/min", "burst": 10}``.
+    """
+    burst = None
+    if isinstance(rate, dict):
+        burst = rate.get('burst')
+        rate = rate['rate']
+
+    num, period = rate.split('/')
+    num = int(num)
+    seconds = PERIODS.get(period.strip().lower())
+    if not num or not seconds:
+        raise ImproperlyConfigured(f"Invalid throttle rate: {rate!r}")
+
+    capacity = int(burst) if burst else num
+    return capacity, num / seconds
+
+
+class RedisTokenBucketBackend:
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+        self.error = redis.RedisError
+
+    def consume(self, key, capacity, rate, cost=1):
+        try:
+            allowed, wait = self.script(
+                keys=[key], args=[capacity, rate, time.time(), cost])
+        except self.error as e:
+            # Fail open: an unreachable Redis must not take logins down
+            logger.warning("Throttle backend unavailable, allowing %s: %s", key, e)
+            return True, 0.0
+        return bool(allowed), float(wait)
+
+    def reset(self, key):
+        self.client.delete(key)
+
+
+class LocalTokenBucketBackend:
+    """
+    In-process token bucket with the same semantics as the Lua script.
+    Used for tests and single-process development servers.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return True, 0.0
+            self.buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+    def reset(self, key=None):
+        with self.lock:
+            if key is None:
+                self.buckets.clear()
+            else:
+                self.buckets.pop(key, None)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_throttle_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'THROTTLE_BACKEND', 'redis')
+                if name == 'redis':
+                    _backend = RedisTokenBucketBackend(settings.REDIS_URL)
+                elif name == 'local':
+                    _backend = LocalTokenBucketBackend()
+                else:
+                    raise ImproperlyConfigured(
+                        f"Unsupported THROTTLE_BACKEND: {name!r}")
+    return _backend
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base token bucket throttle.
+
+    The view declares ``throttle_scope`` and the rate is looked up in
+    ``settings.THROTTLE_RATES`` under ``"<scope>.<kind>"``, e.g.
+    ``"login.ip"``. Scopes without a configured rate are not throttled.
+    """
+    kind = None
+    cache_prefix = 'throttle'
+
+    def get_ident_value(self, request, view):
+        raise NotImplementedError(
+            '.get_ident_value() must be overridden')
+
+    def get_rate(self, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if not scope:
+            return None
+        return getattr(settings, 'THROTTLE_RATES', {}).get(f"{scope}.{self.kind}")
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        rate = self.get_rate(view)
+        if rate is None:
+            return True
+
+        ident = self.get_ident_value(request, view)
+        if ident is None:
+            return True
+
+        capacity, refill = parse_rate(rate)
+        key = f"{self.cache_prefix}:{view.throttle_scope}:{self.kind}:{ident}"
+        allowed, wait = get_throttle_backend().consume(key, capacity, refill)
+        if not allowed:
+            self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_ident_value(self, request, view):
+        return self.get_ident(request)
+
+
+class EmailTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'email'
+
+    def get_ident_value(self, request, view):
+        email = request.data.get('email') if hasattr(request, 'data') else None
+        if not email or not isinstance(email, str):
+            return None
+        return email.strip().lower()
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'user'
+
+    def get_ident_value(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
+
+
+AUTH_THROTTLE_CLASSES = [IPTokenBucketThrottle,
+                         EmailTokenBucketThrottle, UserTokenBucketThrottle]
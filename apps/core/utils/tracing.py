@@ -0,0 +1,188 @@
+"""
+OpenTelemetry tracing.
+
+``configure_tracing()`` installs the tracer provider of this process: once
+per web process (``TracingMiddleware``) and once per Celery worker
+(``worker_init``). Until then, and whenever ``TRACING_EXPORTER`` is
+empty, every span below is a no-op.
+
+Spans are exported in batches either to a collector over OTLP/HTTP
+(``otlp``) or as one JSON object per line to ``TRACING_FILE`` (``file``).
+Trace context crosses into Celery tasks in the message headers, so a task
+shows up under the request that queued it.
+"""
+
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (BatchSpanProcessor,
+                                            ConsoleSpanExporter)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+tracer = trace.get_tracer('apps')
+
+# Statements are cut to this length in span attributes
+MAX_STATEMENT_LENGTH = 2000
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def tracing_enabled():
+    return bool(getattr(settings, 'TRACING_EXPORTER', ''))
+
+
+def make_exporter(name):
+    if name == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import \
+            OTLPSpanExporter
+
+        return OTLPSpanExporter(endpoint=settings.TRACING_ENDPOINT)
+    if name == 'file':
+        # One span per line; the file stays open for the process lifetime
+        path = settings.TRACING_FILE
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(path, 'a', buffering=1),
+            formatter=lambda span: span.to_json(indent=None) + '\n')
+    raise ImproperlyConfigured(f"Unsupported TRACING_EXPORTER: {name!r}")
+
+
+def configure_tracing(service_name):
+    """
+    Install the tracer provider and the query span wrapper. Safe to call
+    more than once; only the first call with tracing enabled does anything.
+
+    Returns:
+        bool: Whether tracing is enabled.
+    """
+    global _configured
+    if not tracing_enabled():
+        return False
+    with _configure_lock:
+        if _configured:
+            return True
+        provider = TracerProvider(
+            resource=Resource.create({'service.name': service_name}),
+            sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE)))
+        provider.add_span_processor(
+            BatchSpanProcessor(make_exporter(settings.TRACING_EXPORTER)))
+        trace.set_tracer_provider(provider)
+        connection_created.connect(install_query_tracing, weak=False)
+        _configured = True
+    return True
+
+
+def trace_query(execute, sql, params, many, context):
+    """
+    ``connection.execute_wrapper`` that puts every query of a traced
+    operation in its own span.
+    """
+    if not trace.get_current_span().is_recording():
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    with tracer.start_as_current_span(
+            'db.query', kind=SpanKind.CLIENT, attributes={
+                'db.system': connection.vendor,
+                'db.name': str(connection.settings_dict['NAME']),
+                'db.statement': sql[:MAX_STATEMENT_LENGTH],
+                'db.executemany': many,
+            }):
+        return execute(sql, params, many, context)
+
+
+def install_query_tracing(sender, connection, **kwargs):
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+_task_spans = {}
+
+
+def _before_publish(sender=None, headers=None, **kwargs):
+    if headers is None:
+        return
+    task_id = headers.get('id')
+    span = tracer.start_span(
+        f'celery.publish {sender}', kind=SpanKind.PRODUCER,
+        attributes={'celery.task_name': str(sender), 'celery.task_id': str(task_id)})
+    _task_spans[('publish', task_id)] = (span, None)
+    # Read back by the worker from task.request
+    propagate.inject(headers, context=trace.set_span_in_context(span))
+
+
+def _after_publish(sender=None, headers=None, **kwargs):
+    if headers is not None:
+        _end_task_span(('publish', headers.get('id')))
+
+
+def _end_task_span(key):
+    entry = _task_spans.pop(key, None)
+    if entry:
+        span, token = entry
+        if token is not None:
+            context.detach(token)
+        span.end()
+
+
+class _RequestGetter:
+    def get(self, carrier, key):
+        value = getattr(carrier, key, None)
+        return [value] if isinstance(value, str) else None
+
+    def keys(self, carrier):
+        return []
+
+
+def _task_prerun(task_id=None, task=None, **kwargs):
+    # Eager runs carry no trace headers and run inline, under the caller's span
+    parent = propagate.extract(task.request, context=context.get_current(),
+                               getter=_RequestGetter())
+    span = tracer.start_span(
+        f'celery.task {task.name}', context=parent, kind=SpanKind.CONSUMER,
+        attributes={'celery.task_name': task.name, 'celery.task_id': str(task_id),
+                    'celery.retries': task.request.retries or 0})
+    # Queries and mail sent by the task become children of its span
+    token = context.attach(trace.set_span_in_context(span, parent))
+    _task_spans[('run', task_id)] = (span, token)
+
+
+def _task_failure(task_id=None, exception=None, **kwargs):
+    entry = _task_spans.get(('run', task_id))
+    if entry and exception is not None:
+        entry[0].record_exception(exception)
+        entry[0].set_status(Status(StatusCode.ERROR, str(exception)))
+
+
+def _task_postrun(task_id=None, state=None, **kwargs):
+    entry = _task_spans.get(('run', task_id))
+    if entry and state:
+        entry[0].set_attribute('celery.state', state)
+    _end_task_span(('run', task_id))
+
+
+def connect_celery_tracing():
+    """
+    Trace task publish and execution; call once from the Celery app module.
+    """
+    from celery.signals import (after_task_publish, before_task_publish,
+                                task_failure, task_postrun, task_prerun,
+                                worker_init)
+
+    before_task_publish.connect(_before_publish, weak=False)
+    after_task_publish.connect(_after_publish, weak=False)
+    task_prerun.connect(_task_prerun, weak=False)
+    task_failure.connect(_task_failure, weak=False)
+    task_postrun.connect(_task_postrun, weak=False)
+    # Prefork children inherit the provider; the batch exporter restarts
+    # its thread after fork
+    worker_init.connect(
+        lambda **kwargs: configure_tracing(f'{settings.TRACING_SERVICE_NAME}-celery'),
+        weak=False)
@@ -1,3 +1,4 @@
+from django.utils.functional import SimpleLazyObject, empty
 from rest_framework.exceptions import AuthenticationFailed
 
 
@@ -18,3 +19,20 @@ def user_branches_company(request):
     elif user.is_owner:
         branches = Branch.objects.filter(company=company)
     return user, company, branches
+
+
+def resolved_user_id(request):
+    """
+    Id of the user that authentication already resolved for ``request``, or
+    None. Never authenticates by itself: DRF and the async views store their
+    JWT user on the Django request, and the lazy session user is only read
+    if something evaluated it already.
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = user._wrapped
+        if user is empty:
+            return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from apps.core.utils import EstimatedCountPaginator
 from apps.users.models import (AppFeature, Branch, Company, CompanyOTP,
                                Contact, MyUser, MyUserDetails, RequestAuditLog,
-                               Subscription, SubscriptionHistory,
-                               UserBranchFeatures, UserBranchLayout)
+                               RequestAuditRollup, Subscription,
+                               SubscriptionHistory, UserBranchFeatures,
+                               UserBranchLayout)
 
 
 @admin.register(AppFeature)
@@ -114,6 +116,18 @@ class CompanyOTPAdmin(admin.ModelAdmin):
 class RequestAuditAdmin(admin.ModelAdmin):
     list_display = ("user", "ip_address", "user_agent", "path",
                     "method", "timestamp", "status_code")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    # Estimated page count, and no second COUNT(*) for the unfiltered total
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(RequestAuditRollup)
+class RequestAuditRollupAdmin(admin.ModelAdmin):
+    list_display = ("hour", "path", "requests", "client_errors", "server_errors")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(UserBranchLayout)
@@ -11,12 +11,15 @@ from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenObtainSerializer)
 
-from apps.core.utils import (send_custom_email,
+from apps.core.utils import (apply_user_branch_features, send_custom_email,
                              user_branches_company, generate_unique_token)
+from apps.core.utils.image_variants import image_url
 from apps.core.utils.position_json import (position_make_json)
 from apps.users.models import (AppFeature, Branch, Company, Contact, MyUser,
-                               MyUserDetails, Subscription,
+                               MyUserDetails, RequestAuditLog, Subscription,
                                SubscriptionHistory, UserBranchFeatures,
                                UserBranchLayout)
 
@@ -58,19 +61,10 @@ class CompanySerializer(serializers.ModelSerializer):
         created_branch = getattr(self, '_created_branch', None)
         if created_branch:
             representation['created_branch_id'] = created_branch.id
-        return representation
-
-    def get_logo(self, obj):
-        request = self.context.get('request')
-        if obj.logo and hasattr(obj.logo, 'url'):
-            return request.build_absolute_uri(obj.logo.url)
-        return None
-
-    def get_fav_icon(self, obj):
         request = self.context.get('request')
-        if obj.fav_icon and hasattr(obj.fav_icon, 'url'):
-            return request.build_absolute_uri(obj.fav_icon.url)
-        return None
+        representation['logo'] = image_url(instance, 'logo', request)
+        representation['fav_icon'] = image_url(instance, 'fav_icon', request)
+        return representation
 
     def validate(self, attrs):
         request = self.context['request']
@@ -495,20 +489,13 @@ class MyUserSerializer(serializers.ModelSerializer):
         data['company'] = CompanySerializer(
             instance.company, context=self.context).data if instance.company else None
 
-        def absolute_uri_or_none(file_field):
-            if file_field:
-                if request:
-                    return request.build_absolute_uri(file_field.url)
-                return file_field.url  # fallback to relative path
-            return None
-
         if details:
             data.update({
                 'address': details.address,
                 'phone_number': details.phone_number,
                 'date_of_birth': details.date_of_birth,
-                'profile_picture': absolute_uri_or_none(details.profile_picture) if details.profile_picture else None,
-                'user_signature': absolute_uri_or_none(details.user_signature) if details.user_signature else None,
+                'profile_picture': image_url(details, 'profile_picture', request),
+                'user_signature': image_url(details, 'user_signature', request),
                 'blood_group': details.blood_group,
                 'gender': details.gender,
             })
@@ -558,7 +545,9 @@ class MyUserSerializer(serializers.ModelSerializer):
                     "One or more branch IDs are invalid.")
             data['assigned_branches'] = branches
 
-        data['features_branch_data'] = features_branch_input_json
+        # Only a supplied input means "replace the permissions"
+        if features_branch_input is not None:
+            data['features_branch_data'] = features_branch_input_json
 
         password = data.get('password')
         confirm_password = data.get('confirm_password')
@@ -692,31 +681,64 @@ class MyUserSerializer(serializers.ModelSerializer):
             setattr(details_instance, attr, value)
         details_instance.save()
 
-        # 🔄 Update UserBranchFeatures
+        # 🔄 Update UserBranchFeatures: write only what changed
         if features_branch_data is not None:
-            # Clear old mappings first to prevent duplicates (optional)
-            UserBranchFeatures.objects.filter(user=instance).delete()
+            allowed_branch_ids = {branch.id for branch in branches} \
+                if branches is not None else None
+            with transaction.atomic():
+                self.permission_changes = apply_user_branch_features(
+                    instance, features_branch_data, allowed_branch_ids)
 
-            for item in features_branch_data:
-                branch_id = item.get('branch_id')
-                feature_ids = item.get('features', [])
+        return instance
 
-                if not branch_id or not isinstance(feature_ids, list):
-                    continue
 
-                try:
-                    branch = Branch.objects.get(id=branch_id)
-                    features = AppFeature.objects.filter(id__in=feature_ids)
-                except Branch.DoesNotExist:
-                    continue
+class BulkPermissionSerializer(serializers.Serializer):
+    users = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False)
+    branches = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False)
+    features = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False)
+    action = serializers.ChoiceField(choices=['grant', 'revoke'])
 
-                user_branch_feature = UserBranchFeatures.objects.create(
-                    user=instance,
-                    branch=branch
-                )
-                user_branch_feature.features.set(features)
+    def validate(self, attrs):
+        request = self.context['request']
+        user, company, branches = user_branches_company(request)
 
-        return instance
+        user_ids = set(attrs['users'])
+        branch_ids = set(attrs['branches'])
+        feature_ids = set(attrs['features'])
+
+        if user.id in user_ids:
+            raise serializers.ValidationError({
+                "users": "You cannot update your own features."
+            })
+
+        found_branches = set(branches.filter(
+            id__in=branch_ids).values_list('id', flat=True))
+        if found_branches != branch_ids:
+            raise serializers.ValidationError({
+                "branches": f"Branches {sorted(branch_ids - found_branches)} are invalid or not accessible."
+            })
+
+        users = MyUser.objects.filter(id__in=user_ids)
+        if not user.is_superuser:
+            users = users.filter(company=company)
+        found_users = set(users.values_list('id', flat=True))
+        if found_users != user_ids:
+            raise serializers.ValidationError({
+                "users": f"Users {sorted(user_ids - found_users)} are invalid or not accessible."
+            })
+
+        found_features = set(AppFeature.objects.filter(
+            id__in=feature_ids).values_list('id', flat=True))
+        if found_features != feature_ids:
+            raise serializers.ValidationError({
+                "features": f"Unknown feature IDs {sorted(feature_ids - found_features)}."
+            })
+
+        attrs.update(users=user_ids, branches=branch_ids, features=feature_ids)
+        return attrs
 
 
 class RegisterUserSerializer(serializers.ModelSerializer):
@@ -760,6 +782,28 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         return user
 
 
+class LoginSerializer(TokenObtainPairSerializer):
+    """
+    Authenticates once and keeps the loaded user on ``self.user`` so the
+    view does not look it up again. Tokens are only issued when the user
+    does not have to complete a two-step OTP verification first.
+    """
+
+    def validate(self, attrs):
+        from apps.core.utils.tracing import tracer
+
+        # Password hashing dominates login time
+        with tracer.start_as_current_span('auth.authenticate'):
+            data = TokenObtainSerializer.validate(self, attrs)
+
+        if not self.user.is_two_step:
+            refresh = self.get_token(self.user)
+            data["refresh"] = str(refresh)
+            data["access"] = str(refresh.access_token)
+
+        return data
+
+
 class OTPVerificationSerializer(serializers.Serializer):
     email = serializers.EmailField()
     otp = serializers.CharField(max_length=6)
@@ -767,7 +811,8 @@ class OTPVerificationSerializer(serializers.Serializer):
     def validate(self, attrs):
         otp = attrs.get('otp')
         email = attrs.get('email')
-        user = MyUser.objects.get(email=email)
+        # Reuse the user the view already loaded, if any
+        user = self.context.get('user') or MyUser.objects.get(email=email)
 
         if not user or not user.is_authenticated:
             raise serializers.ValidationError(
@@ -788,7 +833,7 @@ class OTPVerificationSerializer(serializers.Serializer):
         user = self.validated_data['user']
         user.is_verified = True
         user.otp = None  # Clear the OTP
-        user.save()
+        user.save(update_fields=['is_verified', 'otp'])
         return user
 
 
@@ -809,6 +854,13 @@ class MyUserDetailsSerializer(serializers.ModelSerializer):
             'profile_picture', 'user_signature', 'blood_group', 'gender'
         ]
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        data['profile_picture'] = image_url(instance, 'profile_picture', request)
+        data['user_signature'] = image_url(instance, 'user_signature', request)
+        return data
+
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     features = serializers.PrimaryKeyRelatedField(
@@ -915,3 +967,10 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         except DjangoValidationError as e:
             raise DRFValidationError({'password': list(e.messages)})
         return data
+
+
+class RequestAuditLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestAuditLog
+        fields = ['id', 'user', 'ip_address', 'user_agent', 'path', 'method',
+                  'status_code', 'timestamp', 'sample_rate']
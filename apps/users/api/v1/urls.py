@@ -1,6 +1,13 @@
 from django.urls import path
 
-from apps.users.api.v1.views import (BranchGetUpdateDeleteView,
+from apps.users.api.v1.views import (AsyncFeaturesListView,
+                                     AsyncRetrievePermissionListAPIView,
+                                     AsyncTokenValidateView,
+                                     AsyncUserBranchLayoutAPIView,
+                                     AuditErrorRateView, AuditHourlyView,
+                                     AuditLogListView,
+                                     BranchGetUpdateDeleteView,
+                                     BulkPermissionView,
                                      BranchListCreateView,
                                      CompanyGetUpdateView,
                                      CompanyListCreateView,
@@ -16,6 +23,7 @@ from apps.users.api.v1.views import (BranchGetUpdateDeleteView,
                                      SubscriptionRetrieveUpdateDestroyView,
                                      TokenValidateView,
                                      UserBranchLayoutAPIView,
+                                     UserBulkImportView,
                                      UserGetUpdateView, UserListCreateView,
                                      UserRegistrationView,
                                      UserRetrievePermissionListAPIView,
@@ -42,10 +50,11 @@ urlpatterns = [
     path('company/', CompanyGetUpdateView.as_view(), name="company"),
     path('companies/', CompanyListCreateView.as_view(), name='company-details'),
     path('users/', UserListCreateView.as_view(), name='user-list-create'),
-    path('users/<int:pk>/', UserGetUpdateView.as_view(), name='user-list-create'),
+    path('users/import/', UserBulkImportView.as_view(), name='user-bulk-import'),
+    path('users/<int:pk>/', UserGetUpdateView.as_view(), name='user-detail'),
     path('branch/', BranchListCreateView.as_view(), name="branch_create_list"),
     path('branch/<int:pk>/', BranchGetUpdateDeleteView.as_view(),
-         name="branch_create_list"),
+         name="branch_detail"),
     path('features/', FeaturesListView.as_view(), name="features_list"),
     path('subscription/', SubscriptionListCreateView.as_view(),
          name='subscription-list'),
@@ -62,6 +71,23 @@ urlpatterns = [
     path('permission-list/',
          RetrievePermissionListAPIView.as_view(), name='retrieve-permission-list'),
 
+    path('permissions/bulk/',
+         BulkPermissionView.as_view(), name='bulk-permission-update'),
+
     path('user/permission-list/<int:user_id>/',
          UserRetrievePermissionListAPIView.as_view(), name='user-retrieve-permission-list'),
+
+    path('audit-logs/', AuditLogListView.as_view(), name='audit-log-list'),
+    path('audit-logs/hourly/', AuditHourlyView.as_view(), name='audit-log-hourly'),
+    path('audit-logs/error-rates/', AuditErrorRateView.as_view(), name='audit-log-error-rates'),
+
+    # Async variants, served natively when running under ASGI
+    path('async/token/validate/', AsyncTokenValidateView.as_view(),
+         name='token_validate_with_user_details_async'),
+    path('async/features/', AsyncFeaturesListView.as_view(),
+         name='features_list_async'),
+    path('async/<int:branch_id>/user-branch-layout/',
+         AsyncUserBranchLayoutAPIView.as_view(), name='userbranchlayout-get-async'),
+    path('async/permission-list/',
+         AsyncRetrievePermissionListAPIView.as_view(), name='retrieve-permission-list-async'),
 ]
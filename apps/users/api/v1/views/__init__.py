@@ -1,4 +1,5 @@
-from .auth_view import (CompanyGetUpdateView, CompanyListCreateView,
+from .auth_view import (BulkPermissionView, CompanyGetUpdateView,
+                        CompanyListCreateView,
                         CustomTokenObtainPairView, FeaturesListView,
                         ForgotPasswordView, GetCookieView, LogoutView,
                         PasswordResetConfirmView, ResendOTPView,
@@ -8,11 +9,16 @@ from .auth_view import (CompanyGetUpdateView, CompanyListCreateView,
                         SubscriptionListCreateView,
                         SubscriptionRetrieveUpdateDestroyView,
                         TokenValidateView, UserBranchLayoutAPIView,
+                        UserBulkImportView,
                         UserGetUpdateView, UserListCreateView,
                         UserRegistrationView,
                         UserRetrievePermissionListAPIView, ValidPaymentToken,
                         VerifyOTPView)
+from .async_view import (AsyncFeaturesListView,
+                         AsyncRetrievePermissionListAPIView,
+                         AsyncTokenValidateView, AsyncUserBranchLayoutAPIView)
+from .audit_view import AuditErrorRateView, AuditHourlyView, AuditLogListView
 from .branch_view import BranchGetUpdateDeleteView, BranchListCreateView
 
 __all__ = ["ForgotPasswordView", "PasswordResetConfirmView", "SubscriptionHistoryListCreateView", "SubscriptionListCreateView", "SubscriptionRetrieveUpdateDestroyView", "SubscriptionHistoryDetailUpdateDeleteView", "UserListCreateView", "FeaturesListView", "UserRegistrationView",
-           "VerifyOTPView", "ResendOTPView", "UserGetUpdateView", "CustomTokenObtainPairView", "LogoutView", "TokenValidateView", "GetCookieView", "CompanyListCreateView", "CompanyGetUpdateView", "BranchListCreateView", "BranchGetUpdateDeleteView", "ValidPaymentToken", "UserBranchLayoutAPIView", "RetrievePermissionListAPIView", "UserRetrievePermissionListAPIView", "ResetPasswordView"]
+           "VerifyOTPView", "ResendOTPView", "UserGetUpdateView", "CustomTokenObtainPairView", "LogoutView", "TokenValidateView", "GetCookieView", "CompanyListCreateView", "CompanyGetUpdateView", "BranchListCreateView", "BranchGetUpdateDeleteView", "ValidPaymentToken", "UserBranchLayoutAPIView", "RetrievePermissionListAPIView", "UserRetrievePermissionListAPIView", "ResetPasswordView", "UserBulkImportView", "BulkPermissionView", "AsyncTokenValidateView", "AsyncFeaturesListView", "AsyncUserBranchLayoutAPIView", "AsyncRetrievePermissionListAPIView", "AuditLogListView", "AuditHourlyView", "AuditErrorRateView"]
@@ -0,0 +1,257 @@
+"""
+Async variants of the hot read endpoints.
+
+DRF's APIView is sync only, so these are plain Django class based views with
+``async`` handlers. Under ASGI they run on the event loop and use the async
+ORM, so a worker is not tied up while the database answers.
+"""
+
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import (APIException, AuthenticationFailed,
+                                       NotFound)
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.core.utils import aget_cached_permissions, aset_cached_permissions
+from apps.users.api.v1.serializers import (AppFeatureSerializer,
+                                           MyUserSerializer)
+from apps.users.models import (AppFeature, Branch, MyUser, UserBranchFeatures,
+                               UserBranchLayout)
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication with an async user lookup. Token validation is pure
+    CPU work and stays as is.
+    """
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                "Token contained no recognizable user identification")
+
+        try:
+            user = await MyUser.objects.select_related(
+                'company', 'user_details').aget(**{api_settings.USER_ID_FIELD: user_id})
+        except MyUser.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        return user
+
+
+def async_format_response(results, status_code=200):
+    """
+    JsonResponse counterpart of ``apps.core.utils.format_response``.
+    """
+    return JsonResponse({
+        "status": "success",
+        "message": results.get('message', 'Operation successful'),
+        "results": results.get('results', {})
+    }, status=status_code)
+
+
+class AsyncAPIView(View):
+    """
+    Authenticates with JWT and turns DRF exceptions into the same error body
+    ``CustomExceptionFormatter`` produces for the sync views.
+    """
+    authentication_class = AsyncJWTAuthentication
+    requires_authentication = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if self.requires_authentication:
+                result = await self.authentication_class().aauthenticate(request)
+                if result is None:
+                    raise AuthenticationFailed(
+                        "Authentication credentials were not provided.")
+                request.user, request.auth = result
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(exc)
+
+    def handle_exception(self, exc):
+        detail = exc.detail
+        if isinstance(detail, dict):
+            detail = detail.get('detail', next(iter(detail.values()), ''))
+        if isinstance(detail, list):
+            detail = detail[0] if detail else ''
+        return JsonResponse({"success": False, "error": str(detail)},
+                            status=exc.status_code)
+
+
+def group_features(features):
+    """
+    Group features the way RetrievePermissionListAPIView does: settings
+    features under ``company``, ``<base>_<operation>`` tags under ``<base>``
+    and the rest under ``features``.
+    """
+    grouped = defaultdict(list)
+    for feature in features:
+        tag = feature['tag'].lower()
+        if 'companysettings' in tag:
+            grouped['company'].append({
+                "id": feature['id'],
+                "name": feature['name']
+            })
+        elif '_' in tag:
+            base_name, operation = tag.split('_', 1)
+            grouped[base_name.lower()].append({
+                "id": feature['id'],
+                "name": operation.lower()
+            })
+        else:
+            grouped['features'].append({
+                "id": feature['id'],
+                "name": feature['name'],
+                "tag": feature['tag']
+            })
+    return [
+        {
+            "name": group,
+            "operations": operations
+        } for group, operations in grouped.items()
+    ]
+
+
+def user_branches_queryset(user):
+    """
+    Branch queryset visible to ``user``, same rules as user_branches_company.
+    """
+    if user.is_superuser:
+        return Branch.objects.all()
+    if user.is_owner:
+        return Branch.objects.filter(company_id=user.company_id)
+    return user.assigned_branches.all()
+
+
+class AsyncTokenValidateView(AsyncAPIView):
+
+    async def get(self, request):
+        # The serializer walks related objects, so render it in a thread
+        serializer = MyUserSerializer(request.user, context={"request": request})
+        data = await sync_to_async(lambda: serializer.data)()
+        return async_format_response(
+            {
+                "message": "Token is valid",
+                "results": data
+            }, status_code=200
+        )
+
+
+class AsyncFeaturesListView(AsyncAPIView):
+    requires_authentication = False
+
+    async def get(self, request):
+        fields = AppFeatureSerializer.Meta.fields
+        features = [
+            feature async for feature in AppFeature.objects.filter(
+                feature_type='paid').order_by('order').values(*fields)
+        ]
+        return async_format_response({
+            'message': 'Features list retrieved successfully',
+            'results': features
+        })
+
+
+class AsyncUserBranchLayoutAPIView(AsyncAPIView):
+
+    async def get(self, request, branch_id):
+        position = await UserBranchLayout.objects.filter(
+            user=request.user, branch_id=branch_id
+        ).values_list('position', flat=True).afirst()
+        if position is None:
+            raise NotFound("Layout not found for this branch.")
+        return async_format_response({
+            "message": "Layout retrieved successfully",
+            "results": position
+        }, status_code=200)
+
+
+class AsyncRetrievePermissionListAPIView(AsyncAPIView):
+    """
+    Same payload as RetrievePermissionListAPIView, built from three set
+    based queries instead of two queries per branch.
+    """
+
+    async def get(self, request):
+        user = request.user
+        branches = user_branches_queryset(user)
+
+        branches_id = request.GET.get('branches_id')
+        if branches_id:
+            branch_id_list = [int(bid.strip()) for bid in branches_id.split(
+                ',') if bid.strip().isdigit()]
+            branches = branches.filter(id__in=branch_id_list)
+
+        cache_key, result = await aget_cached_permissions(
+            user.id, 'permission-list', branches_id or '')
+        if result is not None:
+            return JsonResponse({
+                "status": "success",
+                "message": "Permission list retrieved successfully.",
+                "results": result
+            }, status=200)
+
+        branch_rows = [row async for row in branches.values('id', 'name').distinct()]
+
+        features_by_branch = defaultdict(set)
+        if user.is_owner:
+            owner_feature_ids = {
+                feature_id async for feature_id in AppFeature.objects.values_list('id', flat=True)
+            }
+            for row in branch_rows:
+                features_by_branch[row['id']] = owner_feature_ids
+        else:
+            through = UserBranchFeatures.features.through.objects.filter(
+                userbranchfeatures__user=user,
+                userbranchfeatures__branch_id__in=[row['id'] for row in branch_rows],
+            ).values_list('userbranchfeatures__branch_id', 'appfeature_id')
+            async for branch_id, feature_id in through:
+                features_by_branch[branch_id].add(feature_id)
+
+        all_feature_ids = set().union(*features_by_branch.values())
+        ordered_features = [
+            feature async for feature in AppFeature.objects.filter(
+                id__in=all_feature_ids).order_by('order').values('id', 'name', 'tag')
+        ]
+
+        result = []
+        for row in branch_rows:
+            feature_ids = features_by_branch.get(row['id'], set())
+            result.append({
+                "branch_id": row['id'],
+                "branch_name": row['name'],
+                "branch_features": group_features(
+                    feature for feature in ordered_features if feature['id'] in feature_ids)
+            })
+
+        await aset_cached_permissions(cache_key, result)
+
+        return JsonResponse({
+            "status": "success",
+            "message": "Permission list retrieved successfully.",
+            "results": result
+        }, status=200)
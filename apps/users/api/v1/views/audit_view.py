@@ -0,0 +1,148 @@
+"""
+Audit log views
+"""
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics, views
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+
+from apps.core.utils import KeysetPagination, format_response
+from apps.users.api.v1.serializers import RequestAuditLogSerializer
+from apps.users.models import RequestAuditLog, RequestAuditRollup
+
+STATUS_CLASSES = {'2xx': (200, 300), '3xx': (300, 400), '4xx': (400, 500), '5xx': (500, 600)}
+
+
+def parse_time(request, name, default=None):
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValidationError({name: "Use an ISO 8601 date and time."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_int(request, name, default=None, minimum=None):
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: "Must be an integer."})
+    if minimum is not None and value < minimum:
+        raise ValidationError({name: f"Must be at least {minimum}."})
+    return value
+
+
+def time_range(request, default_hours=24):
+    until = parse_time(request, 'until', timezone.now())
+    since = parse_time(request, 'since', until - timedelta(hours=default_hours))
+    # Rollups are per hour; include the hour ``since`` falls in
+    return since.replace(minute=0, second=0, microsecond=0), until
+
+
+def error_rate(row):
+    errors = row['client_errors'] + row['server_errors']
+    return round(errors / row['requests'], 4) if row['requests'] else 0.0
+
+
+class AuditLogListView(generics.ListAPIView):
+    """
+    Audit log, newest first, with keyset pagination. Filters: ``user``,
+    ``path`` (prefix), ``status`` (a code or ``4xx``-style class),
+    ``since`` and ``until``. Filtering by user uses the (user, timestamp)
+    index.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = RequestAuditLogSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        request = self.request
+        queryset = RequestAuditLog.objects.all()
+
+        user = parse_int(request, 'user')
+        if user is not None:
+            queryset = queryset.filter(user_id=user)
+        path = request.query_params.get('path')
+        if path:
+            queryset = queryset.filter(path__startswith=path)
+        status_filter = request.query_params.get('status')
+        if status_filter in STATUS_CLASSES:
+            low, high = STATUS_CLASSES[status_filter]
+            queryset = queryset.filter(status_code__gte=low, status_code__lt=high)
+        elif status_filter:
+            queryset = queryset.filter(status_code=parse_int(request, 'status'))
+        since = parse_time(request, 'since')
+        if since:
+            queryset = queryset.filter(timestamp__gte=since)
+        until = parse_time(request, 'until')
+        if until:
+            queryset = queryset.filter(timestamp__lt=until)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return format_response({
+            'message': 'Audit logs retrieved successfully',
+            'results': self.paginator.get_paginated_data(serializer.data)
+        })
+
+
+class AuditHourlyView(views.APIView):
+    """
+    Audited requests and errors per hour, from the rollups. Filters:
+    ``since`` and ``until`` (default: the last 24 hours) and ``path``
+    (prefix of the normalized path).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        since, until = time_range(request)
+        rollups = RequestAuditRollup.objects.filter(hour__gte=since, hour__lt=until)
+        path = request.query_params.get('path')
+        if path:
+            rollups = rollups.filter(path__startswith=path)
+        hours = list(rollups.values('hour').annotate(
+            requests=Sum('requests'), client_errors=Sum('client_errors'),
+            server_errors=Sum('server_errors')).order_by('hour'))
+        for hour in hours:
+            hour['error_rate'] = error_rate(hour)
+        return format_response({
+            'message': 'Hourly audit counts retrieved successfully',
+            'results': hours
+        })
+
+
+class AuditErrorRateView(views.APIView):
+    """
+    Error rate per normalized path over ``since``/``until`` (default: the
+    last 24 hours), from the rollups. Worst first; paths with fewer than
+    ``min_requests`` requests are left out.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        since, until = time_range(request)
+        min_requests = parse_int(request, 'min_requests', 1)
+        limit = min(parse_int(request, 'limit', 50, minimum=1), 500)
+        paths = list(RequestAuditRollup.objects.filter(
+            hour__gte=since, hour__lt=until).values('path').annotate(
+            requests=Sum('requests'), client_errors=Sum('client_errors'),
+            server_errors=Sum('server_errors')).filter(requests__gte=min_requests))
+        for path in paths:
+            path['error_rate'] = error_rate(path)
+        paths.sort(key=lambda path: (path['error_rate'], path['requests']), reverse=True)
+        return format_response({
+            'message': 'Audit error rates retrieved successfully',
+            'results': paths[:limit]
+        })
@@ -21,7 +21,7 @@ from django.utils.translation import gettext as _
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics, serializers, status, views
 from rest_framework.exceptions import NotFound, ValidationError
-from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
@@ -30,18 +30,24 @@ from rest_framework_simplejwt.token_blacklist.models import (BlacklistedToken,
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from apps.core.utils import (format_response, generate_random_token,
-                             send_custom_email, user_branches_company)
+from apps.core.utils import (AUTH_THROTTLE_CLASSES, bulk_update_permissions,
+                             format_response, generate_random_token,
+                             get_cached_permissions, import_users,
+                             parse_user_rows, send_custom_email,
+                             set_cached_permissions, user_branches_company)
 from apps.users.api.v1.serializers import (
-    AppFeatureSerializer, CompanySerializer, ForgotPasswordSerializer,
-    MyUserSerializer, OTPVerificationSerializer,
+    AppFeatureSerializer, BulkPermissionSerializer, CompanySerializer,
+    ForgotPasswordSerializer,
+    LoginSerializer, MyUserSerializer, OTPVerificationSerializer,
     PasswordResetConfirmSerializer, RegisterUserSerializer,
     ResetPasswordSerializer, SubscriptionHistoryPartialUpdateSerializer,
     SubscriptionHistorySerializer, SubscriptionSerializer,
     UserBranchLayoutSerializer)
 from apps.users.models import (AppFeature, Branch, Company, CompanyOTP, MyUser,
                                Subscription, SubscriptionHistory,
-                               UserBranchFeatures, UserBranchLayout)
+                               UserBranchFeatures, UserBranchLayout,
+                               UserImportBatch)
+from apps.users.tasks import import_user_rows
 
 # Create your views here.
 
@@ -94,6 +100,55 @@ class UserListCreateView(generics.ListCreateAPIView):
         }, status_code=status.HTTP_201_CREATED)
 
 
+class UserBulkImportView(views.APIView):
+    """
+    Import many users at once from a CSV file or a JSON list.
+
+    Rows are validated in memory against the branches the requester can
+    access and the known features; valid rows are written with bulk inserts
+    and invalid ones are returned in a per-row error report. Imports of more
+    than ``USER_IMPORT_SYNC_ROWS`` valid rows are handed to a Celery task and
+    answered with 202 and its ``task_id``.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        _, _, branches = user_branches_company(request)
+        rows = parse_user_rows(request)
+        dry_run = str(request.query_params.get('dry_run', '')).lower() in ('1', 'true')
+
+        if dry_run or len(rows) <= settings.USER_IMPORT_SYNC_ROWS:
+            report = import_users(rows, request.user, branches, dry_run=dry_run)
+        else:
+            report = import_users(rows, request.user, branches, dry_run=True)
+            if report['valid'] > settings.USER_IMPORT_SYNC_ROWS:
+                # Hashing this many passwords would hold the worker too long
+                # The rows carry passwords: only the batch id goes to Celery
+                batch = UserImportBatch.objects.create(
+                    created_by=request.user, rows=rows,
+                    branch_ids=[branch.id for branch in branches])
+                task = import_user_rows.delay(batch.id)
+                return format_response({
+                    'message': 'User import queued',
+                    'results': {**report, 'task_id': task.id}
+                }, status_code=status.HTTP_202_ACCEPTED)
+            if report['valid']:
+                report = import_users(rows, request.user, branches)
+
+        if dry_run:
+            message = 'User import validated'
+        elif report['failed']:
+            message = 'User import finished with errors'
+        else:
+            message = 'Users imported successfully'
+        status_code = status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK
+        return format_response({
+            'message': message,
+            'results': report
+        }, status_code=status_code)
+
+
 class UserRegistrationView(generics.CreateAPIView):
 
     """
@@ -140,6 +195,9 @@ class UserRegistrationView(generics.CreateAPIView):
 
 
 class VerifyOTPView(views.APIView):
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'otp_verify'
+
     def post(self, request, *args, **kwargs):
         email = request.data.get('email', None)
         if not email:
@@ -150,12 +208,10 @@ class VerifyOTPView(views.APIView):
         except MyUser.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = OTPVerificationSerializer(data=request.data)
+        serializer = OTPVerificationSerializer(
+            data=request.data, context={'user': user})
         serializer.is_valid(raise_exception=True)
         serializer.save()
-        user.is_verified = True
-        user.otp = None
-        user.save()
 
         # If user has two-step enabled, generate tokens and set cookies here
         if user.is_two_step:
@@ -192,6 +248,8 @@ class VerifyOTPView(views.APIView):
 
 
 class ResendOTPView(views.APIView):
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'otp_resend'
 
     def post(self, request):
         email = request.data.get('email')
@@ -241,9 +299,13 @@ class UserGetUpdateView(generics.RetrieveUpdateDestroyAPIView):
             instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
+        results = serializer.data
+        permission_changes = getattr(serializer, 'permission_changes', None)
+        if permission_changes is not None:
+            results['permission_changes'] = permission_changes
         return format_response({
             'message': 'User updated successfully',
-            'results': serializer.data
+            'results': results
         }, status_code=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
@@ -259,41 +321,27 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     """
     Custom Token Obtain Pair View
     """
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'login'
+    serializer_class = LoginSerializer
 
     def post(self, request, *args, **kwargs):
         try:
-            response = super().post(request, *args, **kwargs)
-            access_token = response.data.get("access", None)
-            refresh_token = response.data.get("refresh", None)
-            email = request.data.get('email')
-            user = MyUser.objects.get(email=email)
+            serializer = self.get_serializer(data=request.data)
+            try:
+                serializer.is_valid(raise_exception=True)
+            except TokenError as e:
+                raise InvalidToken(e.args[0])
 
-            response.data = {
-                "message": "Logged in successfully"
-            }
-            if not user.is_two_step:
-                response.set_cookie(
-                    key='access_token',
-                    value=access_token,
-                    max_age=settings.SESSION_COOKIE_ACCESS_TOKEN_MAX_AGE,
-                    secure=settings.SESSION_COOKIE_SECURE,
-                    httponly=settings.SESSION_COOKIE_HTTPONLY,
-                    samesite=settings.SESSION_COOKIE_SAMESITE
-                )
-                response.set_cookie(
-                    key='refresh_token',
-                    value=refresh_token,
-                    max_age=settings.SESSION_COOKIE_REFRESH_TOKEN_MAX_AGE,
-                    secure=settings.SESSION_COOKIE_SECURE,
-                    httponly=settings.SESSION_COOKIE_HTTPONLY,
-                    samesite=settings.SESSION_COOKIE_SAMESITE
-                )
-                return response
-            else:
+            # The serializer already authenticated and loaded the user
+            user = serializer.user
+            tokens = serializer.validated_data
+
+            if user.is_two_step:
                 otp = str(random.randint(100000, 999999))
                 user.otp = otp
                 user.otp_created_at = timezone.now()
-                user.save()
+                user.save(update_fields=['otp', 'otp_created_at'])
                 send_custom_email(user, {'otp': otp}, email_type="signup_otp")
                 return format_response(
                     {
@@ -301,6 +349,27 @@ class CustomTokenObtainPairView(TokenObtainPairView):
                         "results": {},
                     }, status_code=status.HTTP_200_OK
                 )
+
+            response = Response({
+                "message": "Logged in successfully"
+            }, status=status.HTTP_200_OK)
+            response.set_cookie(
+                key='access_token',
+                value=tokens["access"],
+                max_age=settings.SESSION_COOKIE_ACCESS_TOKEN_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=settings.SESSION_COOKIE_HTTPONLY,
+                samesite=settings.SESSION_COOKIE_SAMESITE
+            )
+            response.set_cookie(
+                key='refresh_token',
+                value=tokens["refresh"],
+                max_age=settings.SESSION_COOKIE_REFRESH_TOKEN_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=settings.SESSION_COOKIE_HTTPONLY,
+                samesite=settings.SESSION_COOKIE_SAMESITE
+            )
+            return response
         except Exception as e:
             logger.error("Refresh token error: %s", {str(e)})
             raise
@@ -693,6 +762,9 @@ class ResetPasswordView(generics.GenericAPIView):
 
 
 class ForgotPasswordView(views.APIView):
+    throttle_classes = AUTH_THROTTLE_CLASSES
+    throttle_scope = 'forgot_password'
+
     def post(self, request):
         serializer = ForgotPasswordSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -849,6 +921,15 @@ class RetrievePermissionListAPIView(views.APIView):
                     "results": []
                 }, status=status.HTTP_400_BAD_REQUEST)
 
+        cache_key, result = get_cached_permissions(
+            request.user.id, 'permission-list', branches_id or '')
+        if result is not None:
+            return Response({
+                "status": "success",
+                "message": "Permission list retrieved successfully.",
+                "results": result
+            }, status=status.HTTP_200_OK)
+
         result = []
 
         for branch in branches:
@@ -911,6 +992,8 @@ class RetrievePermissionListAPIView(views.APIView):
                 "branch_features": branch_result
             })
 
+        set_cached_permissions(cache_key, result)
+
         return Response({
             "status": "success",
             "message": "Permission list retrieved successfully.",
@@ -918,6 +1001,30 @@ class RetrievePermissionListAPIView(views.APIView):
         }, status=status.HTTP_200_OK)
 
 
+class BulkPermissionView(views.APIView):
+    """
+    Grant or revoke a set of features for a set of users across a set of
+    branches with one set based write, then invalidate cached permissions.
+
+    Grants only apply to branches each user is assigned to.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = BulkPermissionSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        report = bulk_update_permissions(
+            data['users'], data['branches'], data['features'], data['action'])
+
+        return format_response({
+            'message': f"Permissions {'granted' if data['action'] == 'grant' else 'revoked'} successfully",
+            'results': report
+        }, status_code=status.HTTP_200_OK)
+
+
 class UserRetrievePermissionListAPIView(views.APIView):
     permission_classes = [IsAuthenticated]
 
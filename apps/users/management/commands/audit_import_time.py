@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What each process type imports before it can do useful work
+TARGETS = {
+    'web': (
+        "import config.wsgi\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+    'celery': (
+        "import django\n"
+        "django.setup()\n"
+        "from config.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+}
+
+REPORT_RSS = (
+    "import resource\n"
+    "print('maxrss_kb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+ImportRecord = namedtuple('ImportRecord', ['self_us', 'cumulative_us', 'name'])
+
+
+def parse_importtime(stderr):
+    """
+    Parse ``python -X importtime`` output lines of the form
+    ``import time:   self [us] | cumulative | imported package``.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        records.append(ImportRecord(
+            int(parts[0]), int(parts[1]), parts[2].rstrip()))
+    return records
+
+
+class Command(BaseCommand):
+    help = (
+        "Import the web or Celery entry point in a fresh interpreter under "
+        "'python -X importtime' and report the slowest imports, total import "
+        "time and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*', default=list(TARGETS),
+                            help=f"Entry points to audit: {', '.join(TARGETS)}")
+        parser.add_argument('--top', type=int, default=25,
+                            help="Number of imports to list (default: 25).")
+        parser.add_argument('--top-level', action='store_true',
+                            help="Only list top level packages.")
+
+    def handle(self, *args, **options):
+        for target in options['targets']:
+            if target not in TARGETS:
+                raise CommandError(
+                    f"Unknown target {target!r}; choose from {', '.join(TARGETS)}")
+            self.audit(target, options['top'], options['top_level'])
+
+    def audit(self, target, top, top_level):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', TARGETS[target] + REPORT_RSS],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(
+                f"Importing {target} failed:\n{result.stderr[-2000:]}")
+
+        records = parse_importtime(result.stderr)
+        # Only outermost imports add up to the real total
+        total_us = sum(r.cumulative_us for r in records
+                       if not r.name.startswith(' ' * 3))
+        maxrss_kb = next((int(line.split()[1]) for line in result.stdout.splitlines()
+                          if line.startswith('maxrss_kb')), 0)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{target}: {len(records)} modules, {total_us / 1000:.1f} ms import, "
+            f"{maxrss_kb / 1024:.1f} MB peak RSS"))
+
+        if top_level:
+            records = [r for r in records if not r.name.startswith('  ')]
+        records.sort(key=lambda r: r.cumulative_us, reverse=True)
+        self.stdout.write(f"{'cumulative ms':>14}{'self ms':>10}  module")
+        for record in records[:top]:
+            self.stdout.write(
+                f"{record.cumulative_us / 1000:>14.1f}{record.self_us / 1000:>10.1f}"
+                f"  {record.name.strip()}")
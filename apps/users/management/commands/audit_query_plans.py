@@ -0,0 +1,155 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.core.utils.synthetic_data import SyntheticTenantGenerator
+from apps.users.models import (AppFeature, Branch, Contact,
+                               EffectivePermission, MyUser, SubscriptionHistory,
+                               UserBranchFeatures, UserBranchLayout)
+
+# Plan lines that read a whole table, per backend
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)'),
+}
+SORT_PATTERNS = {
+    'postgresql': re.compile(r'^\s*(?:->\s*)?Sort\b', re.MULTILINE),
+    'sqlite': re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+def representative_queries(user, branch):
+    """
+    The queries each endpoint runs for ``user``, keyed by endpoint.
+    """
+    company = user.company
+    branch_ids = [branch.id]
+    return {
+        'users/ (UserListCreateView)': [
+            MyUser.objects.filter(assigned_branches__in=branch_ids)
+            .exclude(email=user.email).distinct(),
+        ],
+        'branch/ (BranchSerializer.get_contact_details)': [
+            Contact.objects.filter(branch=branch),
+        ],
+        'user_branches_company (owner)': [
+            Branch.objects.filter(company=company),
+        ],
+        'subscription-history/': [
+            SubscriptionHistory.objects.filter(user=user).order_by('-created_at'),
+        ],
+        'features/': [
+            AppFeature.objects.filter(feature_type='paid').order_by('order'),
+        ],
+        'permission-list/': [
+            UserBranchFeatures.features.through.objects.filter(
+                userbranchfeatures__user=user,
+                userbranchfeatures__branch_id__in=branch_ids),
+            EffectivePermission.objects.filter(
+                user=user, branch=branch, feature_id=1),
+        ],
+        '<branch_id>/user-branch-layout/': [
+            UserBranchLayout.objects.filter(user=user, branch=branch),
+        ],
+        'effective permissions (owners)': [
+            MyUser.objects.filter(is_owner=True, company=company),
+        ],
+    }
+
+
+def seed(tenants):
+    """
+    Insert ``tenants`` small synthetic companies so the planner sees
+    realistic row counts. Runs inside the audit's rolled back transaction.
+    """
+    generator = SyntheticTenantGenerator(
+        companies=tenants, branches_per_company=5, users_per_company=20,
+        audit_logs=tenants * 100, log=lambda message: None)
+    generator.run()
+    user = MyUser.objects.select_related('company').get(id=generator.user_ids[0])
+    return user, user.assigned_branches.first()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the representative queries of the hot endpoints and "
+        "flag full table scans and sorts. Use --seed on an empty database; "
+        "PostgreSQL prefers sequential scans on small tables, so seed at "
+        "least a few hundred tenants there. Nothing is written: the audit "
+        "runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int,
+                            help="User to build the queries for (default: any assigned user).")
+        parser.add_argument('--seed', type=int, default=0, metavar='TENANTS',
+                            help="Insert this many synthetic tenants first.")
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help="Print every plan, not only flagged ones.")
+        parser.add_argument('--fail-on-seq-scan', action='store_true',
+                            help="Exit non-zero when a full scan is found (for CI).")
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        seq_scan = SEQ_SCAN_PATTERNS.get(vendor)
+        sort = SORT_PATTERNS.get(vendor)
+        if seq_scan is None:
+            self.stderr.write(self.style.WARNING(
+                f"No scan detection for {vendor}; plans are printed as is."))
+
+        flagged = []
+        with transaction.atomic():
+            if options['seed']:
+                user, branch = seed(options['seed'])
+                if vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+            else:
+                user, branch = self.sample(options['user_id'])
+
+            for endpoint, querysets in representative_queries(user, branch).items():
+                for queryset in querysets:
+                    plan = queryset.explain()
+                    scans = seq_scan.findall(plan) if seq_scan else []
+                    sorts = sort.findall(plan) if sort else []
+                    if scans or sorts:
+                        flagged.append((endpoint, scans))
+                    self.report(endpoint, queryset, plan, scans, sorts,
+                                options['verbose_plans'] or seq_scan is None)
+
+            transaction.set_rollback(True)
+
+        if flagged:
+            self.stdout.write(self.style.WARNING(
+                f"{len(flagged)} queries need attention"))
+            if options['fail_on_seq_scan'] and any(scans for _, scans in flagged):
+                raise CommandError("Full table scans found.")
+        else:
+            self.stdout.write(self.style.SUCCESS("Every audited query uses an index."))
+
+    def sample(self, user_id):
+        users = MyUser.objects.select_related('company')
+        user = users.filter(id=user_id).first() if user_id else \
+            users.filter(assigned_branches__isnull=False, company__isnull=False).first()
+        if user is None:
+            raise CommandError("No user with assigned branches; pass --seed.")
+        branch = user.assigned_branches.first() or Branch.objects.filter(
+            company=user.company).first()
+        if branch is None:
+            raise CommandError(f"User {user.id} has no branch; pass --seed.")
+        return user, branch
+
+    def report(self, endpoint, queryset, plan, scans, sorts, show_plan):
+        if scans or sorts:
+            problems = [f"full scan of {table}" for table in scans]
+            if sorts:
+                problems.append("sort without index")
+            self.stdout.write(self.style.WARNING(
+                f"[FLAG] {endpoint}: {', '.join(problems)}"))
+        else:
+            self.stdout.write(f"[ok]   {endpoint}")
+        if scans or sorts or show_plan:
+            self.stdout.write(f"       {queryset.query}")
+            for line in plan.splitlines():
+                self.stdout.write(f"         {line}")
@@ -0,0 +1,105 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from apps.core.utils.audit_ingest import AUDIT_COLUMNS
+from apps.core.utils.bulk_copy import copy_rows
+from apps.users.models import MyUser, RequestAuditLog
+
+USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/126.0 Safari/537.36")
+
+
+def audit_rows(count, user_ids):
+    now = timezone.now()
+    methods = ('GET', 'GET', 'GET', 'POST', 'PATCH', 'DELETE')
+    for i in range(count):
+        yield (
+            user_ids[i % len(user_ids)] if i % 4 else None,
+            f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            USER_AGENT,
+            f"/api/v1/branch/{i % 500}/",
+            methods[i % len(methods)],
+            200 if i % 10 else 404,
+            now,
+            1.0,
+        )
+
+
+def with_create(rows):
+    for row in rows:
+        RequestAuditLog.objects.create(**dict(zip(AUDIT_COLUMNS, row)))
+
+
+def with_bulk_create(rows):
+    RequestAuditLog.objects.bulk_create(
+        [RequestAuditLog(**dict(zip(AUDIT_COLUMNS, row))) for row in rows],
+        batch_size=len(rows))
+
+
+def with_copy(rows):
+    copy_rows(RequestAuditLog, AUDIT_COLUMNS, rows, batch_size=len(rows))
+
+
+METHODS = {
+    'create': with_create,
+    'bulk_create': with_bulk_create,
+    'copy': with_copy,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows per second of RequestAuditLog ingestion with create(), "
+        "bulk_create() and COPY FROM STDIN in a throwaway test database. "
+        "COPY needs PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help="Rows per batch (default: 10000).")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Timed batches per method; the best counts (default: 3).")
+        parser.add_argument('--method', action='append', choices=list(METHODS),
+                            help="Only these methods; repeatable.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options['rows'], options['repeat'], options['method'] or list(METHODS))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, count, repeat, methods):
+        user_ids = [
+            user.pk for user in MyUser.objects.bulk_create(
+                MyUser(email=f"audit-{i}@benchmark.example.com", name=f"Audit {i}")
+                for i in range(50))]
+        rows = list(audit_rows(count, user_ids))
+
+        self.stdout.write(f"{connection.vendor}, {count} rows per batch, best of {repeat}")
+        self.stdout.write(f"{'method':<14}{'seconds':>10}{'rows/s':>12}")
+        for name in methods:
+            if name == 'copy' and connection.vendor != 'postgresql':
+                self.stdout.write(f"{name:<14}{'skipped, needs PostgreSQL':>37}")
+                continue
+            best = None
+            for _ in range(repeat):
+                RequestAuditLog.objects.all().delete()
+                start = time.perf_counter()
+                with transaction.atomic():
+                    METHODS[name](rows)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            written = RequestAuditLog.objects.count()
+            if written != count:
+                self.stderr.write(self.style.ERROR(f"{name} wrote {written} of {count} rows"))
+            self.stdout.write(f"{name:<14}{best:>10.3f}{count / best:>12.0f}")
+        RequestAuditLog.objects.all().delete()
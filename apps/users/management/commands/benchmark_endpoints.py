@@ -0,0 +1,85 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from apps.core.utils.endpoint_benchmark import (BUDGET_FILE, EXACT_METRICS,
+                                                MACHINE_METRICS,
+                                                EndpointBenchmark,
+                                                compare_with_budgets,
+                                                load_budgets, make_budgets,
+                                                uncovered_routes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every route of the v1 API through the DRF test client against "
+        "synthetic tenants in a throwaway test database. Records p50/p99 "
+        "latency, query count, rows fetched and allocated memory per "
+        "endpoint and fails when any of them is over the checked-in budget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20,
+                            help="Timed requests per endpoint (default: 20).")
+        parser.add_argument('--warmup', type=int, default=2,
+                            help="Untimed requests per endpoint first (default: 2).")
+        parser.add_argument('--only', action='append', metavar='TEXT',
+                            help="Only endpoints whose name contains TEXT; repeatable.")
+        parser.add_argument('--budget', default=str(BUDGET_FILE),
+                            help="Budget file (default: apps/users/benchmark_budgets.json).")
+        parser.add_argument('--update-budgets', action='store_true',
+                            help="Write this run's numbers, with headroom, to the budget file.")
+        parser.add_argument('--skip-machine-metrics', action='store_true',
+                            help="Only check queries and rows, e.g. on shared CI runners.")
+        parser.add_argument('--output', help="Also write the raw results as JSON here.")
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f"Routes without a benchmark scenario: {', '.join(missing)}")
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = EndpointBenchmark().run(
+                iterations=options['iterations'], warmup=options['warmup'],
+                only=options['only'], log=self.report)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+        if options['update_budgets']:
+            budgets = load_budgets(options['budget']) if options['only'] else {}
+            budgets.update(make_budgets(results))
+            with open(options['budget'], 'w') as budget_file:
+                json.dump(budgets, budget_file, indent=2, sort_keys=True)
+                budget_file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {len(results)} budgets to {options['budget']}"))
+            return
+
+        metrics = EXACT_METRICS if options['skip_machine_metrics'] \
+            else EXACT_METRICS + MACHINE_METRICS
+        violations = compare_with_budgets(results, load_budgets(options['budget']), metrics)
+        if violations:
+            for violation in violations:
+                self.stderr.write(self.style.ERROR(violation))
+            raise CommandError(f"{len(violations)} budget violations.")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} endpoints within budget."))
+
+    def report(self, name, result):
+        line = (f"{name:<55}{result['status']:>5}{result['p50_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['queries']:>6}{result['rows']:>7}"
+                f"{result['memory_kb']:>8}")
+        if 'error' in result:
+            self.stdout.write(self.style.ERROR(line))
+        else:
+            self.stdout.write(line)
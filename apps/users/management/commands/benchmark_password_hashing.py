@@ -0,0 +1,120 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+
+DEFAULT_POLICIES = ['bcrypt:10', 'bcrypt:11', 'bcrypt:12', 'argon2:2:102400:8',
+                    'argon2:1:65536:2']
+BENCHMARK_PASSWORD = 'Benchmark#Passw0rd'
+BENCHMARK_EMAIL = 'password-benchmark@example.com'
+
+
+def policy_settings(spec):
+    """
+    Turn ``bcrypt:<rounds>`` or ``argon2:<time>:<memory_kib>:<parallelism>``
+    into the settings overrides that select that policy.
+    """
+    name, *params = spec.split(':')
+    if name not in settings.PASSWORD_HASH_POLICIES:
+        raise CommandError(f"Unknown policy {name!r} in {spec!r}")
+
+    hashers = [settings.PASSWORD_HASH_POLICIES[name]] + [
+        hasher for hasher in settings.PASSWORD_HASHERS
+        if hasher != settings.PASSWORD_HASH_POLICIES[name]]
+    overrides = {'PASSWORD_HASHERS': hashers}
+    try:
+        if name == 'bcrypt' and params:
+            overrides['BCRYPT_ROUNDS'] = int(params[0])
+        elif name == 'argon2' and params:
+            keys = ['ARGON2_TIME_COST', 'ARGON2_MEMORY_COST', 'ARGON2_PARALLELISM']
+            overrides.update(dict(zip(keys, map(int, params))))
+    except ValueError:
+        raise CommandError(f"Invalid policy parameters in {spec!r}")
+    return overrides
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login requests per second per core under each password "
+        "hashing policy, e.g. --policy bcrypt:12 --policy argon2:2:102400:8"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--policy', action='append', dest='policies',
+            help="Policy spec, repeatable. Defaults to a bcrypt/argon2 sweep.")
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help="Logins measured per policy (default: 20).")
+        parser.add_argument(
+            '--hash-only', action='store_true',
+            help="Only time check_password, without the login endpoint.")
+
+    def handle(self, *args, **options):
+        policies = options['policies'] or DEFAULT_POLICIES
+        iterations = options['iterations']
+        if iterations < 1:
+            raise CommandError("--iterations must be at least 1")
+
+        self.stdout.write(
+            f"{'policy':<24}{'hash ms':>10}{'verify/s':>12}{'login/s':>12}")
+        for spec in policies:
+            with override_settings(**policy_settings(spec)):
+                hash_ms, verify_rps = self.bench_verify(iterations)
+                login_rps = None
+                if not options['hash_only']:
+                    login_rps = self.bench_login(iterations)
+
+            login_col = f"{login_rps:>12.1f}" if login_rps else f"{'-':>12}"
+            self.stdout.write(
+                f"{spec:<24}{hash_ms:>10.1f}{verify_rps:>12.1f}{login_col}")
+
+        self.stdout.write(self.style.SUCCESS(
+            "Rates are single-threaded CPU time, i.e. per core."))
+
+    def bench_verify(self, iterations):
+        start = time.process_time()
+        encoded = make_password(BENCHMARK_PASSWORD)
+        hash_ms = (time.process_time() - start) * 1000
+
+        start = time.process_time()
+        for _ in range(iterations):
+            check_password(BENCHMARK_PASSWORD, encoded)
+        elapsed = time.process_time() - start
+        return hash_ms, iterations / elapsed if elapsed else float('inf')
+
+    def bench_login(self, iterations):
+        from rest_framework.test import APIClient
+
+        from apps.users.models import MyUser
+
+        client = APIClient()
+        url = reverse('Login')
+        payload = {'email': BENCHMARK_EMAIL, 'password': BENCHMARK_PASSWORD}
+
+        # Everything runs in a transaction that is rolled back, so the
+        # benchmark user and its audit rows never reach the database.
+        with override_settings(THROTTLE_RATES={}, ALLOWED_HOSTS=['*']), \
+                transaction.atomic():
+            user = MyUser(email=BENCHMARK_EMAIL, name='benchmark')
+            user.set_password(BENCHMARK_PASSWORD)
+            user.save()
+
+            # Warm up once so URL resolving and imports are not measured.
+            client.post(url, payload, format='json', secure=True)
+
+            start = time.process_time()
+            for _ in range(iterations):
+                response = client.post(url, payload, format='json', secure=True)
+                if response.status_code != 200:
+                    transaction.set_rollback(True)
+                    raise CommandError(
+                        f"Login failed with status {response.status_code}")
+            elapsed = time.process_time() - start
+            transaction.set_rollback(True)
+
+        return iterations / elapsed if elapsed else float('inf')
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.utils.image_variants import (build_image_variants,
+                                            stale_fields, variant_models,
+                                            variant_sizes)
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the missing or outdated WebP variants of IMAGE_VARIANTS. "
+        "Variants are rendered by a Celery task after each upload; use this "
+        "for images uploaded before, or after changing IMAGE_VARIANTS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Render every variant again, e.g. after changing "
+                                 "IMAGE_VARIANT_QUALITY.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = fields = 0
+        for model in variant_models():
+            sizes = variant_sizes(model)
+            queryset = model._default_manager.only(*sizes, 'image_variants').order_by('pk')
+            for instance in queryset.iterator():
+                if options['force'] or stale_fields(instance):
+                    changed = build_image_variants(model, instance.pk, options['force'])
+                    rows += bool(changed)
+                    fields += len(changed)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {fields} variants of {rows} rows in {time.perf_counter() - start:.2f}s"))
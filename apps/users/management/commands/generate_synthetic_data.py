@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.utils.synthetic_data import SyntheticTenantGenerator
+
+# companies, branches per company, users per company, audit log rows
+SCALES = {
+    'small': (2, 5, 50, 10_000),
+    'medium': (10, 50, 500, 500_000),
+    'large': (20, 150, 2_500, 5_000_000),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic tenant graph with Faker: companies, branches, "
+        "users with branch features and layouts, subscriptions and request "
+        "audit logs. Pick a --scale preset and override any part of it. "
+        "Rows are added next to existing data, never replacing it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--companies', type=int)
+        parser.add_argument('--branches', type=int, help="Branches per company.")
+        parser.add_argument('--users', type=int, help="Users per company.")
+        parser.add_argument('--audit-logs', type=int, help="RequestAuditLog rows in total.")
+        parser.add_argument('--audit-days', type=int, default=30,
+                            help="Spread audit logs over this many days (default: 30).")
+        parser.add_argument('--features-per-user', type=int, default=8,
+                            help="Mean features granted per user and branch (default: 8).")
+        parser.add_argument('--password', default='Synthetic#12345',
+                            help="Password every generated user can log in with.")
+        parser.add_argument('--seed', type=int, help="Seed for a reproducible dataset.")
+        parser.add_argument('--company-batch', type=int, default=5,
+                            help="Companies written per transaction (default: 5).")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--skip-effective-permissions', action='store_true',
+                            help="Do not rebuild effective_permission for the new tenants.")
+        parser.add_argument('--force', action='store_true',
+                            help="Allow running with DEBUG off.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError(
+                "Refusing to generate synthetic data with DEBUG off; pass --force.")
+
+        companies, branches, users, audit_logs = SCALES[options['scale']]
+        generator = SyntheticTenantGenerator(
+            companies=options['companies'] or companies,
+            branches_per_company=options['branches'] or branches,
+            users_per_company=options['users'] or users,
+            features_per_user=options['features_per_user'],
+            audit_logs=options['audit_logs'] if options['audit_logs'] is not None else audit_logs,
+            audit_days=options['audit_days'],
+            password=options['password'],
+            seed=options['seed'],
+            company_batch=options['company_batch'],
+            batch_size=options['batch_size'],
+            effective_permissions=not options['skip_effective_permissions'],
+            log=self.stdout.write,
+        )
+        counts = generator.run()
+
+        seconds = counts.pop('seconds')
+        for name, amount in sorted(counts.items()):
+            self.stdout.write(f"{name:<40}{amount:>12}")
+        self.stdout.write(self.style.SUCCESS(f"Generated in {seconds}s"))
@@ -0,0 +1,110 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+# (label, sync path, async path), relative to the API prefix
+ENDPOINT_PAIRS = [
+    ('token-validate', 'token/validate/', 'async/token/validate/'),
+    ('features', 'features/', 'async/features/'),
+    ('permission-list', 'permission-list/', 'async/permission-list/'),
+    ('branch-layout', '{branch_id}/user-branch-layout/',
+     'async/{branch_id}/user-branch-layout/'),
+]
+
+
+def rss_mb(pids):
+    """
+    Sum the resident memory of the given server processes (Linux only).
+    """
+    total_kb = 0
+    for pid in pids:
+        try:
+            status = Path(f"/proc/{pid}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith('VmRSS:'):
+                total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync and async endpoint variants under concurrent load. "
+        "Run the sync server (gthread workers) and the ASGI server "
+        "(uvicorn workers) with the same worker count so both use the same "
+        "memory, then point --sync-url and --async-url at them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default='http://localhost:8000/api/v1/')
+        parser.add_argument('--async-url', default='http://localhost:8001/api/v1/')
+        parser.add_argument('--token', required=True,
+                            help="Access token sent as a Bearer header.")
+        parser.add_argument('--branch-id', type=int, default=1)
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help="Concurrent clients, repeatable (default: 10, 50, 200).")
+        parser.add_argument('--requests', type=int, default=500,
+                            help="Requests per endpoint and concurrency level.")
+        parser.add_argument('--sync-pids', default='',
+                            help="Comma separated sync server PIDs to report RSS for.")
+        parser.add_argument('--async-pids', default='',
+                            help="Comma separated ASGI server PIDs to report RSS for.")
+
+    def handle(self, *args, **options):
+        levels = options['concurrency'] or [10, 50, 200]
+        headers = {'Authorization': f"Bearer {options['token']}"}
+        pids = {
+            'sync': [int(p) for p in options['sync_pids'].split(',') if p.strip()],
+            'async': [int(p) for p in options['async_pids'].split(',') if p.strip()],
+        }
+
+        self.stdout.write(
+            f"{'endpoint':<18}{'mode':<7}{'conc':>6}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'rss MB':>10}")
+
+        for label, sync_path, async_path in ENDPOINT_PAIRS:
+            for concurrency in levels:
+                for mode, base, path in (('sync', options['sync_url'], sync_path),
+                                         ('async', options['async_url'], async_path)):
+                    url = base + path.format(branch_id=options['branch_id'])
+                    stats = self.run(url, headers, concurrency, options['requests'])
+                    memory = f"{rss_mb(pids[mode]):>10.1f}" if pids[mode] else f"{'-':>10}"
+                    self.stdout.write(
+                        f"{label:<18}{mode:<7}{concurrency:>6}{stats['rps']:>10.1f}"
+                        f"{stats['p50']:>10.1f}{stats['p99']:>10.1f}"
+                        f"{stats['errors']:>8}{memory}")
+
+    def run(self, url, headers, concurrency, total):
+        def fetch(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, TimeoutError):
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, range(total)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in results)
+        if not latencies:
+            raise CommandError("No requests were sent.")
+        percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 \
+            else latencies * 99
+        return {
+            'rps': total / elapsed,
+            'p50': percentiles[49],
+            'p99': percentiles[98],
+            'errors': sum(1 for _, ok in results if not ok),
+        }
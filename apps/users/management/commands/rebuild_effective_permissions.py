@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.core.utils.effective_permissions import rebuild_effective_permissions
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the effective_permission table from branch features, "
+        "user branch features and the owner, free and camera rules. Only "
+        "rows that differ are written, so it is safe to run at any time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='companies',
+                            help="Only rebuild this company, repeatable.")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows per INSERT/DELETE batch (default: 1000).")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        inserted, deleted = rebuild_effective_permissions(
+            company_ids=options['companies'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"effective_permission rebuilt in {time.perf_counter() - start:.2f}s: "
+            f"{inserted} rows inserted, {deleted} rows deleted"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.utils.media_gc import delete_files, find_orphans, upload_prefixes
+
+
+class Command(BaseCommand):
+    help = (
+        "List media files that no row references: every file under the "
+        "upload_to directories of the file fields, minus the names stored in "
+        "those fields. With --delete, remove them through the storage API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', action='append', dest='prefixes',
+                            help="Only scan this directory under MEDIA_ROOT; repeatable. "
+                                 f"Default: {', '.join(upload_prefixes())}.")
+        parser.add_argument('--min-age', type=int, default=86400,
+                            help="Skip files modified less than this many seconds ago, "
+                                 "so uploads whose row is not committed yet survive "
+                                 "(default: 86400).")
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete the orphans instead of only listing them.")
+
+    def handle(self, *args, **options):
+        orphans = find_orphans(options['prefixes'], options['min_age'])
+        for name in orphans:
+            self.stdout.write(name)
+
+        if not options['delete']:
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(orphans)} orphaned files; run with --delete to remove them."))
+            return
+        deleted = delete_files(orphans)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} of {len(orphans)} orphaned files."))
@@ -1,3 +1,7 @@
+from .metricsmiddleware import MetricsMiddleware
+from .profilingmiddleware import RequestProfilingMiddleware
 from .requestauditmiddleware import RequestAuditMiddleware
+from .tracingmiddleware import TracingMiddleware
 
-__all__ = ["RequestAuditMiddleware"]
+__all__ = ["MetricsMiddleware", "RequestAuditMiddleware", "RequestProfilingMiddleware",
+           "TracingMiddleware"]
@@ -0,0 +1,54 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest, HttpResponse
+
+from apps.core.utils.metrics import HTTP_DB_QUERIES, HTTP_LATENCY, HTTP_REQUESTS
+from apps.core.utils.request_profiling import observing_queries
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def add_query(self, elapsed_ms):
+        self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Count requests and record latency and database queries per URL name.
+    Unresolved paths share one ``unmatched`` label so scanners cannot blow
+    up the label cardinality.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with observing_queries(QueryCounter()) as queries:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries.count)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        with observing_queries(QueryCounter()) as queries:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries.count)
+        return response
+
+    def record(self, request, response, elapsed, queries):
+        match = request.resolver_match
+        url_name = (match.url_name or match.route) if match else 'unmatched'
+        HTTP_REQUESTS.labels(url_name, request.method, response.status_code).inc()
+        HTTP_LATENCY.labels(url_name, request.method).observe(elapsed)
+        HTTP_DB_QUERIES.labels(url_name).observe(queries)
@@ -0,0 +1,161 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from apps.core.utils.request_profiling import (collect_timings,
+                                               current_timings,
+                                               install_serializer_timing)
+from apps.core.utils.user_details import resolved_user_id
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfilingMiddleware:
+    """
+    Sampled per-request instrumentation for production.
+
+    For ``REQUEST_PROFILING_SAMPLE_RATE`` of requests, SQL count and time,
+    serializer time, render time and total time go out as a
+    ``Server-Timing`` header and one JSON log line. A request carrying
+    ``X-Profile: <REQUEST_PROFILING_TOKEN>`` is always sampled and also
+    profiled with cProfile, or pyinstrument when ``X-Profile-Engine:
+    pyinstrument`` is sent and it is installed. The profile is written to
+    ``REQUEST_PROFILING_DIR`` and named in the ``X-Profile-File`` header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.token = settings.REQUEST_PROFILING_TOKEN
+        self.profile_dir = settings.REQUEST_PROFILING_DIR
+        install_serializer_timing()
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = self.profile_requested(request)
+        if not profile and not self.sampled():
+            return self.get_response(request)
+
+        profiler = None
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            if profile:
+                profiler = self.start_profiler(profile)
+                try:
+                    response = self.get_response(request)
+                finally:
+                    self.stop_profiler(profiler)
+            else:
+                response = self.get_response(request)
+        return self.report(request, response, timings, start, profile, profiler)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        profile = self.profile_requested(request)
+        if not profile and not self.sampled():
+            return await self.get_response(request)
+
+        profiler = None
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            if profile:
+                # cProfile only sees the event loop thread; pyinstrument
+                # follows the awaiting task
+                profiler = self.start_profiler(profile)
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    self.stop_profiler(profiler)
+            else:
+                response = await self.get_response(request)
+        return self.report(request, response, timings, start, profile, profiler)
+
+    def sampled(self):
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def report(self, request, response, timings, start, engine, profiler):
+        total_ms = (time.perf_counter() - start) * 1000
+        profile_file = self.save_profile(request, engine, profiler) if profiler else None
+
+        response['Server-Timing'] = timings.server_timing(total_ms)
+        if profile_file:
+            response['X-Profile-File'] = os.path.basename(profile_file)
+
+        match = request.resolver_match
+        logger.info("request_profile %s", json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'status': response.status_code,
+            'user_id': resolved_user_id(request),
+            **timings.as_dict(total_ms),
+            'profile': profile_file,
+        }))
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns
+        timings = current_timings()
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda _: timings.add_render(start))
+        return response
+
+    def profile_requested(self, request):
+        provided = request.headers.get('X-Profile')
+        if not self.token or not provided or not constant_time_compare(provided, self.token):
+            return None
+        engine = request.headers.get('X-Profile-Engine', 'cprofile').lower()
+        return 'pyinstrument' if engine == 'pyinstrument' and Profiler else 'cprofile'
+
+    def start_profiler(self, engine):
+        if engine == 'pyinstrument':
+            profiler = Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+
+    def save_profile(self, request, engine, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{uuid.uuid4().hex[:8]}"
+
+        if engine == 'pyinstrument':
+            path = os.path.join(self.profile_dir, f"{name}.html")
+            with open(path, 'w') as output:
+                output.write(profiler.output_html())
+            return path
+
+        # Load with pstats or snakeviz
+        path = os.path.join(self.profile_dir, f"{name}.prof")
+        profiler.dump_stats(path)
+        return path
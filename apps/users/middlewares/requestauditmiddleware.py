@@ -1,20 +1,60 @@
 import logging
 
-from django.urls import resolve
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import HttpRequest, HttpResponse
-from django.core.exceptions import ValidationError
+from django.utils import timezone
 
-from apps.users.models import RequestAuditLog, MyUser
+from apps.core.utils.audit_ingest import get_audit_buffer
+from apps.core.utils.audit_rules import AuditPolicy
+from apps.core.utils.user_details import resolved_user_id
 
 logger = logging.getLogger(__name__)
 
 
 class RequestAuditMiddleware:
+    """
+    Write requests to the audit log as decided by ``AUDIT_RULES``. Rules can
+    name URLs, so the decision is made once the response exists.
+
+    The user is whoever authentication resolved while the request ran (JWT
+    through DRF or the async views, or an evaluated session user). The
+    audit never loads a user itself, so anonymous and public requests cost
+    no auth query.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.policy = AuditPolicy.from_settings()
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
-        user = request.user if request.user.is_authenticated else None
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        # Written in batches, see apps/core/utils/audit_ingest.py. Without a
+        # row this still writes a batch that waited too long
+        get_audit_buffer().add(self.audit_row(request, response))
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        response = await self.get_response(request)
+        buffer = get_audit_buffer()
+        rows = buffer.push(self.audit_row(request, response))
+        if rows:
+            await sync_to_async(buffer.write)(rows)
+        return response
+
+    def audit_row(self, request, response):
+        match = request.resolver_match
+        route = (match.url_name or match.route) if match else None
+        sample = self.policy.audited_sample(request.method, request.path, route)
+        if sample is None:
+            return None
+
         x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
         ip_address = None
         if x_forwarded_for:
@@ -22,23 +62,14 @@ class RequestAuditMiddleware:
         else:
             ip_address = request.META.get('REMOTE_ADDR', '0.0.0.0')
         user_agent = request.META.get('HTTP_USER_AGENT', 'unknown')
-        path = request.path
-        method = request.method
-
-        response = self.get_response(request)
 
-        status_code = response.status_code
-
-        try:
-            RequestAuditLog.objects.create(
-                user=user if isinstance(user, MyUser) else None,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                path=path,
-                method=method,
-                status_code=status_code
-            )
-        except ValidationError as e:
-            logger.error(f"Failed to save audit log: {e}")
-
-        return response
+        return (
+            resolved_user_id(request),
+            ip_address,
+            user_agent,
+            request.path,
+            request.method,
+            response.status_code,
+            timezone.now(),
+            sample,
+        )
@@ -0,0 +1,75 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+from opentelemetry import context, propagate
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from apps.core.utils.tracing import configure_tracing, tracer
+
+
+class _MetaGetter:
+    def get(self, carrier, key):
+        value = carrier.get('HTTP_' + key.upper().replace('-', '_'))
+        return [value] if value is not None else None
+
+    def keys(self, carrier):
+        return []
+
+
+class TracingMiddleware:
+    """
+    Open the server span of every request. A ``traceparent`` header from
+    the caller is continued; queries, mail and queued Celery tasks nest
+    under the span. Removed from the stack when ``TRACING_EXPORTER`` is
+    empty.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not configure_tracing(settings.TRACING_SERVICE_NAME):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        token = context.attach(propagate.extract(request.META, getter=_MetaGetter()))
+        try:
+            with self.start_span(request) as span:
+                response = self.get_response(request)
+                self.finish_span(span, request, response)
+                return response
+        finally:
+            context.detach(token)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        token = context.attach(propagate.extract(request.META, getter=_MetaGetter()))
+        try:
+            with self.start_span(request) as span:
+                response = await self.get_response(request)
+                self.finish_span(span, request, response)
+                return response
+        finally:
+            context.detach(token)
+
+    def start_span(self, request):
+        return tracer.start_as_current_span(
+            request.method, kind=SpanKind.SERVER, record_exception=True, attributes={
+                'http.request.method': request.method,
+                'url.path': request.path,
+            })
+
+    def finish_span(self, span, request, response):
+        match = request.resolver_match
+        if match:
+            # Low-cardinality name once the URL is resolved
+            span.update_name(f'{request.method} {match.route}')
+            span.set_attribute('http.route', match.route)
+        span.set_attribute('http.response.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.set_status(Status(StatusCode.ERROR))
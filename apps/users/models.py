@@ -29,8 +29,10 @@ class AppFeature(BaseModel):
     order = models.IntegerField(default=0)
     description = models.TextField(
         blank=True, null=True, verbose_name="Description")
-    icon = models.ImageField(upload_to='feature_icons/',
-                             blank=True, null=True, verbose_name="Feature Icon")
+    icon = models.ImageField(upload_to='feature_icons/', blank=True, null=True,
+                             db_index=True, verbose_name="Feature Icon")
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name="Image Variants")
     price = models.FloatField(
         null=True,
         blank=True,
@@ -60,6 +62,11 @@ class AppFeature(BaseModel):
     class Meta:
         verbose_name = "App Feature"
         verbose_name_plural = "App Features"
+        indexes = [
+            # FeaturesListView: feature_type='paid' ORDER BY order
+            models.Index(fields=['order'], condition=models.Q(feature_type='paid'),
+                         name='appfeature_paid_order_idx'),
+        ]
 
 
 class Company(BaseModel):
@@ -70,9 +77,11 @@ class Company(BaseModel):
     subdomain = models.CharField(
         max_length=250, unique=True, verbose_name="Subdomain")
     logo = models.ImageField(
-        upload_to='company_logo/%Y/', blank=True, null=True, verbose_name="Logo")
+        upload_to='company_logo/%Y/', blank=True, null=True, db_index=True, verbose_name="Logo")
     fav_icon = models.ImageField(
-        upload_to='company_logo/%Y/', blank=True, null=True, verbose_name="Favicon")
+        upload_to='company_logo/%Y/', blank=True, null=True, db_index=True, verbose_name="Favicon")
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name="Image Variants")
     created_by = models.ForeignKey(
         'MyUser', related_name='companies_created', on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Created By")
     updated_by = models.ForeignKey(
@@ -187,6 +196,11 @@ class MyUser(AbstractBaseUser, PermissionsMixin, BaseModel):
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
+        indexes = [
+            # Owner lookups by company (owner shortcut, effective permissions)
+            models.Index(fields=['company'], condition=models.Q(is_owner=True),
+                         name='myuser_owner_company_idx'),
+        ]
 
 
 class UserBranchLayout(BaseModel):
@@ -218,6 +232,34 @@ class UserBranchFeatures(BaseModel):
         ]
 
 
+class EffectivePermission(models.Model):
+    """
+    Denormalized ``(user, branch, feature)`` rows: one row per feature a user
+    may use in a branch. Kept in sync by ``apps.users.signals`` and rebuilt
+    with ``manage.py rebuild_effective_permissions``.
+    """
+    # The unique index leads with user, so no separate user index is needed
+    user = models.ForeignKey(
+        MyUser, on_delete=models.CASCADE, related_name='effective_permissions',
+        verbose_name="User", db_index=False)
+    branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name='effective_permissions',
+        verbose_name="Branch")
+    feature = models.ForeignKey(
+        AppFeature, on_delete=models.CASCADE, related_name='effective_permissions',
+        verbose_name="Feature")
+
+    class Meta:
+        db_table = 'effective_permission'
+        verbose_name = "Effective Permission"
+        verbose_name_plural = "Effective Permissions"
+        constraints = [
+            # Covers "can user U use feature F in branch B" as one index probe
+            models.UniqueConstraint(
+                fields=['user', 'branch', 'feature'], name='unique_effective_permission')
+        ]
+
+
 class MyUserDetails(BaseModel):
     BLOOD_GROUP_CHOICES = (
         ('A+', 'A+'),
@@ -245,9 +287,11 @@ class MyUserDetails(BaseModel):
     date_of_birth = models.DateField(
         null=True, blank=True, verbose_name="Date of Birth")
     profile_picture = models.ImageField(
-        upload_to="user_profile_pictures/%Y/%m/", null=True, blank=True, default=None, verbose_name="Profile Picture")
+        upload_to="user_profile_pictures/%Y/%m/", null=True, blank=True, default=None, db_index=True, verbose_name="Profile Picture")
     user_signature = models.ImageField(
-        upload_to="user_signatures/%Y/%m/", null=True, blank=True, default=None, verbose_name="User Signature")
+        upload_to="user_signatures/%Y/%m/", null=True, blank=True, default=None, db_index=True, verbose_name="User Signature")
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name="Image Variants")
     blood_group = models.CharField(
         max_length=3, choices=BLOOD_GROUP_CHOICES, null=True, blank=True, verbose_name="Blood Group")
     gender = models.CharField(
@@ -325,6 +369,11 @@ class SubscriptionHistory(BaseModel):
                 name='unique_subscription_history'
             )
         ]
+        indexes = [
+            # SubscriptionHistoryListCreateView: user=... ORDER BY -created_at
+            models.Index(fields=['user', '-created_at'],
+                         name='subhist_user_created_idx'),
+        ]
 
 
 class RequestAuditLog(models.Model):
@@ -342,6 +391,8 @@ class RequestAuditLog(models.Model):
         auto_now_add=True, verbose_name="Timestamp")
     status_code = models.IntegerField(
         null=True, blank=True, verbose_name="Status Code")
+    # Share of such requests that is audited; this row stands for 1 / sample_rate
+    sample_rate = models.FloatField(default=1.0, verbose_name="Sample Rate")
 
     def __str__(self):
         return f"{self.user.email if self.user else 'Anonymous'} - {self.method} {self.path} ({self.status_code})"
@@ -353,3 +404,48 @@ class RequestAuditLog(models.Model):
             models.Index(fields=['timestamp']),
             models.Index(fields=['user', 'timestamp']),
         ]
+
+
+class RequestAuditRollup(models.Model):
+    """
+    Requests per hour and normalized path, estimated from the audited ones
+    and kept up to date when audit rows are written
+    (``apps/core/utils/audit_rollups.py``) so the aggregate endpoints never
+    scan ``RequestAuditLog``.
+    """
+    hour = models.DateTimeField(verbose_name="Hour")
+    path = models.TextField(verbose_name="Path")
+    requests = models.PositiveIntegerField(default=0, verbose_name="Requests")
+    client_errors = models.PositiveIntegerField(default=0, verbose_name="4xx")
+    server_errors = models.PositiveIntegerField(default=0, verbose_name="5xx")
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.path} ({self.requests})"
+
+    class Meta:
+        verbose_name = "Request Audit Rollup"
+        verbose_name_plural = "Request Audit Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'path'], name='unique_audit_rollup_hour_path'),
+        ]
+
+
+class UserImportBatch(models.Model):
+    """
+    Rows of a user import queued for ``import_user_rows``. They hold
+    plaintext passwords, so only the id goes through Celery and the task
+    deletes the batch as soon as it has read it.
+    """
+    created_by = models.ForeignKey(
+        MyUser, on_delete=models.CASCADE, related_name='user_import_batches',
+        verbose_name="Created By")
+    rows = models.JSONField(verbose_name="Rows")
+    branch_ids = models.JSONField(verbose_name="Branch IDs")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+
+    def __str__(self):
+        return f"{self.created_by_id} ({len(self.rows)} rows)"
+
+    class Meta:
+        verbose_name = "User Import Batch"
+        verbose_name_plural = "User Import Batches"
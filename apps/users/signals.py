@@ -1,34 +1,176 @@
-import os
-
-from django.db.models.signals import post_delete
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
 from django.dispatch import receiver
 
-from apps.users.models import AppFeature, Company, MyUserDetails
+from apps.core.utils.effective_permissions import (
+    schedule_effective_permission_rebuild, schedule_effective_permission_sync)
+from apps.core.utils.image_variants import schedule_image_variants
+from apps.core.utils.media_gc import delete_files_on_commit, instance_file_names
+from apps.core.utils.permission_cache import invalidate_permission_cache
+from apps.core.utils.request_profiling import observe_queries
+from apps.core.utils.slow_queries import record_slow_query
+from apps.users.models import (AppFeature, Branch, Company, MyUser,
+                               MyUserDetails, UserBranchFeatures)
+
+
+@receiver(connection_created)
+def install_slow_query_recorder(sender, connection, **kwargs):
+    if settings.SLOW_QUERY_THRESHOLD_MS and record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
 
+@receiver(connection_created)
+def install_query_observer(sender, connection, **kwargs):
+    if observe_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(observe_queries)
+
+
+# Media files of deleted rows are removed after commit by a Celery task,
+# see apps/core/utils/media_gc.py
 
 @receiver(post_delete, sender=MyUserDetails)
-def clean_up_profile_imagefile_after_delete(sender, instance, **kwargs):
-    if instance.profile_picture and instance.profile_picture.name:
-        image_path = instance.profile_picture.path
-        if os.path.exists(image_path):
-            os.remove(image_path)
+def clean_up_profile_imagefile_after_delete(sender, instance, using, **kwargs):
+    delete_files_on_commit(instance_file_names(instance), using=using)
 
 
 @receiver(post_delete, sender=Company)
-def clean_up_logo_company(sender, instance, **kwargs):
-    if instance.logo and instance.logo.name:
-        image_path = instance.logo.path
-        if os.path.exists(image_path):
-            os.remove(image_path)
-    if instance.fav_icon and instance.fav_icon.name:
-        image_path = instance.fav_icon.path
-        if os.path.exists(image_path):
-            os.remove(image_path)
+def clean_up_logo_company(sender, instance, using, **kwargs):
+    delete_files_on_commit(instance_file_names(instance), using=using)
 
 
 @receiver(post_delete, sender=AppFeature)
-def clean_up_features_icon(sender, instance, **kwargs):
-    if instance.icon and instance.icon.name:
-        image_path = instance.icon.path
-        if os.path.exists(image_path):
-            os.remove(image_path)
+def clean_up_features_icon(sender, instance, using, **kwargs):
+    delete_files_on_commit(instance_file_names(instance), using=using)
+
+
+@receiver(post_save, sender=MyUserDetails)
+@receiver(post_save, sender=Company)
+@receiver(post_save, sender=AppFeature)
+def render_image_variants(sender, instance, update_fields=None, **kwargs):
+    schedule_image_variants(instance, update_fields)
+
+
+# effective_permission maintenance. Each change resyncs only the users and
+# branches it can affect, after the transaction commits. Cached permission
+# lists are built from the same rows, so every such change also drops them.
+
+def _invalidate_cached_permissions(using=None):
+    transaction.on_commit(invalidate_permission_cache, using=using)
+
+def _changed_pks(instance, action, pk_set, related_name):
+    """
+    Related PKs touched by an m2m change; ``clear`` sends no pk_set, so the
+    related rows are remembered on ``pre_clear``.
+    """
+    if action == 'pre_clear':
+        instance._cleared_pks = set(
+            getattr(instance, related_name).values_list('pk', flat=True))
+        return None
+    if action == 'post_clear':
+        return instance.__dict__.pop('_cleared_pks', set())
+    if action in ('post_add', 'post_remove'):
+        return pk_set
+    return None
+
+
+@receiver(m2m_changed, sender=Branch.features.through)
+def sync_branch_features(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_cached_permissions(using)
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_effective_permission_sync(branch_ids=[instance.pk])
+        return
+    branch_ids = _changed_pks(instance, action, pk_set, 'branches')
+    if branch_ids:
+        schedule_effective_permission_sync(branch_ids=branch_ids)
+
+
+@receiver(m2m_changed, sender=UserBranchFeatures.features.through)
+def sync_user_branch_features(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_cached_permissions(using)
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear') and instance.branch_id:
+            schedule_effective_permission_sync(
+                user_ids=[instance.user_id], branch_ids=[instance.branch_id])
+        return
+    ubf_ids = _changed_pks(instance, action, pk_set, 'user_branch_features')
+    if ubf_ids:
+        rows = UserBranchFeatures.objects.filter(
+            id__in=ubf_ids).values_list('user_id', 'branch_id')
+        schedule_effective_permission_sync(
+            user_ids={user_id for user_id, _ in rows},
+            branch_ids={branch_id for _, branch_id in rows if branch_id})
+
+
+@receiver(m2m_changed, sender=MyUser.assigned_branches.through)
+def sync_assigned_branches(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    _invalidate_cached_permissions(using)
+    related = pk_set if action != 'post_clear' else None
+    if reverse:
+        schedule_effective_permission_sync(user_ids=related, branch_ids=[instance.pk])
+    else:
+        schedule_effective_permission_sync(user_ids=[instance.pk], branch_ids=related)
+
+
+@receiver(post_delete, sender=UserBranchFeatures)
+def sync_deleted_user_branch_features(sender, instance, using, **kwargs):
+    _invalidate_cached_permissions(using)
+    if instance.branch_id:
+        schedule_effective_permission_sync(
+            user_ids=[instance.user_id], branch_ids=[instance.branch_id])
+
+
+@receiver(pre_save, sender=MyUser)
+def track_owner_change(sender, instance, update_fields=None, **kwargs):
+    # Only ownership and company change the owner shortcut
+    if instance.pk is None:
+        instance._owner_changed = instance.is_owner
+        return
+    if update_fields is not None and not {'is_owner', 'company'} & set(update_fields):
+        instance._owner_changed = False
+        return
+    previous = MyUser.objects.filter(pk=instance.pk).values_list(
+        'is_owner', 'company_id').first()
+    instance._owner_changed = previous != (instance.is_owner, instance.company_id)
+
+
+@receiver(post_save, sender=MyUser)
+def sync_owner_change(sender, instance, using, **kwargs):
+    if instance.__dict__.pop('_owner_changed', False):
+        schedule_effective_permission_sync(user_ids=[instance.pk])
+        _invalidate_cached_permissions(using)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+@receiver(post_save, sender=AppFeature)
+@receiver(post_delete, sender=AppFeature)
+@receiver(post_save, sender=UserBranchFeatures)
+@receiver(post_delete, sender=MyUser)
+def invalidate_permissions_on_change(sender, using, **kwargs):
+    # Branches and features are listed by name, and owners see every feature
+    _invalidate_cached_permissions(using)
+
+
+@receiver(pre_save, sender=AppFeature)
+def track_feature_rules(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous = AppFeature.objects.filter(pk=instance.pk).values_list(
+        'feature_type', 'tag', 'required').first()
+    instance._rules_changed = previous is not None and previous != (
+        instance.feature_type, instance.tag, instance.required)
+
+
+@receiver(post_save, sender=AppFeature)
+def rebuild_on_feature_rules(sender, instance, using, **kwargs):
+    # free/camera rules apply to every branch; rare enough to rebuild all
+    if instance.__dict__.pop('_rules_changed', False):
+        schedule_effective_permission_rebuild(using=using)
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.apps import apps
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.core.utils.effective_permissions import rebuild_effective_permissions
+from apps.core.utils.image_variants import build_image_variants
+from apps.core.utils.media_gc import delete_files
+from apps.core.utils.slow_queries import explain
+from apps.core.utils.user_import import import_users
+from apps.users.models import Branch, UserImportBatch
+
+
+@shared_task(ignore_result=True)
+def explain_slow_query(entry_id, alias, sql, params):
+    explain(entry_id, alias, sql, params)
+
+
+@shared_task(ignore_result=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def delete_media_files(names):
+    delete_files(names)
+
+
+@shared_task(ignore_result=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def generate_image_variants(label, pk):
+    build_image_variants(apps.get_model(label), pk)
+
+
+@shared_task(ignore_result=True, autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def rebuild_all_effective_permissions():
+    rebuild_effective_permissions()
+
+
+@shared_task(ignore_result=True)
+def import_user_rows(batch_id):
+    batch = UserImportBatch.objects.select_related('created_by__company') \
+        .filter(pk=batch_id).first()
+    if batch is None:
+        return
+    try:
+        # Validated again: emails may have been taken since the request
+        import_users(batch.rows, batch.created_by,
+                     Branch.objects.filter(id__in=batch.branch_ids))
+    finally:
+        # Plaintext passwords are not kept around for a retry, nor are
+        # batches whose task was lost
+        UserImportBatch.objects.filter(
+            Q(pk=batch_id) | Q(created_at__lt=timezone.now() - timedelta(days=1))).delete()
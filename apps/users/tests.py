@@ -1,3 +1,1235 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import pstats
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from celery.signals import task_postrun, task_prerun
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIHandler
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import \
+    InMemorySpanExporter
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.exceptions import (AuthenticationFailed, NotFound,
+                                       ValidationError)
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.core.utils.endpoint_benchmark import (EXACT_METRICS,
+                                                EndpointBenchmark,
+                                                compare_with_budgets,
+                                                load_budgets, uncovered_routes)
+from apps.core.utils import (audit_ingest, metrics, permissions,
+                             slow_queries, throttling, tracing)
+from apps.core.utils.audit_ingest import AuditBuffer, get_audit_buffer
+from apps.core.utils.audit_rules import AuditPolicy
+from apps.core.utils.effective_permissions import rebuild_effective_permissions
+from apps.core.utils.permission_diff import (apply_user_branch_features,
+                                             bulk_update_permissions)
+from apps.core.utils.image_variants import image_url
+from apps.core.utils.media_gc import delete_files
+from apps.users.api.v1.views import CustomTokenObtainPairView
+from apps.users.middlewares import tracingmiddleware
+from apps.users.models import (AppFeature, Branch, Company,
+                               EffectivePermission, MyUser, RequestAuditLog,
+                               RequestAuditRollup, UserBranchFeatures,
+                               UserBranchLayout, UserImportBatch)
+from apps.users.tasks import (delete_media_files, generate_image_variants,
+                              import_user_rows,
+                              rebuild_all_effective_permissions)
+
+# Queries a successful login may issue inside the view:
+#   1. load the user during authentication
+#   2. store the OutstandingToken for the new refresh token
+LOGIN_QUERY_BUDGET = 2
+# Two-step login: load the user, then write the OTP columns
+TWO_STEP_LOGIN_QUERY_BUDGET = 2
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    THROTTLE_RATES={},
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+class LoginQueryBudgetTests(TestCase):
+    password = "Secret#12345"
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.view = CustomTokenObtainPairView.as_view()
+        self.user = MyUser(email="login@example.com", name="Login")
+        self.user.set_password(self.password)
+        self.user.save()
+
+    def login(self):
+        request = self.factory.post(
+            "/api/v1/token/",
+            {"email": self.user.email, "password": self.password},
+            format="json",
+        )
+        return self.view(request)
+
+    def test_login_query_budget(self):
+        with self.assertNumQueries(LOGIN_QUERY_BUDGET):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access_token", response.cookies)
+        self.assertIn("refresh_token", response.cookies)
+
+    def test_two_step_login_query_budget(self):
+        MyUser.objects.filter(pk=self.user.pk).update(is_two_step=True)
+        last_login = MyUser.objects.get(pk=self.user.pk).last_login
+
+        with self.assertNumQueries(TWO_STEP_LOGIN_QUERY_BUDGET):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("access_token", response.cookies)
+        self.assertEqual(len(mail.outbox), 1)
+
+        user = MyUser.objects.get(pk=self.user.pk)
+        self.assertIsNotNone(user.otp)
+        # Only the OTP columns are written, not the whole row
+        self.assertEqual(user.last_login, last_login)
+
+    def test_invalid_credentials_do_not_issue_tokens(self):
+        request = self.factory.post(
+            "/api/v1/token/",
+            {"email": self.user.email, "password": "wrong"},
+            format="json",
+        )
+        response = self.view(request)
+
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn("access_token", response.cookies)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["apps.core.hashers.TunableBCryptSHA256PasswordHasher",
+                      "apps.core.hashers.TunableArgon2PasswordHasher",
+                      "django.contrib.auth.hashers.PBKDF2PasswordHasher"],
+    BCRYPT_ROUNDS=4, ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=64, ARGON2_PARALLELISM=1,
+    THROTTLE_RATES={},
+)
+class PasswordHasherTests(TestCase):
+    password = "Secret#12345"
+
+    def setUp(self):
+        self.user = MyUser.objects.create(email="login@example.com", name="Login")
+
+    def test_cost_settings_are_used(self):
+        encoded = make_password(self.password)
+        hasher = identify_hasher(encoded)
+        self.assertEqual(hasher.algorithm, "bcrypt_sha256")
+        self.assertEqual(hasher.decode(encoded)['work_factor'], 4)
+
+        encoded = make_password(self.password, hasher="argon2")
+        decoded = identify_hasher(encoded).decode(encoded)
+        self.assertEqual((decoded['time_cost'], decoded['memory_cost'], decoded['parallelism']),
+                         (1, 64, 1))
+
+    def test_stale_hashes_are_upgraded_on_login(self):
+        with override_settings(BCRYPT_ROUNDS=5):
+            bcrypt_5 = make_password(self.password)
+        for stale in (bcrypt_5, make_password(self.password, hasher="pbkdf2_sha256")):
+            with self.subTest(stale=stale.split('$')[0]):
+                MyUser.objects.filter(pk=self.user.pk).update(password=stale)
+                with CaptureQueriesContext(connection) as queries:
+                    response = APIClient().post(
+                        "/api/v1/token/",
+                        {"email": self.user.email, "password": self.password},
+                        format="json")
+                self.assertEqual(response.status_code, 200)
+
+                encoded = MyUser.objects.get(pk=self.user.pk).password
+                hasher = identify_hasher(encoded)
+                self.assertEqual(hasher.algorithm, "bcrypt_sha256")
+                self.assertEqual(hasher.decode(encoded)['work_factor'], 4)
+                # Only the password column is written
+                updates = [q['sql'] for q in queries.captured_queries
+                           if q['sql'].startswith('UPDATE "users_myuser"')]
+                self.assertEqual(len(updates), 1)
+                self.assertRegex(updates[0], r'^UPDATE "users_myuser" SET "password" = \S+ WHERE')
+
+    def test_current_hashes_are_not_rewritten(self):
+        self.user.set_password(self.password)
+        self.user.save(update_fields=['password'])
+        encoded = self.user.password
+
+        response = APIClient().post(
+            "/api/v1/token/", {"email": self.user.email, "password": self.password},
+            format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(MyUser.objects.get(pk=self.user.pk).password, encoded)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class EndpointBudgetTests(TestCase):
+    """
+    Query and row budgets from ``apps/users/benchmark_budgets.json``; run
+    ``manage.py benchmark_endpoints`` for latency and memory. After an
+    intended change, refresh the file with ``--update-budgets``.
+    """
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(uncovered_routes(), [])
+
+    def test_endpoints_stay_within_budget(self):
+        results = EndpointBenchmark().run(iterations=1, warmup=0)
+        violations = compare_with_budgets(results, load_budgets(), EXACT_METRICS)
+        self.assertEqual(violations, [], "\n".join(violations))
+
+
+@override_settings(AUDIT_RULES=[], AUDIT_DEFAULT_SAMPLE=1.0, AUDIT_BUFFER_SIZE=1)
+class RequestAuditQueryTests(TestCase):
+    def setUp(self):
+        # Drop rows that requests of other tests left in the process-wide buffer
+        get_audit_buffer().rows.clear()
+        self.user = MyUser.objects.create(email="audit@example.com", name="Audit")
+
+    def test_audit_does_not_load_the_session_user(self):
+        client = APIClient()
+        client.force_login(self.user)
+
+        # Only the audit row and its hourly rollup: no session or user lookup.
+        # The write's savepoint pair is there because TestCase opens a transaction.
+        with self.assertNumQueries(4):
+            client.get("/api/v1/no-such-endpoint/")
+
+        self.assertIsNone(RequestAuditLog.objects.get().user_id)
+
+    def test_jwt_user_is_attributed(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        client.get("/api/v1/features/")
+
+        self.assertEqual(RequestAuditLog.objects.get().user_id, self.user.pk)
+
+
+class AsyncMiddlewareTests(TestCase):
+    def test_middleware_runs_natively_under_asgi(self):
+        # Django logs every sync-only middleware it wraps in a thread
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    @override_settings(AUDIT_RULES=[], AUDIT_DEFAULT_SAMPLE=1.0, AUDIT_BUFFER_SIZE=1,
+                       REQUEST_PROFILING_SAMPLE_RATE=1.0)
+    async def test_async_request_is_audited_and_profiled(self):
+        get_audit_buffer().rows.clear()
+        user = await MyUser.objects.acreate(email="async@example.com", name="Async")
+        response = await self.async_client.get(
+            "/api/v1/async/token/validate/",
+            headers={"Authorization": f"Bearer {AccessToken.for_user(user)}"})
+
+        self.assertEqual(response.status_code, 200)
+        # Queries in sync_to_async threads are counted too
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        log = await RequestAuditLog.objects.aget()
+        self.assertEqual(log.user_id, user.pk)
+
+
+def png_upload(width, height):
+    # Noise does not compress, so the WebP variant is the smaller file
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='logo.png')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # Files are deleted right away, however recently they were written
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, MEDIA_GC_GRACE_PERIOD=0))
+        # Run the tasks in process instead of queueing them
+        self.enterContext(mock.patch.object(
+            generate_image_variants, 'delay', side_effect=generate_image_variants))
+        self.enterContext(mock.patch.object(
+            delete_media_files, 'delay', side_effect=delete_media_files))
+
+    def save_logo(self, company, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            company.logo = upload
+            company.save()
+        company.refresh_from_db()
+        return company.image_variants['logo']
+
+    def test_variant_is_rendered_and_served(self):
+        company = Company(name="Acme", subdomain="acme")
+        variant = self.save_logo(company, png_upload(1024, 512))
+
+        self.assertEqual(variant['source'], company.logo.name)
+        self.assertTrue(variant['name'].endswith('.webp'))
+        self.assertEqual((variant['width'], variant['height']), (256, 128))
+        self.assertTrue(default_storage.exists(variant['name']))
+        self.assertEqual(image_url(company, 'logo'), default_storage.url(variant['name']))
+
+    def test_replaced_and_deleted_variants_are_removed(self):
+        company = Company(name="Acme", subdomain="acme")
+        first = self.save_logo(company, png_upload(1024, 512))['name']
+        second = self.save_logo(company, png_upload(600, 600))['name']
+
+        self.assertFalse(default_storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            company.delete()
+        self.assertFalse(default_storage.exists(second))
+
+    def test_equal_uploads_share_one_blob(self):
+        upload = png_upload(512, 512)
+        first, second = Company(name="Acme", subdomain="acme"), Company(name="Beta", subdomain="beta")
+        variant = self.save_logo(first, upload)
+        self.assertEqual(self.save_logo(second, upload), variant)
+        self.assertTrue(first.logo.name.startswith('blobs/'))
+
+        # Still referenced by the second company
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(variant['source']))
+        self.assertTrue(default_storage.exists(variant['name']))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(variant['source']))
+        self.assertFalse(default_storage.exists(variant['name']))
+
+    @override_settings(MEDIA_GC_GRACE_PERIOD=600)
+    def test_blob_saved_again_is_not_collected(self):
+        upload = png_upload(64, 64)
+        name = default_storage.save('logo.png', upload)
+        # Written long ago
+        os.utime(default_storage.path(name), (0, 0))
+
+        self.assertEqual(default_storage.save('logo.png', upload), name)
+        self.assertEqual(delete_files([name]), 0)
+        self.assertTrue(default_storage.exists(name))
+
+        os.utime(default_storage.path(name), (0, 0))
+        self.assertEqual(delete_files([name]), 1)
+        self.assertFalse(default_storage.exists(name))
+
+
+class ThrottledView(APIView):
+    authentication_classes = []
+    permission_classes = []
+    throttle_classes = throttling.AUTH_THROTTLE_CLASSES
+    throttle_scope = 'login'
+
+    def post(self, request):
+        return Response({})
+
+
+@override_settings(THROTTLE_RATES={
+    'login.ip': '2/min', 'login.email': '1/min', 'login.user': '1/min'})
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.clock = 1000.0
+        self.enterContext(mock.patch.object(
+            throttling, '_backend', throttling.LocalTokenBucketBackend()))
+        self.enterContext(mock.patch.object(
+            throttling.time, 'monotonic', side_effect=lambda: self.clock))
+
+    def allow(self, throttle_class, ip='10.0.0.1', email=None, user=None):
+        request = Request(self.factory.post('/', {'email': email} if email else {},
+                                            format='json', REMOTE_ADDR=ip),
+                          parsers=[JSONParser()])
+        request.user = user or mock.Mock(is_authenticated=False)
+        throttle = throttle_class()
+        return throttle.allow_request(request, ThrottledView), throttle.wait()
+
+    def test_ip_bucket(self):
+        throttle = throttling.IPTokenBucketThrottle
+        self.assertTrue(self.allow(throttle)[0])
+        self.assertTrue(self.allow(throttle)[0])
+        self.assertFalse(self.allow(throttle)[0])
+        self.assertTrue(self.allow(throttle, ip='10.0.0.2')[0])
+
+    def test_email_bucket_ignores_case_and_ip(self):
+        throttle = throttling.EmailTokenBucketThrottle
+        self.assertTrue(self.allow(throttle, email='a@example.com')[0])
+        self.assertFalse(self.allow(throttle, ip='10.0.0.2', email=' A@Example.com')[0])
+        self.assertTrue(self.allow(throttle, email='b@example.com')[0])
+        # No email, no bucket
+        self.assertTrue(self.allow(throttle)[0])
+
+    def test_user_bucket(self):
+        throttle = throttling.UserTokenBucketThrottle
+        user = mock.Mock(is_authenticated=True, pk=1)
+        self.assertTrue(self.allow(throttle, user=user)[0])
+        self.assertFalse(self.allow(throttle, user=user)[0])
+        self.assertTrue(self.allow(throttle)[0])
+
+    def test_bucket_refills(self):
+        throttle = throttling.IPTokenBucketThrottle
+        self.allow(throttle)
+        self.allow(throttle)
+        allowed, wait = self.allow(throttle)
+        # Two tokens a minute: the next one after 30 seconds
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30.0)
+        self.clock += 29
+        self.assertFalse(self.allow(throttle)[0])
+        self.clock += 1
+        self.assertTrue(self.allow(throttle)[0])
+
+    def test_throttled_response_has_retry_after(self):
+        view = ThrottledView.as_view()
+        for _ in range(2):
+            self.assertEqual(view(self.factory.post('/', {}, format='json')).status_code, 200)
+        response = view(self.factory.post('/', {}, format='json'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_unreachable_redis_fails_open(self):
+        backend = throttling.RedisTokenBucketBackend('redis://127.0.0.1:1/0')
+        with mock.patch.object(throttling, '_backend', backend), \
+                self.assertLogs('apps.core.utils.throttling', 'WARNING'):
+            self.assertTrue(self.allow(throttling.IPTokenBucketThrottle)[0])
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    THROTTLE_RATES={},
+)
+class UserImportTests(TestCase):
+    password = "Import#12345"
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme", subdomain="acme")
+        self.owner = MyUser.objects.create(
+            email="owner@example.com", name="Owner", company=self.company, is_owner=True)
+        self.branch = Branch.objects.create(company=self.company, name="Main")
+        self.feature = AppFeature.objects.create(name="Sales", tag="sales")
+        other = Company.objects.create(name="Beta", subdomain="beta")
+        self.foreign_branch = Branch.objects.create(company=other, name="Main")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def row(self, email, **extra):
+        return {"email": email, "name": "Imported", "password": self.password, **extra}
+
+    def post(self, rows):
+        return self.client.post('/api/v1/users/import/', {"users": rows}, format='json')
+
+    def test_invalid_rows_are_reported(self):
+        response = self.post([
+            "not a row",
+            {"email": "missing-name@example.com", "password": self.password},
+            self.row("not-an-email"),
+            self.row("birthday@example.com", date_of_birth="31/02/2000"),
+        ])
+        self.assertEqual(response.status_code, 200)
+        report = response.data['results']
+        self.assertEqual((report['created'], report['failed']), (0, 4))
+        self.assertEqual([error['row'] for error in report['errors']], [1, 2, 3, 4])
+        self.assertIn('name', report['errors'][1]['errors'])
+        self.assertIn('email', report['errors'][2]['errors'])
+        self.assertIn('date_of_birth', report['errors'][3]['errors'])
+        self.assertFalse(MyUser.objects.filter(name="Imported").exists())
+
+    def test_duplicate_and_existing_emails_ignore_case(self):
+        response = self.post([
+            self.row("OWNER@example.com"),
+            self.row("new@example.com"),
+            self.row("New@Example.com"),
+        ])
+        self.assertEqual(response.status_code, 201)
+        report = response.data['results']
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual(report['errors'][0]['errors']['email'],
+                         ["A user with this email already exists."])
+        self.assertEqual(report['errors'][1]['errors']['email'],
+                         ["Duplicate email in this import."])
+        self.assertTrue(MyUser.objects.get(email="new@example.com").check_password(self.password))
+
+    def test_branches_and_features_are_assigned(self):
+        response = self.post([
+            self.row("member@example.com", features_branch=[
+                {"branch_id": self.branch.id, "features": [self.feature.id]}]),
+            self.row("foreign@example.com", features_branch=[
+                {"branch_id": self.foreign_branch.id, "features": []}]),
+            self.row("unknown@example.com", features_branch=[
+                {"branch_id": self.branch.id, "features": [0]}]),
+        ])
+        report = response.data['results']
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertIn("not accessible", report['errors'][0]['errors']['features_branch'][0])
+        self.assertIn("Unknown feature", report['errors'][1]['errors']['features_branch'][0])
+
+        member = MyUser.objects.get(email="member@example.com")
+        self.assertEqual(list(member.assigned_branches.all()), [self.branch])
+        grant = UserBranchFeatures.objects.get(user=member)
+        self.assertEqual(grant.branch, self.branch)
+        self.assertEqual(list(grant.features.all()), [self.feature])
+        self.assertTrue(UserBranchLayout.objects.filter(user=member, branch=self.branch).exists())
+
+    @override_settings(USER_IMPORT_SYNC_ROWS=1)
+    def test_large_imports_are_queued(self):
+        rows = [self.row("first@example.com"), self.row("second@example.com"),
+                self.row("OWNER@example.com")]
+        with mock.patch.object(import_user_rows, 'delay') as delay:
+            delay.return_value.id = 'task-1'
+            response = self.post(rows)
+
+        self.assertEqual(response.status_code, 202)
+        report = response.data['results']
+        self.assertEqual((report['task_id'], report['valid'], report['failed']), ('task-1', 2, 1))
+        self.assertFalse(MyUser.objects.filter(name="Imported").exists())
+        # Only the id of the staged rows goes through the broker
+        batch = UserImportBatch.objects.get()
+        delay.assert_called_once_with(batch.id)
+        self.assertEqual((batch.rows, batch.branch_ids), (rows, [self.branch.id]))
+
+        import_user_rows(batch.id)
+        self.assertEqual(MyUser.objects.filter(name="Imported").count(), 2)
+        self.assertFalse(UserImportBatch.objects.exists())
+
+
+class PermissionDiffTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Acme", subdomain="acme")
+        self.user = MyUser.objects.create(email="member@example.com", name="Member",
+                                          company=company)
+        self.b1, self.b2, self.b3 = (Branch.objects.create(company=company, name=name)
+                                     for name in ("One", "Two", "Three"))
+        self.f1, self.f2, self.f3 = (AppFeature.objects.create(name=tag, tag=tag)
+                                     for tag in ("sales", "stock", "hr"))
+        self.apply([{"branch_id": self.b1.id, "features": [self.f1.id, self.f2.id]},
+                    {"branch_id": self.b2.id, "features": [self.f1.id]}])
+
+    def apply(self, items, allowed=None):
+        return apply_user_branch_features(self.user, items, allowed)
+
+    def grants(self):
+        grants = {}
+        for ubf in UserBranchFeatures.objects.filter(user=self.user):
+            grants[ubf.branch_id] = {feature.id for feature in ubf.features.all()}
+        return grants
+
+    def test_branches_and_pairs_are_added(self):
+        before = UserBranchFeatures.objects.get(user=self.user, branch=self.b1).id
+        diff = self.apply([
+            {"branch_id": self.b1.id, "features": [self.f1.id, self.f2.id, self.f3.id]},
+            {"branch_id": self.b2.id, "features": [self.f1.id]},
+            {"branch_id": self.b3.id, "features": [self.f2.id]},
+        ])
+        self.assertEqual(diff["branches_added"], [self.b3.id])
+        self.assertEqual(diff["branches_removed"], [])
+        self.assertEqual(diff["features_added"], [
+            {"branch_id": self.b1.id, "features": [self.f3.id]},
+            {"branch_id": self.b3.id, "features": [self.f2.id]},
+        ])
+        self.assertEqual(diff["features_removed"], [])
+        self.assertEqual(self.grants(), {self.b1.id: {self.f1.id, self.f2.id, self.f3.id},
+                                         self.b2.id: {self.f1.id},
+                                         self.b3.id: {self.f2.id}})
+        # Rows of unchanged branches are updated in place
+        self.assertEqual(UserBranchFeatures.objects.get(user=self.user, branch=self.b1).id,
+                         before)
+
+    def test_branches_and_pairs_are_removed(self):
+        diff = self.apply([{"branch_id": self.b1.id, "features": [self.f2.id]}])
+        self.assertEqual(diff["branches_added"], [])
+        self.assertEqual(diff["branches_removed"], [self.b2.id])
+        self.assertEqual(diff["features_added"], [])
+        self.assertEqual(diff["features_removed"], [
+            {"branch_id": self.b1.id, "features": [self.f1.id]},
+            {"branch_id": self.b2.id, "features": [self.f1.id]},
+        ])
+        self.assertEqual(self.grants(), {self.b1.id: {self.f2.id}})
+
+    def test_unchanged_input_writes_nothing(self):
+        items = [{"branch_id": self.b2.id, "features": [self.f1.id]},
+                 {"branch_id": self.b1.id, "features": [self.f2.id, self.f1.id]}]
+        # Known features, current rows, current links; no writes
+        with self.assertNumQueries(3), self.captureOnCommitCallbacks() as callbacks:
+            diff = self.apply(items)
+        self.assertEqual(diff, {"branches_added": [], "branches_removed": [],
+                                "features_added": [], "features_removed": []})
+        self.assertEqual(callbacks, [])
+
+    def test_unknown_features_and_disallowed_branches_are_skipped(self):
+        diff = self.apply([
+            {"branch_id": self.b1.id, "features": [self.f1.id, self.f2.id, 0]},
+            {"branch_id": self.b2.id, "features": [self.f1.id]},
+            {"branch_id": self.b3.id, "features": [self.f3.id]},
+        ], allowed={self.b1.id, self.b2.id})
+        self.assertEqual(diff["branches_added"], [])
+        self.assertEqual(diff["features_added"], [])
+        self.assertEqual(self.grants(), {self.b1.id: {self.f1.id, self.f2.id},
+                                         self.b2.id: {self.f1.id}})
+
+
+class PermissionCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme", subdomain="acme")
+        self.owner = MyUser.objects.create(
+            email="owner@example.com", name="Owner", company=self.company, is_owner=True)
+        self.member = MyUser.objects.create(
+            email="member@example.com", name="Member", company=self.company)
+        self.branch = Branch.objects.create(company=self.company, name="Main")
+        self.feature = AppFeature.objects.create(name="Sales", tag="sales")
+        self.member.assigned_branches.add(self.branch)
+        self.grant = UserBranchFeatures.objects.create(user=self.member, branch=self.branch)
+        self.client = APIClient()
+
+    def permission_list(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/v1/permission-list/')
+        self.assertEqual(response.status_code, 200)
+        return {branch['branch_name']: [feature['name'] for group in branch['branch_features']
+                                        for feature in group['operations']]
+                for branch in response.data['results']}
+
+    def test_new_branch_and_feature_reach_the_owner(self):
+        self.assertEqual(self.permission_list(self.owner), {"Main": ["Sales"]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Branch.objects.create(company=self.company, name="Second")
+            AppFeature.objects.create(name="Stock", tag="stock", order=1)
+        self.assertEqual(self.permission_list(self.owner),
+                         {"Main": ["Sales", "Stock"], "Second": ["Sales", "Stock"]})
+
+    def test_grants_and_branch_changes_reach_the_member(self):
+        self.assertEqual(self.permission_list(self.member), {"Main": []})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grant.features.add(self.feature)
+        self.assertEqual(self.permission_list(self.member), {"Main": ["Sales"]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch.name = "Renamed"
+            self.branch.save()
+        self.assertEqual(self.permission_list(self.member), {"Renamed": ["Sales"]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.assigned_branches.clear()
+        self.assertEqual(self.permission_list(self.member), {})
+
+    def test_ownership_change_is_seen(self):
+        self.assertEqual(self.permission_list(self.member), {"Main": []})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.is_owner = True
+            self.member.save()
+        self.assertEqual(self.permission_list(self.member), {"Main": ["Sales"]})
+
+
+class BranchAccessTests(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme", subdomain="acme")
+        other = Company.objects.create(name="Beta", subdomain="beta")
+        self.b1, self.b2 = (Branch.objects.create(company=self.company, name=name)
+                            for name in ("Main", "Second"))
+        self.foreign = Branch.objects.create(company=other, name="Main")
+        self.superuser = MyUser.objects.create(
+            email="root@example.com", name="Root", is_superuser=True)
+        self.owner = MyUser.objects.create(
+            email="owner@example.com", name="Owner", company=self.company, is_owner=True)
+        self.member = MyUser.objects.create(
+            email="member@example.com", name="Member", company=self.company)
+        self.member.assigned_branches.add(self.b1)
+        self.all_ids = {self.b1.id, self.b2.id, self.foreign.id}
+        self.expected = {
+            self.superuser: self.all_ids,
+            self.owner: {self.b1.id, self.b2.id},
+            self.member: {self.b1.id},
+        }
+
+    def request(self, user):
+        request = APIRequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_single_check_per_role(self):
+        for user, allowed in self.expected.items():
+            for branch_id in self.all_ids:
+                with self.subTest(user=user.email, branch=branch_id), \
+                        self.assertNumQueries(1):
+                    self.assertEqual(permissions.can_access_branch(user, branch_id),
+                                     branch_id in allowed)
+
+    def test_batch_check_per_role(self):
+        for user, allowed in self.expected.items():
+            with self.subTest(user=user.email), self.assertNumQueries(1):
+                self.assertEqual(
+                    permissions.filter_accessible_branch_ids(user, self.all_ids | {0}),
+                    allowed)
+
+    def test_accessible_ids_are_cached_on_the_user(self):
+        for user, allowed in self.expected.items():
+            with self.subTest(user=user.email):
+                with self.assertNumQueries(1):
+                    self.assertEqual(permissions.accessible_branch_ids(user), allowed)
+                with self.assertNumQueries(0):
+                    self.assertEqual(permissions.accessible_branch_ids(user), allowed)
+                    self.assertEqual(permissions.filter_accessible_branch_ids(
+                        user, [self.b1.id, self.foreign.id]), allowed & {self.b1.id, self.foreign.id})
+
+    def test_check_branch_permission_per_role(self):
+        for user, allowed in self.expected.items():
+            for branch_id in self.all_ids:
+                with self.subTest(user=user.email, branch=branch_id), \
+                        self.assertNumQueries(1):
+                    if branch_id in allowed:
+                        branch = permissions.check_branch_permission(
+                            self.request(user), str(branch_id))
+                        self.assertEqual(branch.id, branch_id)
+                    else:
+                        with self.assertRaises(ValidationError):
+                            permissions.check_branch_permission(self.request(user), branch_id)
+
+    def test_check_branch_permission_rejects_missing_branches(self):
+        with self.assertRaises(ValidationError):
+            permissions.check_branch_permission(self.request(self.member), None)
+        with self.assertRaises(NotFound):
+            permissions.check_branch_permission(self.request(self.member), self.foreign.id + 1)
+        with self.assertRaises(AuthenticationFailed):
+            permissions.check_branch_permission(self.request(AnonymousUser()), self.b1.id)
+
+
+class EffectivePermissionSyncTests(TestCase):
+    """
+    Every change is applied through the ORM with its commit hooks run, then
+    the table must equal what a full rebuild produces.
+    """
+
+    def setUp(self):
+        self.company = Company.objects.create(name="Acme", subdomain="acme")
+        self.owner = MyUser.objects.create(
+            email="owner@example.com", name="Owner", company=self.company, is_owner=True)
+        self.member = MyUser.objects.create(
+            email="member@example.com", name="Member", company=self.company)
+        self.b1, self.b2 = (Branch.objects.create(company=self.company, name=name)
+                            for name in ("One", "Two"))
+        self.paid = AppFeature.objects.create(name="Sales", tag="sales")
+        self.free = AppFeature.objects.create(name="Help", tag="help", feature_type="free")
+        self.camera = AppFeature.objects.create(name="View", tag="camera_view")
+        self.needs_camera = AppFeature.objects.create(
+            name="Watch", tag="watch", required="camera")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b1.features.add(self.paid)
+            self.member.assigned_branches.add(self.b1)
+            self.grant = UserBranchFeatures.objects.create(user=self.member, branch=self.b1)
+            self.grant.features.add(self.paid, self.free, self.camera)
+
+    def permissions(self, user):
+        return set(EffectivePermission.objects.filter(user=user).values_list(
+            'branch_id', 'feature_id'))
+
+    def assertMatchesRebuild(self):
+        table = set(EffectivePermission.objects.values_list('user_id', 'branch_id', 'feature_id'))
+        self.assertEqual(rebuild_effective_permissions(), (0, 0))
+        self.assertEqual(set(EffectivePermission.objects.values_list(
+            'user_id', 'branch_id', 'feature_id')), table)
+
+    def test_initial_grants(self):
+        self.assertEqual(self.permissions(self.member),
+                         {(self.b1.id, self.paid.id), (self.b1.id, self.free.id)})
+        self.assertEqual(self.permissions(self.owner), {(self.b1.id, self.paid.id)})
+        self.assertMatchesRebuild()
+
+    def test_branch_feature_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b1.features.add(self.needs_camera)
+        # A camera dependent feature unlocks the camera_ features
+        self.assertIn((self.b1.id, self.camera.id), self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paid.branches.remove(self.b1)
+        self.assertNotIn((self.b1.id, self.paid.id), self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b1.features.clear()
+        self.assertEqual(self.permissions(self.member), {(self.b1.id, self.free.id)})
+        self.assertMatchesRebuild()
+
+    def test_user_branch_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b2.features.add(self.paid)
+            self.b2.users.add(self.member)
+            grant = UserBranchFeatures.objects.create(user=self.member, branch=self.b2)
+            grant.features.add(self.paid)
+        self.assertIn((self.b2.id, self.paid.id), self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grant.features.remove(self.paid)
+            self.grant.delete()
+        self.assertEqual(self.permissions(self.member), set())
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grant.features.add(self.paid)
+            self.member.assigned_branches.clear()
+        self.assertEqual(self.permissions(self.member), set())
+        self.assertMatchesRebuild()
+
+    def test_ownership_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b2.features.add(self.needs_camera)
+            self.member.is_owner = True
+            self.member.save()
+        self.assertIn((self.b2.id, self.needs_camera.id), self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+        other = Company.objects.create(name="Beta", subdomain="beta")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.owner.company = other
+            self.owner.save()
+        self.assertEqual(self.permissions(self.owner), set())
+        self.assertMatchesRebuild()
+
+    def test_feature_rule_changes_queue_a_rebuild(self):
+        # Run in process instead of queueing
+        delay = self.enterContext(mock.patch.object(
+            rebuild_all_effective_permissions, 'delay',
+            side_effect=rebuild_all_effective_permissions))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.camera.name = "Camera"
+            self.camera.save()
+        delay.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.camera.feature_type = "free"
+            self.camera.save()
+        delay.assert_called_once_with()
+        self.assertIn((self.b1.id, self.camera.id), self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+    def test_bulk_grants_and_revokes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b2.features.add(self.paid, self.needs_camera)
+            self.member.assigned_branches.add(self.b2)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_permissions([self.member.id], [self.b1.id, self.b2.id],
+                                    [self.paid.id, self.needs_camera.id], 'grant')
+        self.assertTrue({(self.b2.id, self.paid.id), (self.b2.id, self.needs_camera.id)}
+                        <= self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_update_permissions([self.member.id], [self.b1.id, self.b2.id],
+                                    [self.paid.id], 'revoke')
+        self.assertFalse({(self.b1.id, self.paid.id), (self.b2.id, self.paid.id)}
+                         & self.permissions(self.member))
+        self.assertMatchesRebuild()
+
+
+class AuditPolicyTests(SimpleTestCase):
+    def test_first_matching_rule_wins(self):
+        policy = AuditPolicy([
+            {"path": r"^/api/v1/reports/", "sample": 0.5},
+            {"routes": ["feature-list"], "sample": 0.2},
+            {"methods": ["GET"], "sample": 0.1},
+            {"path": r"^/api/", "sample": 0},
+        ], default_sample=0.7)
+
+        self.assertEqual(policy.sample_rate('GET', '/api/v1/reports/', 'feature-list'), 0.5)
+        self.assertEqual(policy.sample_rate('GET', '/api/v1/features/', 'feature-list'), 0.2)
+        self.assertEqual(policy.sample_rate('GET', '/api/v1/users/', 'user-list'), 0.1)
+        self.assertEqual(policy.sample_rate('POST', '/api/v1/users/', 'user-list'), 0)
+        self.assertEqual(policy.sample_rate('POST', '/login/', None), 0.7)
+
+    def test_method_rules(self):
+        policy = AuditPolicy([
+            {"path": r"^/static/", "sample": 0},
+            {"methods": ["post", "DELETE"], "sample": 1},
+            {"methods": ["PROPFIND"], "sample": 0.3},
+        ], default_sample=0.5)
+
+        self.assertEqual(policy.sample_rate('POST', '/api/', None), 1)
+        self.assertEqual(policy.sample_rate('DELETE', '/api/', None), 1)
+        self.assertEqual(policy.sample_rate('GET', '/api/', None), 0.5)
+        # A method-only rule does not jump ahead of the earlier path rule
+        self.assertEqual(policy.sample_rate('POST', '/static/app.js', None), 0)
+        self.assertEqual(policy.sample_rate('PROPFIND', '/static/app.js', None), 0)
+        self.assertEqual(policy.sample_rate('PROPFIND', '/dav/', None), 0.3)
+        self.assertEqual(policy.sample_rate('MKCOL', '/dav/', None), 0.5)
+
+    def test_audited_sample(self):
+        policy = AuditPolicy([{"methods": ["GET"], "sample": 0.1},
+                              {"path": r"^/health/", "sample": 0}])
+        self.assertEqual(policy.audited_sample('POST', '/api/', None), 1)
+        self.assertIsNone(policy.audited_sample('PUT', '/health/', None))
+        with mock.patch('apps.core.utils.audit_rules.random.random', return_value=0.05):
+            self.assertEqual(policy.audited_sample('GET', '/api/', None), 0.1)
+        with mock.patch('apps.core.utils.audit_rules.random.random', return_value=0.5):
+            self.assertIsNone(policy.audited_sample('GET', '/api/', None))
+
+    def test_invalid_rules_are_rejected(self):
+        for rules, default in (([{"path": "^/api/", "sample": 1, "method": ["GET"]}], 1),
+                               ([{"path": "^/api/"}], 1),
+                               ([{"path": "(", "sample": 1}], 1),
+                               ([{"methods": ["GET"], "sample": 1.5}], 1),
+                               ([{"methods": ["GET"], "sample": -0.1}], 1),
+                               ([], 2)):
+            with self.subTest(rules=rules, default=default), \
+                    self.assertRaises(ImproperlyConfigured):
+                AuditPolicy(rules, default)
+
+    def test_shipped_rules(self):
+        policy = AuditPolicy.from_settings()
+        for method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+            for path, route in (('/api/v1/users/', 'user-list'),
+                                ('/static/app.js', None),
+                                ('/api/schema/', 'schema')):
+                with self.subTest(method=method, path=path):
+                    self.assertEqual(policy.sample_rate(method, path, route), 1)
+        for path, route in (('/static/app.js', None), ('/api/schema/', 'schema'),
+                            ('/api/schema/swagger-ui/', 'swagger-ui')):
+            with self.subTest(path=path):
+                self.assertEqual(policy.sample_rate('GET', path, route), 0)
+                self.assertIsNone(policy.audited_sample('GET', path, route))
+        for route in ('token_validate_with_user_details',
+                      'token_validate_with_user_details_async'):
+            with self.subTest(route=route):
+                self.assertEqual(policy.sample_rate('GET', '/api/v1/validate/', route), 0.01)
+
+
+class AuditErrorRateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            MyUser.objects.create(email="staff@example.com", name="Staff", is_staff=True))
+
+    def test_limit_must_be_positive(self):
+        for limit in ('-1', '0'):
+            response = self.client.get('/api/v1/audit-logs/error-rates/', {'limit': limit})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'Must be at least 1.')
+        response = self.client.get('/api/v1/audit-logs/error-rates/', {'limit': '1'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(AUDIT_RULES=[{"methods": ["POST"], "sample": 1},
+                                    {"methods": ["GET"], "sample": 0.1}],
+                       AUDIT_BUFFER_SIZE=1)
+    def test_sampled_reads_are_weighted(self):
+        get_audit_buffer().rows.clear()
+        client = APIClient()
+        # Every GET that is audited stands for ten
+        with mock.patch('apps.core.utils.audit_rules.random.random', return_value=0.05):
+            for _ in range(3):
+                client.get('/api/v1/features/')
+        client.post('/api/v1/features/', {}, format='json')
+
+        self.assertEqual(sorted(RequestAuditLog.objects.values_list('method', 'sample_rate')),
+                         [('GET', 0.1)] * 3 + [('POST', 1.0)])
+        rollup = RequestAuditRollup.objects.get(path='/api/v1/features/')
+        self.assertEqual((rollup.requests, rollup.client_errors), (31, 1))
+
+        response = self.client.get('/api/v1/audit-logs/error-rates/')
+        rates = {row['path']: row['error_rate'] for row in response.data['results']}
+        # 1 failed POST in 31 requests, not in the 4 audited ones
+        self.assertEqual(rates['/api/v1/features/'], round(1 / 31, 4))
+
+
+@override_settings(AUDIT_BUFFER_SIZE=3, AUDIT_FLUSH_INTERVAL=2)
+class AuditBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = 100.0
+        self.enterContext(mock.patch.object(
+            audit_ingest.time, 'monotonic', side_effect=lambda: self.clock))
+        self.buffer = AuditBuffer()
+
+    def depth(self):
+        return REGISTRY.get_sample_value('audit_queue_depth')
+
+    def test_full_buffer_is_returned(self):
+        self.assertIsNone(self.buffer.push('a'))
+        self.assertIsNone(self.buffer.push('b'))
+        self.assertEqual(self.depth(), 2)
+        self.assertEqual(self.buffer.push('c'), ['a', 'b', 'c'])
+        self.assertEqual(self.depth(), 0)
+
+    def test_age_counts_from_the_oldest_row(self):
+        # An idle buffer is not old: the first row starts the clock
+        self.clock += 60
+        self.assertIsNone(self.buffer.push('a'))
+        self.clock += 1.5
+        self.assertIsNone(self.buffer.push('b'))
+        self.clock += 0.5
+        self.assertEqual(self.buffer.push('c'), ['a', 'b', 'c'])
+
+    def test_requests_without_a_row_flush_old_rows(self):
+        self.assertIsNone(self.buffer.push())
+        self.buffer.push('a')
+        self.assertIsNone(self.buffer.push())
+        self.clock += 2
+        self.assertEqual(self.buffer.push(), ['a'])
+        self.assertIsNone(self.buffer.push())
+
+
+
+class AuditWriteTests(TestCase):
+    def test_failed_write_leaves_the_outer_transaction_usable(self):
+        row = (None, '127.0.0.1', 'test', '/api/v1/features/', 'POST', 201,
+               timezone.now(), 1.0)
+        with transaction.atomic():
+            with mock.patch.object(audit_ingest, 'add_rollups', side_effect=DatabaseError), \
+                    self.assertLogs('apps.core.utils.audit_ingest', 'ERROR'):
+                AuditBuffer().write([row])
+            # Only the failed batch was rolled back
+            self.assertFalse(RequestAuditLog.objects.exists())
+            self.assertEqual(audit_ingest.insert_audit_rows([row]), 1)
+        self.assertEqual(RequestAuditLog.objects.count(), 1)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=100)
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        self.buffer = slow_queries.LocalQueryBuffer(3)
+        self.enterContext(mock.patch.object(slow_queries, '_buffer', self.buffer))
+
+    def run_query(self, sql, duration_ms):
+        # perf_counter is read before and after the query
+        clock = iter((0, duration_ms / 1000))
+        with mock.patch.object(slow_queries.time, 'perf_counter', side_effect=clock.__next__):
+            slow_queries.record_slow_query(
+                lambda *args: None, sql, None, False, {'connection': connection})
+
+    def test_only_slow_queries_are_kept(self):
+        with self.assertLogs('apps.core.utils.slow_queries', 'WARNING') as logs:
+            self.run_query('SELECT 1', 99)
+            self.run_query('SELECT 2', 100)
+            self.run_query('EXPLAIN SELECT 3', 500)
+        self.assertEqual([entry['sql'] for entry in self.buffer.entries()], ['SELECT 2'])
+        self.assertEqual(len(logs.records), 1)
+
+    def test_entries_keep_placeholders_and_app_frames(self):
+        # Every query takes a second
+        with mock.patch.object(slow_queries.time, 'perf_counter',
+                               side_effect=itertools.count()), \
+                self.assertLogs('apps.core.utils.slow_queries', 'WARNING'):
+            MyUser.objects.filter(email='secret@example.com').exists()
+
+        entry, = self.buffer.entries()
+        self.assertIn('"email" = %s', entry['sql'])
+        self.assertNotIn('secret@example.com', json.dumps(entry))
+        self.assertEqual((entry['database'], entry['duration_ms']), ('default', 1000))
+        self.assertRegex(entry['frames'][0], r'^apps/users/tests\.py:\d+ in '
+                                             r'test_entries_keep_placeholders_and_app_frames$')
+
+    def test_buffer_keeps_the_newest_entries(self):
+        with self.assertLogs('apps.core.utils.slow_queries', 'WARNING'):
+            for n in range(5):
+                self.run_query(f'SELECT {n}', 200)
+        self.assertEqual([entry['sql'] for entry in self.buffer.entries()],
+                         ['SELECT 4', 'SELECT 3', 'SELECT 2'])
+
+    def test_top_offenders_group_by_fingerprint(self):
+        with self.assertLogs('apps.core.utils.slow_queries', 'WARNING'):
+            self.run_query('SELECT * FROM a WHERE id IN (%s, %s)', 200)
+            self.run_query('SELECT * FROM b', 400)
+            self.run_query('SELECT * FROM a WHERE id IN (%s)', 300)
+        self.buffer.set_plan(self.buffer.entries()[2]['id'], 'Seq Scan on a')
+
+        groups = slow_queries.top_offenders(self.buffer.entries())
+        self.assertEqual([(group['count'], group['total_ms'], group['max_ms'], group['plan'])
+                          for group in groups],
+                         [(2, 500.0, 300.0, 'Seq Scan on a'), (1, 400.0, 400.0, None)])
+        self.assertEqual(groups[1]['sql'], 'SELECT * FROM b')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.store = metrics.LocalEventStore()
+        self.enterContext(mock.patch.object(metrics, '_store', self.store))
+        self.staff = MyUser.objects.create(email="staff@example.com", name="Staff", is_staff=True)
+        self.member = MyUser.objects.create(email="member@example.com", name="Member")
+
+    def scrape(self, user=None, **headers):
+        client = Client()
+        if user:
+            client.force_login(user)
+        return client.get('/metrics/', headers=headers)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_token_or_staff_is_required(self):
+        for user, authorization in ((None, None), (None, "Bearer wrong"),
+                                    (None, "Token scrape-secret"), (self.member, None)):
+            with self.subTest(user=user, authorization=authorization):
+                headers = {'Authorization': authorization} if authorization else {}
+                self.assertEqual(self.scrape(user, **headers).status_code, 403)
+
+        response = self.scrape(Authorization="Bearer scrape-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE_LATEST)
+        self.assertEqual(self.scrape(self.staff).status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_empty_token_only_lets_staff_in(self):
+        self.assertEqual(self.scrape(Authorization="Bearer ").status_code, 403)
+        self.assertEqual(self.scrape(self.member, Authorization="Bearer ").status_code, 403)
+        self.assertEqual(self.scrape(self.staff).status_code, 200)
+
+    def test_requests_are_counted_per_url_name(self):
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        labels = {'url_name': 'features_list', 'method': 'GET'}
+        before = (sample('http_requests_total', status='200', **labels),
+                  sample('http_request_duration_seconds_count', **labels),
+                  sample('http_requests_total', url_name='unmatched', method='GET', status='404'))
+        client = APIClient()
+        client.force_authenticate(self.member)
+        self.assertEqual(client.get('/api/v1/features/').status_code, 200)
+        client.get('/no-such-page/')
+
+        after = (sample('http_requests_total', status='200', **labels),
+                 sample('http_request_duration_seconds_count', **labels),
+                 sample('http_requests_total', url_name='unmatched', method='GET', status='404'))
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1, 1])
+
+        body = self.scrape(self.staff).content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",url_name="features_list"}',
+                      body)
+
+    def test_events_are_scraped_from_the_shared_store(self):
+        metrics.record_event('mail_messages', 'otp', 'sent')
+        metrics.record_event('mail_messages', 'otp', 'sent')
+
+        body = self.scrape(self.staff).content.decode()
+        self.assertIn('mail_messages_total{email_type="otp",outcome="sent"} 2.0', body)
+
+
+class TracingTests(TestCase):
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        self.tracer = provider.get_tracer('apps')
+        for module in (tracing, tracingmiddleware):
+            self.enterContext(mock.patch.object(module, 'tracer', self.tracer))
+        self.enterContext(connection.execute_wrapper(tracing.trace_query))
+        for signal, receiver in ((task_prerun, tracing._task_prerun),
+                                 (task_postrun, tracing._task_postrun)):
+            signal.connect(receiver, weak=False)
+            self.addCleanup(signal.disconnect, receiver)
+
+    def spans(self, name):
+        return [span for span in self.exporter.get_finished_spans() if span.name.startswith(name)]
+
+    def assert_children(self, spans, parent):
+        self.assertTrue(spans)
+        for span in spans:
+            self.assertEqual(span.context.trace_id, parent.context.trace_id)
+            self.assertEqual(span.parent.span_id, parent.context.span_id)
+
+    def test_request_span_parents_its_queries(self):
+        # The middleware drops itself unless an exporter is configured
+        with mock.patch.object(tracingmiddleware, 'configure_tracing', return_value=True):
+            client = APIClient()
+            client.force_authenticate(
+                MyUser.objects.create(email="member@example.com", name="Member"))
+            self.assertEqual(client.get('/api/v1/features/').status_code, 200)
+
+        request, = self.spans('GET ')
+        self.assertEqual(request.attributes['http.route'], 'api/v1/features/')
+        queries = self.spans('db.query')
+        self.assert_children(queries, request)
+        self.assertTrue(any('users_appfeature' in span.attributes['db.statement']
+                            for span in queries))
+
+    def test_eager_task_runs_under_the_caller(self):
+        with self.tracer.start_as_current_span('caller') as caller:
+            rebuild_all_effective_permissions.apply()
+
+        task, = self.spans('celery.task')
+        self.assert_children([task], caller)
+        self.assert_children(self.spans('db.query'), task)
+
+    def test_published_task_continues_the_publisher_trace(self):
+        headers = {'id': 'task-1'}
+        with self.tracer.start_as_current_span('caller') as caller:
+            tracing._before_publish(sender=delete_media_files.name, headers=headers)
+            tracing._after_publish(headers=headers)
+
+        # A worker sees the message headers as request attributes
+        delete_media_files.push_request(traceparent=headers['traceparent'], retries=0)
+        self.addCleanup(delete_media_files.pop_request)
+        tracing._task_prerun(task_id='task-1', task=delete_media_files)
+        tracing._task_postrun(task_id='task-1', state='SUCCESS')
+
+        publish, = self.spans('celery.publish')
+        task, = self.spans('celery.task')
+        self.assert_children([publish], caller)
+        self.assert_children([task], publish)
+        self.assertEqual(task.attributes['celery.state'], 'SUCCESS')
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        self.staff = MyUser.objects.create(email="staff@example.com", name="Staff", is_staff=True)
+        RequestAuditLog.objects.bulk_create(
+            RequestAuditLog(path='/api/v1/features/', method='GET', status_code=200)
+            for _ in range(3))
+
+    def get(self, sample_rate=0.0, token="profile-secret", **headers):
+        # The middleware reads its settings once, when the client loads it
+        with self.settings(REQUEST_PROFILING_SAMPLE_RATE=sample_rate,
+                           REQUEST_PROFILING_TOKEN=token,
+                           REQUEST_PROFILING_DIR=self.profile_dir):
+            client = APIClient()
+            client.force_authenticate(self.staff)
+            response = client.get('/api/v1/audit-logs/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sampled_request_reports_server_timing(self):
+        with self.assertLogs('apps.users.middlewares.profilingmiddleware', 'INFO') as logs:
+            response = self.get(sample_rate=1.0)
+
+        parts = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(list(parts), ['db', 'serializer', 'render', 'total'])
+        self.assertRegex(parts['db'], r'^dur=\d+\.\d\d;desc="[1-9]\d* queries"$')
+        for name in ('serializer', 'render', 'total'):
+            self.assertGreater(float(parts[name].removeprefix('dur=')), 0, name)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertIn('"route": "api/v1/audit-logs/"', logs.output[0])
+
+    def test_profile_needs_the_token(self):
+        for token, provided in (("profile-secret", "wrong"), ("profile-secret", ""),
+                                ("", ""), ("", "profile-secret")):
+            with self.subTest(token=token, provided=provided):
+                response = self.get(token=token, **{'X-Profile': provided})
+                self.assertNotIn('Server-Timing', response)
+                self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_valid_token_writes_the_profile(self):
+        with self.assertLogs('apps.users.middlewares.profilingmiddleware', 'INFO'):
+            response = self.get(**{'X-Profile': "profile-secret"})
+
+        self.assertIn('Server-Timing', response)
+        name = response['X-Profile-File']
+        self.assertEqual(os.listdir(self.profile_dir), [name])
+        self.assertRegex(name, r'-GET-api-v1-audit-logs-[0-9a-f]{8}\.prof$')
+        stats = pstats.Stats(os.path.join(self.profile_dir, name))
+        self.assertTrue(stats.total_calls)
@@ -1,3 +1,68 @@
+import datetime
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from django.views.static import serve
+
+from apps.core.utils.content_storage import is_immutable
+from apps.core.utils.metrics import render_metrics
+from apps.core.utils.slow_queries import get_slow_query_buffer, top_offenders
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Open to staff signed in to the admin, or
+    to a scraper sending ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    token_ok = bool(settings.METRICS_TOKEN) and scheme.lower() == 'bearer' \
+        and constant_time_compare(token, settings.METRICS_TOKEN)
+    if not token_ok and not request.user.is_staff:
+        return HttpResponse("Forbidden", status=403, content_type='text/plain')
+
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
+@staff_member_required
+@require_GET
+def slow_queries_view(request):
+    """
+    Buffered slow queries grouped by statement, worst total time first.
+    """
+    error = None
+    try:
+        offenders = top_offenders(get_slow_query_buffer().entries())
+    except Exception as e:
+        offenders, error = [], str(e)
+    for offender in offenders:
+        offender['last_at'] = datetime.datetime.fromtimestamp(
+            offender['last_at'], tz=datetime.timezone.utc).astimezone(timezone.get_current_timezone())
+
+    return render(request, 'admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Slow queries',
+        'offenders': offenders,
+        'error': error,
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+        'buffer_size': settings.SLOW_QUERY_BUFFER_SIZE,
+    })
+
 
-# Create your views here.
+def media_view(request, path, document_root=None):
+    """
+    Media files in DEBUG. Content addressed names are cached for a year; a
+    server publishing MEDIA_ROOT in production should do the same for
+    ``blobs/`` and ``image_variants/``.
+    """
+    response = serve(request, path, document_root=document_root)
+    if is_immutable(path):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
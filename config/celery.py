@@ -2,6 +2,9 @@ import os
 
 from celery import Celery
 
+from apps.core.utils.metrics import connect_celery_signals
+from apps.core.utils.tracing import connect_celery_tracing
+
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', "config.settings.dev")
 
@@ -10,4 +13,7 @@ app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+connect_celery_signals()
+connect_celery_tracing()
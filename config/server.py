@@ -0,0 +1,129 @@
+"""
+Gunicorn configuration for production.
+
+Usage: gunicorn --config python:config.server
+
+GUNICORN_PROFILE picks the worker model:
+    asgi  uvicorn workers serving config.asgi (default)
+    sync  threaded sync workers serving config.wsgi
+
+Every setting can be overridden through the environment variables below;
+the defaults are derived from the CPUs available to the container.
+"""
+
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def available_cpus():
+    # Respect cgroup/affinity limits inside containers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CPUS = available_cpus()
+PROFILE = os.environ.get("GUNICORN_PROFILE", "asgi")
+
+PROFILES = {
+    # Event loop per worker; one per core keeps every core busy while
+    # requests wait on the database, Redis or SMTP.
+    "asgi": {
+        "wsgi_app": "config.asgi:application",
+        "worker_class": "uvicorn_worker.UvicornWorker",
+        "workers": CPUS + 1,
+        "threads": 1,
+    },
+    # Blocking views: a few processes per core, each with a thread pool so a
+    # request waiting on I/O does not hold the whole process.
+    "sync": {
+        "wsgi_app": "config.wsgi:application",
+        "worker_class": "gthread",
+        "workers": CPUS * 2 + 1,
+        "threads": 4,
+    },
+}
+
+if PROFILE not in PROFILES:
+    raise RuntimeError(
+        f"GUNICORN_PROFILE must be one of {', '.join(PROFILES)}, got {PROFILE!r}")
+
+profile = PROFILES[PROFILE]
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+wsgi_app = profile["wsgi_app"]
+worker_class = profile["worker_class"]
+workers = int(os.environ.get("WEB_CONCURRENCY", profile["workers"]))
+threads = int(os.environ.get("GUNICORN_THREADS", profile["threads"]))
+
+# Import Django once in the master so workers share the loaded code pages
+# copy-on-write instead of each importing it again.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Recycle workers to cap slow memory growth; jitter stops them restarting
+# all at once.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get(
+    "GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10))
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Prometheus multiprocess mode: every worker writes its metrics to files in
+# this directory and /metrics/ sums them. Set before the app is imported so
+# prometheus_client picks it up; stale files of a previous run are removed.
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+shutil.rmtree(prometheus_dir, ignore_errors=True)
+os.makedirs(prometheus_dir, exist_ok=True)
+
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+# Startup-time report: how long the master takes to import the application
+# and how long each worker takes from fork until it can serve requests.
+# Gunicorn preloads the app before on_starting, so time from config load.
+_started_at = time.perf_counter()
+
+
+def on_starting(server):
+    logger.info(
+        "Starting profile=%s workers=%s threads=%s cpus=%s preload=%s",
+        PROFILE, workers, threads, CPUS, preload_app)
+
+
+def when_ready(server):
+    logger.info(
+        "Master ready in %.1f ms (application import%s included)",
+        (time.perf_counter() - _started_at) * 1000,
+        "" if preload_app else " not")
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    logger.info(
+        "Worker %s ready in %.1f ms after fork",
+        worker.pid, (time.perf_counter() - worker.forked_at) * 1000)
+
+
+def worker_abort(worker):
+    logger.warning("Worker %s aborted after exceeding timeout=%ss",
+                   worker.pid, timeout)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges; its counters stay summed
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -2,6 +2,7 @@ from datetime import timedelta
 from pathlib import Path
 
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 # Initialize environment variables
 env = environ.Env()
@@ -62,7 +63,10 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 # Middleware
 MIDDLEWARE = [
+    "apps.users.middlewares.MetricsMiddleware",
+    "apps.users.middlewares.TracingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "apps.users.middlewares.RequestProfilingMiddleware",
 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -122,11 +126,29 @@ AUTH_USER_MODEL = "users.MyUser"
 # ]
 
 
+# Password hashing policy: the chosen hasher goes first and is used for new
+# hashes; the rest only verify. Hashes made with another hasher or with
+# different cost settings are upgraded transparently on successful login.
+PASSWORD_HASH_POLICY = env("DJANGO_PASSWORD_HASH_POLICY", default="bcrypt")
+BCRYPT_ROUNDS = env.int("DJANGO_BCRYPT_ROUNDS", default=12)
+ARGON2_TIME_COST = env.int("DJANGO_ARGON2_TIME_COST", default=2)
+ARGON2_MEMORY_COST = env.int("DJANGO_ARGON2_MEMORY_COST", default=102400)
+ARGON2_PARALLELISM = env.int("DJANGO_ARGON2_PARALLELISM", default=8)
+
+PASSWORD_HASH_POLICIES = {
+    "bcrypt": "apps.core.hashers.TunableBCryptSHA256PasswordHasher",
+    "argon2": "apps.core.hashers.TunableArgon2PasswordHasher",
+}
+if PASSWORD_HASH_POLICY not in PASSWORD_HASH_POLICIES:
+    raise ImproperlyConfigured(
+        f"DJANGO_PASSWORD_HASH_POLICY must be one of {list(PASSWORD_HASH_POLICIES)}")
+
 PASSWORD_HASHERS = [
-    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    PASSWORD_HASH_POLICIES[PASSWORD_HASH_POLICY],
+    *[hasher for policy, hasher in PASSWORD_HASH_POLICIES.items()
+      if policy != PASSWORD_HASH_POLICY],
     "django.contrib.auth.hashers.PBKDF2PasswordHasher",
     "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
-    "django.contrib.auth.hashers.Argon2PasswordHasher",
     "django.contrib.auth.hashers.ScryptPasswordHasher",
 ]
 
@@ -179,10 +201,115 @@ STATICFILES_FINDERS = [
 
 MEDIA_ROOT = str(BASE_DIR / "media")
 MEDIA_URL = "/media/"
+# Uploads are stored once per content, see apps/core/utils/content_storage.py
+STORAGES = {
+    "default": {
+        "BACKEND": "apps.core.utils.content_storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+# File names per delete_media_files task when deleted rows free their media
+MEDIA_GC_BATCH_SIZE = env.int("DJANGO_MEDIA_GC_BATCH_SIZE", default=100)
+# Files modified more recently are not deleted; longer than any transaction
+# that may save an upload
+MEDIA_GC_GRACE_PERIOD = env.int("DJANGO_MEDIA_GC_GRACE_PERIOD", default=600)
+# Longest side in pixels of the WebP variant served in place of each
+# uploaded image, see apps/core/utils/image_variants.py
+IMAGE_VARIANTS = {
+    "users.Company.logo": 256,
+    "users.Company.fav_icon": 64,
+    "users.MyUserDetails.profile_picture": 256,
+    "users.MyUserDetails.user_signature": 800,
+    "users.AppFeature.icon": 128,
+}
+IMAGE_VARIANT_QUALITY = env.int("DJANGO_IMAGE_VARIANT_QUALITY", default=80)
 
 # Redis settings
 REDIS_URL = env("DJANGO_REDIS_URL")
 
+# Cache shared by all workers, so invalidating cached permissions in one
+# worker is seen by the others
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_URL,
+    },
+}
+PERMISSION_CACHE_TIMEOUT = env.int("DJANGO_PERMISSION_CACHE_TIMEOUT", default=300)
+
+# Throttling settings
+# "redis" shares buckets across workers, "local" keeps them in-process (tests)
+THROTTLE_BACKEND = env("DJANGO_THROTTLE_BACKEND", default="redis")
+THROTTLE_RATES = {
+    "login.ip": "20/min",
+    "login.email": "5/min",
+    "otp_verify.ip": "20/min",
+    "otp_verify.email": "5/min",
+    "otp_resend.ip": "10/hour",
+    "otp_resend.email": "3/hour",
+    "forgot_password.ip": "10/hour",
+    "forgot_password.email": "3/hour",
+}
+
+# Request profiling
+# Share of requests that get Server-Timing headers and a request_profile log line
+REQUEST_PROFILING_SAMPLE_RATE = env.float("DJANGO_REQUEST_PROFILING_SAMPLE_RATE", default=0.01)
+# Admins send it as X-Profile to capture a full profile; empty disables profiles
+REQUEST_PROFILING_TOKEN = env("DJANGO_REQUEST_PROFILING_TOKEN", default="")
+REQUEST_PROFILING_DIR = env("DJANGO_REQUEST_PROFILING_DIR", default="/tmp/request-profiles")
+
+# Request audit log: first matching rule sets the audited share (see apps/core/utils/audit_rules.py)
+# Share of GET requests audited; rollups under-count reads by this rate
+AUDIT_READ_SAMPLE = env.float("DJANGO_AUDIT_READ_SAMPLE", default=0.1)
+AUDIT_RULES = [
+    # Writes are always audited
+    {"methods": ["POST", "PUT", "PATCH", "DELETE"], "sample": 1},
+    {"path": r"^/(static|media)/", "sample": 0},
+    {"path": r"^/api/schema/", "sample": 0},
+    {"path": r"^/(metrics|health)/", "sample": 0},
+    {"path": r"^/__debug__/", "sample": 0},
+    # Polled by the frontend on every page
+    {"routes": ["token_validate_with_user_details",
+                "token_validate_with_user_details_async"], "sample": 0.01},
+    {"methods": ["HEAD", "OPTIONS"], "sample": 0},
+    {"methods": ["GET"], "sample": AUDIT_READ_SAMPLE},
+]
+# Share of requests matching no rule that is audited
+AUDIT_DEFAULT_SAMPLE = env.float("DJANGO_AUDIT_DEFAULT_SAMPLE", default=1.0)
+# Audit rows are buffered per process and written with COPY (PostgreSQL) once
+# this many are waiting or the oldest is this many seconds old; 1 writes each row
+AUDIT_BUFFER_SIZE = env.int("DJANGO_AUDIT_BUFFER_SIZE", default=500)
+AUDIT_FLUSH_INTERVAL = env.float("DJANGO_AUDIT_FLUSH_INTERVAL", default=2.0)
+
+# Prometheus metrics, served at /metrics/
+# Scrapers authenticate with "Authorization: Bearer <token>"; empty allows staff only
+METRICS_TOKEN = env("DJANGO_METRICS_TOKEN", default="")
+# "redis" sums mail and task counters across hosts, "local" keeps them in-process (tests)
+METRICS_BACKEND = env("DJANGO_METRICS_BACKEND", default="redis")
+# Broker queues reported as queue_depth
+METRICS_QUEUES = env.list("DJANGO_METRICS_QUEUES", default=["celery"])
+
+# OpenTelemetry tracing
+# "otlp" sends spans to TRACING_ENDPOINT, "file" appends JSON lines to TRACING_FILE; empty disables
+TRACING_EXPORTER = env("DJANGO_TRACING_EXPORTER", default="")
+TRACING_ENDPOINT = env("DJANGO_TRACING_ENDPOINT", default="http://localhost:4318/v1/traces")
+TRACING_FILE = env("DJANGO_TRACING_FILE", default="/tmp/traces/spans.jsonl")
+TRACING_SERVICE_NAME = env("DJANGO_TRACING_SERVICE_NAME", default="backend")
+# Share of new traces kept; traces started upstream follow the caller's decision
+TRACING_SAMPLE_RATE = env.float("DJANGO_TRACING_SAMPLE_RATE", default=1.0)
+
+# Slow-query log, browsed at /admin/slow-queries/
+# Queries slower than this are logged and buffered; 0 disables the recorder
+SLOW_QUERY_THRESHOLD_MS = env.float("DJANGO_SLOW_QUERY_THRESHOLD_MS", default=500)
+# "redis" shares the buffer between processes, "local" keeps it in-process (tests)
+SLOW_QUERY_BACKEND = env("DJANGO_SLOW_QUERY_BACKEND", default="redis")
+SLOW_QUERY_BUFFER_SIZE = env.int("DJANGO_SLOW_QUERY_BUFFER_SIZE", default=500)
+# Share of slow SELECTs explained with EXPLAIN (ANALYZE, BUFFERS) by a Celery task
+SLOW_QUERY_EXPLAIN_RATE = env.float("DJANGO_SLOW_QUERY_EXPLAIN_RATE", default=0.1)
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = env.int("DJANGO_SLOW_QUERY_EXPLAIN_TIMEOUT_MS", default=30000)
+
 # Celery settings
 if USE_TZ:
     CELERY_TIMEZONE = TIME_ZONE
@@ -237,3 +364,9 @@ DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL")
 
 
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000
+
+# Bulk user import
+USER_IMPORT_MAX_ROWS = env.int("DJANGO_USER_IMPORT_MAX_ROWS", default=5000)
+# Imports with more valid rows are written by a Celery task: hashing their
+# passwords takes longer than a request may run
+USER_IMPORT_SYNC_ROWS = env.int("DJANGO_USER_IMPORT_SYNC_ROWS", default=20)
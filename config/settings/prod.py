@@ -48,6 +48,12 @@ LOGGING = {
             "handlers": ["console"],
             "propagate": False,
         },
+        # Slow queries still reach the log while django.db.backends is quiet
+        "apps.core.utils.slow_queries": {
+            "level": "WARNING",
+            "handlers": ["console"],
+            "propagate": False,
+        },
         # Errors logged by the SDK itself
         "sentry_sdk": {"level": "ERROR", "handlers": ["console"], "propagate": False},
         "django.security.DisallowedHost": {
@@ -2,8 +2,8 @@ from django.urls import path, include
 from django.contrib import admin
 from django.conf import settings
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+from apps.users.views import media_view, metrics_view, slow_queries_view
 from django.conf.urls.static import static
-from debug_toolbar.toolbar import debug_toolbar_urls
 
 apidoc = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -14,7 +14,9 @@ apidoc = [
 ]
 
 urlpatterns = [
+    path("admin/slow-queries/", slow_queries_view, name="slow_queries"),
     path("admin/", admin.site.urls),
+    path("metrics/", metrics_view, name="metrics"),
     path(f'api/{settings.API_VERSION}/', include('apps.users.api.v1.urls')),
 ] + apidoc
 
@@ -23,7 +25,7 @@ if settings.DEBUG:
     urlpatterns += debug_toolbar_urls()
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
+    urlpatterns += static(settings.MEDIA_URL, view=media_view,
                           document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL,
                           document_root=settings.STATIC_ROOT)